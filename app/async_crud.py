@@ -0,0 +1,187 @@
+import json
+from enum import Enum
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Tuple
+import models
+import schemas
+from core.config import settings
+from crud import (
+    ExplainJSON,
+    explain_rows,
+    list_tasks_stmt,
+    list_tasks_page,
+    create_task_stmt,
+    task_values,
+    create_tasks_bulk_stmt,
+    copy_tasks_sql,
+    notify_task_scheduled_stmt,
+    notify_tasks_refresh_stmt,
+    _bulk_rows,
+    _bulk_results,
+    claim_due_tasks_stmt,
+    bulk_update_task_status_stmt,
+    task_outcome_update_stmt,
+    mark_task_dispatched_stmt,
+    cancel_recurring_occurrences_stmt
+)
+from services.recurrence import next_occurrence
+
+# Versiones asíncronas (AsyncSession + asyncpg) de las operaciones de crud.py
+
+async def create_task(db: AsyncSession, task: schemas.TaskCreate, notify: bool = False):
+    """Guarda una nueva tarea (ver crud.create_task_idempotent) y la devuelve."""
+    db_task, _ = await create_task_idempotent(db, task, notify)
+    return db_task
+
+async def create_task_idempotent(db: AsyncSession, task: schemas.TaskCreate, notify: bool = False):
+    """Igual que crud.create_task_idempotent, sobre una sesión asíncrona."""
+    db_task, inserted = (await db.execute(create_task_stmt(task_values(task)))).one()
+    if notify and inserted:
+        await db.execute(notify_task_scheduled_stmt(db_task.id, db_task.scheduled_at))
+    db.expunge(db_task)
+    await db.commit()
+    return db_task, inserted
+
+async def get_task(db: AsyncSession, task_id: int):
+    return await db.get(models.Task, task_id)
+
+async def list_tasks(
+    db: AsyncSession,
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+    descending: bool = False,
+    estimate: bool = False,
+    **filters
+):
+    """
+    Una página (hasta limit + 1 filas, ver crud.list_tasks_page) y, si
+    estimate es True, el total estimado por el planificador: un EXPLAIN no
+    recorre la tabla, a diferencia de un COUNT(*).
+    """
+    stmt = list_tasks_stmt(**filters)
+    rows = (await db.execute(list_tasks_page(stmt, limit, after, descending))).all()
+    estimated_total = explain_rows((await db.execute(ExplainJSON(stmt))).scalar()) if estimate else None
+    return rows, estimated_total
+
+async def create_recurring_task(db: AsyncSession, definition: schemas.RecurringTaskCreate):
+    """
+    Guarda la definición con su primera ocurrencia en next_run_at; el worker
+    la materializará como Task (worker/recurring.py).
+    """
+    now = datetime.now(timezone.utc)
+    values = definition.model_dump()
+    for field in ("starts_at", "ends_at"):
+        # Igual que scheduled_at en las tareas: sin zona horaria se entiende UTC
+        if values[field] is not None and values[field].tzinfo is None:
+            values[field] = values[field].replace(tzinfo=timezone.utc)
+    values["starts_at"] = values["starts_at"] or now
+    values["next_run_at"] = next_occurrence(
+        values["cron"], values["rrule"], values["timezone"],
+        max(now, values["starts_at"]) - timedelta(microseconds=1),
+        values["starts_at"], values["ends_at"]
+    )
+    values["active"] = values["next_run_at"] is not None
+    db_definition = models.RecurringTask(**values)
+    db.add(db_definition)
+    await db.commit()
+    await db.refresh(db_definition)
+    return db_definition
+
+async def get_recurring_task(db: AsyncSession, recurring_id: int):
+    return await db.get(models.RecurringTask, recurring_id)
+
+async def list_recurring_tasks(db: AsyncSession, skip: int = 0, limit: int = 100, active: Optional[bool] = None):
+    stmt = select(models.RecurringTask).order_by(models.RecurringTask.id).offset(skip).limit(limit)
+    if active is not None:
+        stmt = stmt.where(models.RecurringTask.active.is_(active))
+    return (await db.scalars(stmt)).all()
+
+async def delete_recurring_task(db: AsyncSession, recurring_id: int) -> bool:
+    """
+    Borra la definición y las ocurrencias materializadas que siguen pending;
+    las ya enviadas (o en curso) se conservan.
+    """
+    db_definition = await db.get(models.RecurringTask, recurring_id, with_for_update=True)
+    if db_definition is None:
+        return False
+    await db.execute(cancel_recurring_occurrences_stmt(recurring_id))
+    await db.delete(db_definition)
+    await db.commit()
+    return True
+
+async def copy_insert_tasks(db: AsyncSession, rows: List[Dict]):
+    """
+    Igual que crud.copy_insert_tasks, con copy_records_to_table de asyncpg
+    (COPY en formato binario, sin pasar por CSV).
+    """
+    columns = list(rows[0].keys())
+    create_temp, insert_select = copy_tasks_sql(columns)
+    records = [
+        [ord_] + [_copy_record_value(value) for value in row.values()]
+        for ord_, row in enumerate(rows)
+    ]
+    # El CREATE pasa por la sesión para que abra la transacción; si no, la
+    # tabla temporal (ON COMMIT DROP) desaparecería al instante
+    await db.execute(text(create_temp))
+    driver_connection = (await (await db.connection()).get_raw_connection()).driver_connection
+    await driver_connection.copy_records_to_table("tasks_incoming", records=records, columns=["ord"] + columns)
+    return [tuple(record) for record in await driver_connection.fetch(insert_select)]
+
+def _copy_record_value(value):
+    if isinstance(value, Enum):
+        # SQLAlchemy guarda los Enum por nombre
+        return value.name
+    if isinstance(value, (dict, list)):
+        # asyncpg espera el JSON ya serializado
+        return json.dumps(value)
+    return value
+
+async def create_tasks_bulk(db: AsyncSession, tasks: List[schemas.TaskCreate], notify: bool = False) -> List[Tuple[int, bool]]:
+    """Igual que crud.create_tasks_bulk, sobre una sesión asíncrona."""
+    rows, duplicate_of = _bulk_rows(tasks)
+    if not rows:
+        return []
+    if len(rows) >= settings.BULK_COPY_THRESHOLD:
+        returned = await copy_insert_tasks(db, rows)
+    else:
+        returned = [tuple(row) for row in await db.execute(create_tasks_bulk_stmt(), rows)]
+    results = _bulk_results(tasks, duplicate_of, returned)
+    if notify and any(inserted for _, inserted in results):
+        await db.execute(notify_tasks_refresh_stmt())
+    await db.commit()
+    return results
+
+async def claim_due_tasks(
+    db: AsyncSession,
+    worker_id: str,
+    limit: int = 100,
+    task_ids: Optional[List[int]] = None
+):
+    """Igual que crud.claim_due_tasks, sobre una sesión asíncrona."""
+    stmt = claim_due_tasks_stmt(worker_id, limit, task_ids)
+    tasks = (await db.scalars(select(models.Task).from_statement(stmt).execution_options(populate_existing=True))).all()
+    db.expunge_all()
+    await db.commit()
+    return sorted(tasks, key=lambda t: (t.scheduled_at, t.id))
+
+async def bulk_update_task_status(
+    db: AsyncSession,
+    worker_id: str,
+    updates: Dict[schemas.TaskStatus, List[int]],
+    outcomes: Optional[List[Dict]] = None
+):
+    """Igual que crud.bulk_update_task_status, sobre una sesión asíncrona."""
+    for status, task_ids in updates.items():
+        if task_ids:
+            await db.execute(bulk_update_task_status_stmt(worker_id, status, task_ids))
+    if outcomes:
+        await db.execute(task_outcome_update_stmt(worker_id), outcomes)
+    await db.commit()
+
+async def mark_task_dispatched(db: AsyncSession, worker_id: str, task_id: int) -> bool:
+    """Igual que crud.mark_task_dispatched, sobre una sesión asíncrona."""
+    result = await db.execute(mark_task_dispatched_stmt(worker_id, task_id))
+    await db.commit()
+    return result.rowcount == 1
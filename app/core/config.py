@@ -1,7 +1,33 @@
+import os
+import socket
+import uuid
+from typing import Dict, List, Optional
+
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Pool de conexiones, por proceso y por engine (síncrono y asyncpg)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    # Las conexiones más antiguas que esto se reabren al sacarlas del pool
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # Comprueba la conexión antes de usarla (descarta las cortadas por la red o un failover)
+    DB_POOL_PRE_PING: bool = True
+    # statement_timeout de Postgres en milisegundos; 0 lo desactiva
+    DB_STATEMENT_TIMEOUT_MS: int = 0
+    # Modo compatible con PgBouncer en pool_mode=transaction: sin prepared
+    # statements con nombre fijo en asyncpg y statement_timeout con SET LOCAL
+    # en cada transacción. LISTEN/NOTIFY y las migraciones necesitan una
+    # conexión directa a Postgres: DATABASE_LISTEN_URL (si no se indica, se
+    # usa DATABASE_URL)
+    DB_PGBOUNCER: bool = False
+    DATABASE_LISTEN_URL: Optional[str] = None
+    # lock_timeout de las migraciones (alembic upgrade): un ALTER TABLE que no
+    # consigue el lock falla en lugar de bloquear los INSERT que esperan detrás
+    MIGRATION_LOCK_TIMEOUT_MS: int = 5000
     TWILIO_ACCOUNT_SID: str
     TWILIO_AUTH_TOKEN: str
     TWILIO_PHONE_NUMBER: str
@@ -20,6 +46,142 @@ class Settings(BaseSettings):
 
     # Configuración de Google
     GOOGLE_CREDENTIALS_JSON: str  # Ruta al archivo JSON de credenciales de Google
+    # El token de la cuenta de servicio (válido 1 h) se renueva cuando le
+    # queda menos que esto
+    GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS: int = 300
+
+    # URLs base de los proveedores. Se cambian para apuntar al simulador
+    # local (benchmarks/simulator.py); MICROSOFT_LOGIN_URL debe ser https
+    # porque MSAL no admite otra cosa
+    TWILIO_API_BASE_URL: str = "https://api.twilio.com"
+    MICROSOFT_LOGIN_URL: str = "https://login.microsoftonline.com"
+    MICROSOFT_GRAPH_URL: str = "https://graph.microsoft.com/v1.0"
+    # Sin valor se usan los de la discovery de Google y el token_uri del JSON
+    GOOGLE_CALENDAR_API_URL: Optional[str] = None
+    GOOGLE_TOKEN_URL: Optional[str] = None
+
+    # Configuración del Worker
+    # Identificador del proceso; se guarda en tasks.claimed_by al reclamar
+    # tareas. Debe cambiar en cada arranque: un worker reiniciado con el mismo
+    # id (en Docker el hostname se conserva y el pid es 1) renovaría los
+    # leases de las tareas que dejó a medias y el reaper nunca las recuperaría
+    WORKER_ID: str = Field(default_factory=lambda: f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    WORKER_BATCH_SIZE: int = 100  # Máximo de tareas reclamadas por ciclo
+    # "poll": consulta la BBDD cada WORKER_POLL_INTERVAL_SECONDS
+    # "timer": mantiene en memoria las próximas tareas y despierta con LISTEN/NOTIFY
+    WORKER_MODE: str = "poll"
+    WORKER_POLL_INTERVAL_SECONDS: int = 60
+    # Envíos simultáneos por canal (TaskType); se puede sobreescribir con JSON
+    WORKER_CHANNEL_CONCURRENCY: Dict[str, int] = {
+        "sms": 20,
+        "call": 10,
+        "whatsapp": 20,
+        "email": 10,
+        "calendar_event": 5,
+        "outlook_event": 5,
+    }
+    # Leases de las tareas reclamadas: el worker los renueva cada
+    # WORKER_HEARTBEAT_SECONDS y el reaper recupera cada
+    # REAPER_INTERVAL_SECONDS las tareas cuyo lease venció
+    WORKER_LEASE_SECONDS: int = 300
+    WORKER_HEARTBEAT_SECONDS: int = 60
+    REAPER_INTERVAL_SECONDS: int = 60
+    # Canales que nunca se reenvían si el worker cayó después de iniciar la
+    # petición al proveedor (se marcan como failed en lugar de reintentarse)
+    AT_MOST_ONCE_TASK_TYPES: List[str] = ["call", "sms", "whatsapp"]
+    # Reintentos: backoff exponencial con jitter entre intentos
+    RETRY_BACKOFF_BASE_SECONDS: float = 30.0
+    RETRY_BACKOFF_MAX_SECONDS: float = 3600.0
+    # Límite de peticiones por proveedor (token bucket): rate = peticiones por
+    # segundo, burst = capacidad del bucket. Se puede sobreescribir con JSON.
+    RATE_LIMITS: Dict[str, Dict[str, float]] = {
+        "twilio_sms": {"rate": 10, "burst": 20},
+        "twilio_voice": {"rate": 1, "burst": 5},
+        "evolution_api": {"rate": 5, "burst": 10},
+        "microsoft_graph": {"rate": 10, "burst": 20},
+        "google_calendar": {"rate": 10, "burst": 20},
+    }
+    # "local": un bucket por proceso; "database": buckets compartidos entre
+    # réplicas a través de la tabla provider_rate_limits
+    RATE_LIMIT_BACKEND: str = "local"
+    # Espera máxima por un token antes de diferir la tarea
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 30.0
+    # Pausa aplicada tras un 429 sin cabecera Retry-After
+    RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS: float = 30.0
+    # Circuit breaker por proveedor: se abre si en la ventana hay al menos
+    # MIN_CALLS peticiones y la proporción de fallos llega a FAILURE_RATE, y
+    # permanece abierto OPEN_SECONDS antes de probar de nuevo
+    CIRCUIT_BREAKER_WINDOW_SECONDS: float = 60.0
+    CIRCUIT_BREAKER_MIN_CALLS: int = 10
+    CIRCUIT_BREAKER_FAILURE_RATE: float = 0.5
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = 30.0
+    # Puerto del servidor de estado del worker (/circuits, /pool, /metrics); 0 lo desactiva
+    WORKER_STATUS_PORT: int = 9000
+    # Los cambios de estado (done/failed) se escriben en lote al llegar a
+    # STATUS_FLUSH_BATCH_SIZE resultados o tras STATUS_FLUSH_INTERVAL_SECONDS
+    STATUS_FLUSH_BATCH_SIZE: int = 200
+    STATUS_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # Tamaño máximo de página de GET /tasks/
+    TASKS_PAGE_MAX_SIZE: int = 500
+    # Máximo de tareas por petición a POST /tasks/bulk
+    BULK_MAX_TASKS: int = 10000
+    # A partir de este tamaño el alta masiva usa COPY en lugar de INSERT multi-fila
+    BULK_COPY_THRESHOLD: int = 1000
+    # POST /tasks/stream: tareas por bloque (una transacción cada uno) y
+    # tamaño máximo de una línea NDJSON
+    NDJSON_CHUNK_SIZE: int = 5000
+    NDJSON_MAX_LINE_BYTES: int = 1048576
+    # Los resultados de /tasks/stream por encima de este tamaño se vuelcan a disco
+    NDJSON_RESULTS_MEMORY_BYTES: int = 8388608
+    # Worker asyncio (python -m worker.async_scheduler): cliente HTTP compartido
+    ASYNC_HTTP_TIMEOUT_SECONDS: float = 30.0
+    ASYNC_HTTP_MAX_CONNECTIONS: int = 200
+
+    # Modo "timer": ventana de tareas precargadas y frecuencia de recarga
+    SCHEDULER_LOOKAHEAD_SECONDS: int = 300
+    SCHEDULER_REFRESH_SECONDS: int = 30
+    SCHEDULER_PREFETCH_LIMIT: int = 5000
+    SCHEDULER_NOTIFY_CHANNEL: str = "tasks_scheduled"
+
+    # Archivador (python -m worker.archiver): mueve a tasks_archive las tareas
+    # done/failed que llevan ARCHIVE_AFTER_DAYS sin cambios, en lotes de
+    # ARCHIVE_BATCH_SIZE, cada ARCHIVE_INTERVAL_SECONDS
+    ARCHIVE_AFTER_DAYS: int = 30
+    ARCHIVE_BATCH_SIZE: int = 5000
+    ARCHIVE_INTERVAL_SECONDS: int = 3600
+    # Particiones mensuales de tasks_archive que se conservan; las anteriores
+    # se exportan a ARCHIVE_EXPORT_DIR (CSV con gzip, si está definido) y se
+    # borran. 0 las conserva todas.
+    ARCHIVE_RETENTION_MONTHS: int = 0
+    ARCHIVE_EXPORT_DIR: Optional[str] = None
+
+    # Tareas recurrentes: cada RECURRING_INTERVAL_SECONDS el worker crea como
+    # Task las ocurrencias de los próximos RECURRING_LOOKAHEAD_SECONDS, de
+    # RECURRING_BATCH_SIZE definiciones por transacción y como mucho
+    # RECURRING_MAX_OCCURRENCES por definición en cada pasada
+    RECURRING_INTERVAL_SECONDS: int = 60
+    RECURRING_LOOKAHEAD_SECONDS: int = 3600
+    RECURRING_BATCH_SIZE: int = 500
+    RECURRING_MAX_OCCURRENCES: int = 100
+    # Ocurrencias perdidas (p. ej. con el worker parado) más antiguas que
+    # esto se saltan en lugar de enviarse tarde
+    RECURRING_MISFIRE_GRACE_SECONDS: int = 3600
+
+    # Logs (core/log.py): nivel, formato ("json" o "text") y tamaño de la cola
+    # del QueueHandler (si se llena, se descartan registros)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10000
+    # Líneas de cada tarea (por debajo de WARNING): nivel mínimo y fracción de
+    # tareas que las registran
+    LOG_TASK_LEVEL: str = "INFO"
+    LOG_TASK_SAMPLE_RATE: float = 1.0
+
+    # Trazas OpenTelemetry (core/tracing.py): "none", "file" (JSON por línea
+    # en TRACING_FILE_PATH) u "otlp" (OTLP/HTTP a TRACING_OTLP_ENDPOINT)
+    TRACING_EXPORTER: str = "none"
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
 
     class Config:
         env_file = ".env"
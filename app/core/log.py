@@ -0,0 +1,142 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from core.config import settings
+
+# Logs estructurados (una línea JSON por registro) para la API y los workers.
+#
+# Los módulos usan logging.getLogger(__name__). setup_logging() pone en el
+# logger raíz un QueueHandler que solo encola el registro: el formateo y la
+# escritura en stdout los hace el hilo de un QueueListener, fuera de los
+# hilos que envían tareas y del event loop. Si la cola (LOG_QUEUE_SIZE) se
+# llena, los registros se descartan en lugar de bloquear el envío y se
+# cuentan en reminder_log_records_dropped_total.
+#
+# Dentro de task_context(task) cada registro lleva task_id, task_type y
+# attempt. Con mucho volumen, las líneas por tarea por debajo de WARNING se
+# filtran con LOG_TASK_LEVEL y se muestrean con LOG_TASK_SAMPLE_RATE: la
+# decisión depende del task_id, así que una tarea muestreada conserva todas
+# sus líneas.
+
+_task_context: ContextVar[dict] = ContextVar("task_context", default={})
+
+# Atributos propios de LogRecord; el resto (extra=...) se añade al JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+@contextmanager
+def task_context(task):
+    """Añade los datos de la tarea a los registros emitidos dentro del bloque."""
+    token = _task_context.set({"task_id": task.id, "task_type": task.task_type.value, "attempt": task.attempts})
+    try:
+        yield
+    finally:
+        _task_context.reset(token)
+
+
+def _sampled(task_id: int, rate: float) -> bool:
+    if rate >= 1:
+        return True
+    # Hash multiplicativo: reparte ids consecutivos de forma uniforme
+    return (task_id * 2654435761) % 2**32 < rate * 2**32
+
+
+class JsonFormatter(logging.Formatter):
+
+    def __init__(self, static_fields: dict):
+        super().__init__()
+        self.static_fields = static_fields
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **self.static_fields,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _TaskContextFilter(logging.Filter):
+    """Añade el contexto de la tarea y aplica LOG_TASK_LEVEL y LOG_TASK_SAMPLE_RATE."""
+
+    def __init__(self, task_level: int, sample_rate: float):
+        super().__init__()
+        self.task_level = task_level
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        context = _task_context.get()
+        if not context:
+            return True
+        if record.levelno < logging.WARNING and (
+            record.levelno < self.task_level or not _sampled(context["task_id"], self.sample_rate)
+        ):
+            return False
+        for key, value in context.items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+
+    def prepare(self, record):
+        # El mensaje se resuelve en el hilo que emite (los argumentos pueden
+        # cambiar después); la traza se formatea aquí porque exc_info no
+        # debe cruzar a otro hilo
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            from core.metrics import LOG_RECORDS_DROPPED
+            LOG_RECORDS_DROPPED.inc()
+
+
+def setup_logging(service: str):
+    """Configura el logger raíz del proceso (una sola vez)."""
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter({"service": service, "instance": settings.WORKER_ID}))
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    handler = _NonBlockingQueueHandler(queue.Queue(settings.LOG_QUEUE_SIZE))
+    handler.addFilter(_TaskContextFilter(logging.getLevelName(settings.LOG_TASK_LEVEL), settings.LOG_TASK_SAMPLE_RATE))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+    # El cliente de Twilio registra cada petición (URL y cabeceras) en INFO
+    logging.getLogger("twilio.http_client").setLevel(logging.WARNING)
+
+    _listener = QueueListener(handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Vacía la cola al terminar el proceso
+    atexit.register(_listener.stop)
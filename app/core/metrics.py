@@ -0,0 +1,123 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Métricas Prometheus de la API (GET /metrics) y del worker (GET /metrics
+# del puerto WORKER_STATUS_PORT). Cada proceso expone las suyas: el retraso de
+# envío y la latencia de los proveedores se miden donde se hacen las
+# peticiones, y la profundidad de la cola se consulta a la base de datos en
+# cada scrape.
+
+# Retraso entre scheduled_at y el momento en que se empieza a enviar la tarea
+DISPATCH_LAG = Histogram(
+    "reminder_task_dispatch_lag_seconds",
+    "Retraso del primer intento de envío respecto a scheduled_at",
+    ["task_type"],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+PROVIDER_LATENCY = Histogram(
+    "reminder_provider_request_seconds",
+    "Duración de las peticiones a los proveedores externos (sin la espera del rate limit)",
+    ["provider"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# reason: transient (5xx, timeouts, conexión), permanent (4xx y demás),
+# rate_limited (429 / Retry-After o sin token) o circuit_open (no se llamó)
+PROVIDER_ERRORS = Counter(
+    "reminder_provider_errors_total",
+    "Peticiones a proveedores externos fallidas o evitadas",
+    ["provider", "reason"],
+)
+
+# Un ciclo es una pasada de process_pending_tasks (modos poll y asyncio) o un
+# disparo de tareas vencidas del modo timer
+WORKER_CYCLE = Histogram(
+    "reminder_worker_cycle_seconds",
+    "Duración de cada ciclo de reclamo y envío del worker",
+    ["mode"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "reminder_log_records_dropped_total",
+    "Registros de log descartados porque la cola del QueueHandler estaba llena",
+)
+
+
+def observe_dispatch_lag(task):
+    """Registra el retraso de la tarea si es su primer intento (los reintentos esperan a propósito)."""
+    if task.attempts != 1:
+        return
+    scheduled_at = task.scheduled_at
+    if scheduled_at.tzinfo is None:
+        scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+    lag = (datetime.now(timezone.utc) - scheduled_at).total_seconds()
+    DISPATCH_LAG.labels(task.task_type.value).observe(max(lag, 0))
+
+
+@contextmanager
+def cycle_timer(mode: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        WORKER_CYCLE.labels(mode).observe(time.perf_counter() - start)
+
+
+class QueueDepthCollector:
+    """Tareas pending y retrying por TaskType, consultadas en cada scrape."""
+
+    @staticmethod
+    def _gauge():
+        return GaugeMetricFamily(
+            "reminder_tasks_queue_depth", "Tareas en cola por tipo y estado", labels=["task_type", "status"]
+        )
+
+    def describe(self):
+        # Sin describe(), REGISTRY.register() llamaría a collect() (y a la
+        # base de datos) al registrar el collector
+        return [self._gauge()]
+
+    def collect(self):
+        # Importaciones aquí: core no depende de la base de datos al importarse
+        import crud
+        from database import SessionLocal
+        from schemas import TaskStatus, TaskType
+
+        gauge = self._gauge()
+        db = SessionLocal()
+        try:
+            counts = crud.queue_depth(db)
+        except Exception as e:
+            # Sin la métrica, pero con el resto del scrape
+            logger.exception("Métricas: ERROR al consultar la cola: %s", e)
+            return
+        finally:
+            db.close()
+        for task_type in TaskType:
+            for status in (TaskStatus.pending, TaskStatus.retrying):
+                gauge.add_metric([task_type.value, status.value], counts.get((task_type, status), 0))
+        yield gauge
+
+
+_queue_depth_registered = False
+
+
+def register_queue_depth():
+    global _queue_depth_registered
+    if not _queue_depth_registered:
+        REGISTRY.register(QueueDepthCollector())
+        _queue_depth_registered = True
+
+
+def render():
+    """(content_type, cuerpo) de la respuesta de /metrics."""
+    return CONTENT_TYPE_LATEST, generate_latest()
@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# Métricas de los pools de conexiones, para dimensionar DB_POOL_SIZE y
+# DB_MAX_OVERFLOW con datos. Los contadores se alimentan de los eventos del
+# pool (connect, checkout, invalidate); el tiempo de espera por una conexión
+# se mide en _do_get, que es donde el pool bloquea cuando está agotado (y
+# donde abre las conexiones nuevas).
+
+# Límites superiores (segundos) del histograma de espera; el último es +Inf
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class PoolMetrics:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            index = next((i for i, bound in enumerate(WAIT_BUCKETS) if seconds <= bound), len(WAIT_BUCKETS))
+            self.wait_counts[index] += 1
+            self.wait_sum += seconds
+            if timed_out:
+                self.timeouts += 1
+
+    def _increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> dict:
+        # El pool se lee del engine en cada consulta: dispose() lo sustituye
+        pool = self.engine.pool
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip([str(bound) for bound in WAIT_BUCKETS] + ["+Inf"], self.wait_counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            return {
+                "pool": self.name,
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                # QueuePool cuenta el overflow desde -size; aquí solo las conexiones extra
+                "overflow": max(pool.overflow(), 0),
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_seconds": {"buckets": buckets, "sum": round(self.wait_sum, 6), "count": cumulative},
+            }
+
+
+_metrics: Dict[str, PoolMetrics] = {}
+
+
+def instrumented_pool_class(pool_class, name: str):
+    """
+    Subclase de pool_class que mide la espera por una conexión en las
+    métricas del pool name. Se pasa como poolclass a create_engine y después
+    se llama a instrument_engine.
+    """
+    metrics = _metrics.setdefault(name, PoolMetrics(name))
+
+    class InstrumentedPool(pool_class):
+
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.observe_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.observe_wait(time.perf_counter() - start)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+def instrument_engine(engine, name: str):
+    """Registra los eventos del pool del engine (síncrono) en las métricas name."""
+    metrics = _metrics.setdefault(name, PoolMetrics(name))
+    metrics.engine = engine
+    event.listen(engine, "connect", lambda *args: metrics._increment("connects"))
+    event.listen(engine, "checkout", lambda *args: metrics._increment("checkouts"))
+    event.listen(engine, "invalidate", lambda *args: metrics._increment("invalidations"))
+    return engine
+
+
+def pool_stats() -> List[dict]:
+    """Estado de los pools instrumentados de este proceso."""
+    return [metrics.snapshot() for metrics in _metrics.values() if metrics.engine is not None]
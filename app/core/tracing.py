@@ -0,0 +1,131 @@
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import Link, SpanKind
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Trazas OpenTelemetry de extremo a extremo: petición a la API -> INSERT ->
+# reclamo del worker -> petición al proveedor.
+#
+# Sin TRACING_EXPORTER ("none") no se configura ningún TracerProvider y los
+# spans son no-ops de la API de OpenTelemetry. Con "file" se escriben en
+# TRACING_FILE_PATH (una línea JSON por span) y con "otlp" se envían por
+# OTLP/HTTP a TRACING_OTLP_ENDPOINT; ninguno necesita un collector.
+#
+# La API y el worker no comparten una petición: el contexto de la traza de
+# alta se guarda en extra_data[TRACE_CONTEXT_KEY] (traceparent W3C) y el span
+# de cada envío lo enlaza (Link) con el span de alta.
+
+TRACE_CONTEXT_KEY = "trace_context"
+
+tracer = trace.get_tracer("reminder")
+
+_configured = False
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Exportador a fichero: un span por línea, en el JSON de ReadableSpan.to_json."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            for span in spans:
+                self._file.write(json.dumps(json.loads(span.to_json())) + "\n")
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+def _exporter() -> Optional[SpanExporter]:
+    if settings.TRACING_EXPORTER == "file":
+        return JsonLinesSpanExporter(settings.TRACING_FILE_PATH)
+    if settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    return None
+
+
+def setup_tracing(service: str):
+    """
+    Configura el TracerProvider del proceso e instrumenta los engines de
+    SQLAlchemy (un span por consulta). No hace nada sin TRACING_EXPORTER.
+    """
+    global _configured
+    exporter = _exporter()
+    if _configured or exporter is None:
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": service}))
+    # BatchSpanProcessor exporta desde su propio hilo, fuera del camino de envío
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    from database import async_engine, engine
+    SQLAlchemyInstrumentor().instrument(engines=[engine, async_engine.sync_engine])
+    _configured = True
+    logger.info("Trazas activadas: exportador %s", settings.TRACING_EXPORTER)
+
+
+def instrument_app(app):
+    """Un span por petición HTTP de la API."""
+    if not _configured:
+        return
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    FastAPIInstrumentor.instrument_app(app)
+
+
+def current_trace_context() -> Optional[Dict[str, str]]:
+    """traceparent del span actual, para guardarlo en extra_data; None si no hay traza."""
+    carrier = {}
+    propagate.inject(carrier)
+    return carrier or None
+
+
+def with_trace_context(extra_data: Optional[dict], trace_context: Optional[Dict[str, str]]) -> Optional[dict]:
+    if trace_context is None:
+        return extra_data
+    return {**(extra_data or {}), TRACE_CONTEXT_KEY: trace_context}
+
+
+def _ingest_link(task) -> Optional[Link]:
+    carrier = (task.extra_data or {}).get(TRACE_CONTEXT_KEY)
+    if not carrier:
+        return None
+    span_context = trace.get_current_span(propagate.extract(carrier)).get_span_context()
+    return Link(span_context) if span_context.is_valid else None
+
+
+@contextmanager
+def task_span(task):
+    """Span del envío de una tarea, enlazado con el span en el que se dio de alta."""
+    link = _ingest_link(task)
+    with tracer.start_as_current_span(
+        f"task {task.task_type.value}",
+        links=[link] if link is not None else None,
+        attributes={"task.id": task.id, "task.type": task.task_type.value, "task.attempt": task.attempts},
+    ) as span:
+        yield span
+
+
+@contextmanager
+def provider_span(provider: str):
+    """Span de una petición a un proveedor externo."""
+    with tracer.start_as_current_span(f"provider {provider}", kind=SpanKind.CLIENT,
+                                      attributes={"provider": provider}) as span:
+        yield span
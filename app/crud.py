@@ -1,27 +1,714 @@
+import io
+import json
+from enum import Enum
+from sqlalchemy import select, update, delete, func, tuple_, any_, bindparam, Integer, and_, or_, case, cast, literal_column, union_all, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from sqlalchemy.orm import Session
+from typing import Optional, List, Dict, Tuple
 import models
 import schemas
-from datetime import datetime, timedelta
+from core.config import settings
+from core.tracing import current_trace_context, with_trace_context
+from datetime import datetime, timedelta, timezone
 
-def create_task(db: Session, task: schemas.TaskCreate):
-    db_task = models.Task(**task.model_dump())
-    db.add(db_task)
+def task_values(task: schemas.TaskCreate, trace_context: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Columnas de una tarea nueva. El contexto de la traza en curso (o
+    trace_context, si ya se obtuvo para todo un lote) se guarda en extra_data
+    para que el span de envío del worker enlace con el de alta.
+    """
+    values = task.model_dump()
+    values["extra_data"] = with_trace_context(values["extra_data"], trace_context or current_trace_context())
+    # Las fechas sin zona horaria son UTC (como en el TimerScheduler), no la
+    # TimeZone de la sesión; el COPY binario de asyncpg usaría además la del host
+    if values["scheduled_at"].tzinfo is None:
+        values["scheduled_at"] = values["scheduled_at"].replace(tzinfo=timezone.utc)
+    return values
+
+def create_task_stmt(values: Dict):
+    """
+    INSERT ... RETURNING de una tarea. Con idempotency_key, un conflicto con
+    una tarea existente la devuelve en lugar de crear otra: el DO UPDATE no
+    cambia nada pero hace que RETURNING incluya la fila original, así basta
+    un solo viaje a la BBDD. xmax = 0 solo en las filas recién insertadas.
+    """
+    stmt = insert(models.Task).values(**values)
+    if values.get("idempotency_key") is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.Task.idempotency_key],
+            set_={"idempotency_key": stmt.excluded.idempotency_key}
+        )
+    return stmt.returning(models.Task, literal_column("xmax = 0").label("inserted"))
+
+def create_task_idempotent(db: Session, task: schemas.TaskCreate, notify: bool = False):
+    """
+    Guarda una nueva tarea y devuelve (tarea, creada). creada es False
+    cuando la idempotency_key ya existía y se devuelve la tarea original
+    (aunque el resto del cuerpo sea distinto).
+
+    Si notify es True, envía un NOTIFY para que los workers en modo "timer"
+    la agreguen a su cola en memoria sin esperar a la siguiente recarga
+    (Postgres lo entrega al hacer commit).
+    """
+    db_task, inserted = db.execute(create_task_stmt(task_values(task))).one()
+    if notify and inserted:
+        notify_task_scheduled(db, db_task.id, db_task.scheduled_at)
+    # La fila ya viene completa en RETURNING; la separamos de la sesión para
+    # que el commit no la expire y obligue a releerla.
+    db.expunge(db_task)
+    db.commit()
+    return db_task, inserted
+
+def create_tasks_bulk_stmt():
+    """
+    INSERT multi-fila (insertmanyvalues agrupa los parámetros en páginas de
+    VALUES) con el mismo ON CONFLICT que create_task_stmt. sort_by_parameter_order
+    hace que los IDs se asignen en el orden de los parámetros.
+    """
+    tasks = models.Task.__table__
+    stmt = insert(tasks)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[tasks.c.idempotency_key],
+        set_={"idempotency_key": stmt.excluded.idempotency_key}
+    )
+    return stmt.returning(
+        tasks.c.id,
+        tasks.c.idempotency_key,
+        literal_column("xmax = 0").label("inserted"),
+        sort_by_parameter_order=True
+    )
+
+def copy_tasks_sql(columns: List[str]) -> Tuple[str, str]:
+    """
+    SQL de la carga con COPY: crea la tabla temporal tasks_incoming (con una
+    columna ord para conservar el orden) y la vuelca en tasks con el mismo
+    ON CONFLICT que create_task_stmt.
+    """
+    columns = ", ".join(columns)
+    create_temp = (
+        f"CREATE TEMP TABLE tasks_incoming ON COMMIT DROP AS "
+        f"SELECT 0 AS ord, {columns} FROM tasks WITH NO DATA"
+    )
+    insert_select = (
+        f"INSERT INTO tasks ({columns}) SELECT {columns} FROM tasks_incoming ORDER BY ord "
+        f"ON CONFLICT (idempotency_key) DO UPDATE SET idempotency_key = EXCLUDED.idempotency_key "
+        f"RETURNING id, idempotency_key, xmax = 0"
+    )
+    return create_temp, insert_select
+
+def copy_insert_tasks(db: Session, rows: List[Dict]):
+    """
+    Variante de create_tasks_bulk_stmt para lotes grandes: COPY a una tabla
+    temporal y un único INSERT ... SELECT ... ON CONFLICT. Evita generar y
+    parsear miles de VALUES. Devuelve (id, idempotency_key, inserted).
+    """
+    columns = list(rows[0].keys())
+    create_temp, insert_select = copy_tasks_sql(columns)
+    buffer = io.StringIO()
+    for ord_, row in enumerate(rows):
+        buffer.write(",".join([str(ord_)] + [_copy_value(value) for value in row.values()]))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(create_temp)
+        cursor.copy_expert(f"COPY tasks_incoming (ord, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(insert_select)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+def _copy_value(value) -> str:
+    """Valor en formato CSV de COPY: sin comillas es NULL, entre comillas es texto."""
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        # SQLAlchemy guarda los Enum por nombre
+        value = value.name
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+def _bulk_rows(tasks: List[schemas.TaskCreate]):
+    """
+    Filas a insertar para un lote. Las claves de idempotencia repetidas dentro
+    del lote se insertan una vez (Postgres no permite que un mismo INSERT
+    afecte dos veces a la misma fila); duplicate_of apunta a la primera.
+    """
+    rows = []
+    first_by_key = {}
+    duplicate_of = {}
+    trace_context = current_trace_context()
+    for index, task in enumerate(tasks):
+        key = task.idempotency_key
+        if key is not None and key in first_by_key:
+            duplicate_of[index] = first_by_key[key]
+            continue
+        if key is not None:
+            first_by_key[key] = index
+        row = task_values(task, trace_context)
+        row["status"] = schemas.TaskStatus.pending
+        rows.append(row)
+    return rows, duplicate_of
+
+def _bulk_results(tasks: List[schemas.TaskCreate], duplicate_of: Dict[int, int], returned) -> List[Tuple[int, bool]]:
+    """
+    Empareja las filas de RETURNING (id, idempotency_key, inserted) con las
+    tareas enviadas. Las tareas con clave se emparejan por clave; las demás
+    por orden de ID, que sigue el orden de inserción. Una tarea ya existente
+    conserva su ID original, por eso no basta con ordenar todo el resultado.
+    """
+    by_key = {key: (task_id, inserted) for task_id, key, inserted in returned if key is not None}
+    keyless = iter(sorted((task_id, inserted) for task_id, key, inserted in returned if key is None))
+    results = []
+    for index, task in enumerate(tasks):
+        if index in duplicate_of:
+            results.append((results[duplicate_of[index]][0], False))
+        elif task.idempotency_key is not None:
+            results.append(by_key[task.idempotency_key])
+        else:
+            results.append(next(keyless))
+    return results
+
+def create_tasks_bulk(db: Session, tasks: List[schemas.TaskCreate], notify: bool = False) -> List[Tuple[int, bool]]:
+    """
+    Inserta un lote de tareas en una sola transacción. Devuelve (id, creada)
+    por cada tarea, en el mismo orden; creada es False si su idempotency_key
+    ya existía.
+
+    Los lotes de BULK_COPY_THRESHOLD tareas o más se cargan con COPY. Si
+    notify es True se envía un único NOTIFY para que los workers en modo
+    "timer" recarguen su ventana.
+    """
+    rows, duplicate_of = _bulk_rows(tasks)
+    if not rows:
+        return []
+    if len(rows) >= settings.BULK_COPY_THRESHOLD:
+        returned = copy_insert_tasks(db, rows)
+    else:
+        returned = [tuple(row) for row in db.execute(create_tasks_bulk_stmt(), rows)]
+    results = _bulk_results(tasks, duplicate_of, returned)
+    if notify and any(inserted for _, inserted in results):
+        notify_tasks_refresh(db)
+    db.commit()
+    return results
+
+def notify_task_scheduled_stmt(task_id: int, scheduled_at: datetime):
+    if scheduled_at.tzinfo is None:
+        scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+    payload = json.dumps({"id": task_id, "scheduled_at": scheduled_at.isoformat()})
+    return select(func.pg_notify(settings.SCHEDULER_NOTIFY_CHANNEL, payload))
+
+def notify_task_scheduled(db: Session, task_id: int, scheduled_at: datetime):
+    db.execute(notify_task_scheduled_stmt(task_id, scheduled_at))
+
+def in_scheduler_window(scheduled_at: datetime, now_utc: Optional[datetime] = None) -> bool:
+    """
+    Comprueba si la hora programada ya pasó o cae dentro de la ventana que
+    los workers en modo "timer" mantienen en memoria: esas tareas se
+    notifican al crearlas para no esperar a la siguiente recarga.
+    """
+    # Las fechas sin zona horaria se interpretan como UTC
+    if scheduled_at.tzinfo is None:
+        scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+    now_utc = now_utc or datetime.now(timezone.utc)
+    return scheduled_at <= now_utc + timedelta(seconds=settings.SCHEDULER_LOOKAHEAD_SECONDS)
+
+def notify_tasks_refresh_stmt():
+    """Pide a los workers en modo "timer" que recarguen su ventana de tareas."""
+    return select(func.pg_notify(settings.SCHEDULER_NOTIFY_CHANNEL, json.dumps({"refresh": True})))
+
+def notify_tasks_refresh(db: Session):
+    db.execute(notify_tasks_refresh_stmt())
+
+def _due_condition(until):
+    """Tareas pendientes con scheduled_at <= until o reintentos con next_attempt_at <= until."""
+    return or_(
+        and_(
+            models.Task.status == schemas.TaskStatus.pending,
+            models.Task.scheduled_at <= until
+        ),
+        and_(
+            models.Task.status == schemas.TaskStatus.retrying,
+            models.Task.next_attempt_at <= until
+        )
+    )
+
+def get_upcoming_tasks(db: Session, horizon_seconds: int, limit: int, task_ids: Optional[List[int]] = None):
+    """
+    Devuelve (id, hora de ejecución) de las tareas que vencen dentro de los
+    próximos horizon_seconds (incluidas las atrasadas), ordenadas por hora.
+    Para los reintentos la hora de ejecución es next_attempt_at. Con
+    task_ids solo se consideran esas tareas.
+    """
+    horizon = datetime.now(timezone.utc) + timedelta(seconds=horizon_seconds)
+    due_at = func.coalesce(models.Task.next_attempt_at, models.Task.scheduled_at)
+    query = select(models.Task.id, due_at).where(_due_condition(horizon))
+    if task_ids is not None:
+        query = query.where(models.Task.id.in_(task_ids))
+    return db.execute(query.order_by(due_at, models.Task.id).limit(limit)).all()
+
+def _locked_due_ids(status: schemas.TaskStatus, due_column, limit: int, task_ids: Optional[List[int]]):
+    query = (
+        select(models.Task.id, due_column.label("due_at"))
+        .where(models.Task.status == status, due_column <= func.now())
+        .order_by(due_column, models.Task.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if task_ids is not None:
+        query = query.where(models.Task.id.in_(task_ids))
+    return query.cte(f"due_{status.value}")
+
+def claim_due_tasks_stmt(worker_id: str, limit: int, task_ids: Optional[List[int]] = None):
+    """
+    UPDATE ... RETURNING que reclama las tareas vencidas. Se comparte entre
+    claim_due_tasks y su versión asíncrona en async_crud.
+
+    Las pendientes (por scheduled_at) y los reintentos (por next_attempt_at)
+    se bloquean en dos CTE separadas, cada una servida por su índice parcial;
+    Postgres no admite FOR UPDATE dentro de un UNION. El límite se aplica
+    otra vez sobre la unión, por hora de ejecución, para no reclamar más de
+    limit tareas; las filas bloqueadas que quedan fuera se liberan con el
+    commit del reclamo.
+    """
+    pending = _locked_due_ids(schemas.TaskStatus.pending, models.Task.scheduled_at, limit, task_ids)
+    retrying = _locked_due_ids(schemas.TaskStatus.retrying, models.Task.next_attempt_at, limit, task_ids)
+    due = union_all(
+        select(pending.c.id, pending.c.due_at),
+        select(retrying.c.id, retrying.c.due_at)
+    ).subquery("due")
+    claimed_ids = select(due.c.id).order_by(due.c.due_at, due.c.id).limit(limit)
+    return (
+        update(models.Task)
+        .where(models.Task.id.in_(claimed_ids))
+        .values(
+            status=schemas.TaskStatus.processing,
+            claimed_by=worker_id,
+            claimed_at=func.now(),
+            lease_expires_at=func.now() + timedelta(seconds=settings.WORKER_LEASE_SECONDS),
+            dispatched_at=None,
+            attempts=models.Task.attempts + 1
+        )
+        .returning(models.Task)
+    )
+
+def claim_due_tasks(
+    db: Session,
+    worker_id: str,
+    limit: int = 100,
+    task_ids: Optional[List[int]] = None
+):
+    """
+    Reclama de forma atómica un lote de tareas vencidas para este worker.
+
+    Las filas se bloquean con SELECT ... FOR UPDATE SKIP LOCKED y pasan a
+    status=processing en la misma sentencia, así varias réplicas del worker
+    pueden repartirse las tareas sin enviar dos veces el mismo SMS o llamada.
+    Si se indica task_ids, solo se reclaman esas tareas (modo "timer").
+    """
+    stmt = claim_due_tasks_stmt(worker_id, limit, task_ids)
+    tasks = db.scalars(select(models.Task).from_statement(stmt).execution_options(populate_existing=True)).all()
+    # Separamos las tareas de la sesión antes del commit para que sigan
+    # cargadas (el commit expiraría sus atributos).
+    db.expunge_all()
+    db.commit()
+    return sorted(tasks, key=lambda t: (t.scheduled_at, t.id))
+
+def list_tasks_stmt(
+    statuses: Optional[List[schemas.TaskStatus]] = None,
+    task_types: Optional[List[schemas.TaskType]] = None,
+    target: Optional[str] = None,
+    scheduled_from: Optional[datetime] = None,
+    scheduled_to: Optional[datetime] = None
+):
+    """
+    SELECT de la proyección de listado (TaskSummary) con los filtros, sin
+    orden ni límite: list_tasks_page añade la paginación y explain_rows lo
+    usa para estimar el total.
+    """
+    stmt = select(
+        models.Task.id,
+        models.Task.target,
+        models.Task.task_type,
+        models.Task.status,
+        models.Task.scheduled_at,
+        models.Task.attempts,
+        models.Task.last_error,
+        models.Task.updated_at
+    )
+    if statuses:
+        stmt = stmt.where(models.Task.status.in_(statuses))
+    if task_types:
+        stmt = stmt.where(models.Task.task_type.in_(task_types))
+    if target is not None:
+        stmt = stmt.where(models.Task.target == target)
+    if scheduled_from is not None:
+        stmt = stmt.where(models.Task.scheduled_at >= scheduled_from)
+    if scheduled_to is not None:
+        stmt = stmt.where(models.Task.scheduled_at < scheduled_to)
+    return stmt
+
+def list_tasks_page(stmt, limit: int, after: Optional[Tuple[datetime, int]] = None, descending: bool = False):
+    """
+    Paginación por keyset sobre (scheduled_at, id): en lugar de OFFSET, la
+    página siguiente empieza después de la última fila de la anterior, así
+    que su coste no depende de lo lejos que se esté. Se pide una fila de más
+    para saber si hay otra página.
+    """
+    key = tuple_(models.Task.scheduled_at, models.Task.id)
+    if after is not None:
+        stmt = stmt.where(key < tuple_(*after) if descending else key > tuple_(*after))
+    if descending:
+        stmt = stmt.order_by(models.Task.scheduled_at.desc(), models.Task.id.desc())
+    else:
+        stmt = stmt.order_by(models.Task.scheduled_at, models.Task.id)
+    return stmt.limit(limit + 1)
+
+class ExplainJSON(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) de una sentencia; ver explain_rows."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(ExplainJSON, "postgresql")
+def _compile_explain_json(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+def explain_rows(plan) -> int:
+    """Filas estimadas por el planificador a partir del resultado de ExplainJSON."""
+    if isinstance(plan, str):
+        # asyncpg devuelve el JSON sin decodificar
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def queue_depth(db: Session) -> Dict[Tuple[schemas.TaskType, schemas.TaskStatus], int]:
+    """Tareas pending y retrying por (tipo, estado); usa ix_tasks_status_scheduled_at_id."""
+    rows = db.execute(
+        select(models.Task.task_type, models.Task.status, func.count())
+        .where(models.Task.status.in_([schemas.TaskStatus.pending, schemas.TaskStatus.retrying]))
+        .group_by(models.Task.task_type, models.Task.status)
+    )
+    return {(task_type, status): count for task_type, status, count in rows}
+
+def _claimed_by_worker(worker_id: str):
+    # Solo se tocan las tareas que siguen en processing y reclamadas por este
+    # worker, así un lote tardío no pisa tareas que otra réplica haya retomado.
+    return and_(
+        models.Task.status == schemas.TaskStatus.processing,
+        models.Task.claimed_by == worker_id
+    )
+
+def bulk_update_task_status_stmt(worker_id: str, status: schemas.TaskStatus, task_ids: List[int]):
+    """UPDATE tasks SET status = :status WHERE id = ANY(:ids) para un lote de tareas."""
+    return (
+        update(models.Task)
+        .where(
+            models.Task.id == any_(bindparam("task_ids", task_ids, type_=ARRAY(Integer))),
+            _claimed_by_worker(worker_id)
+        )
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+
+def task_outcome_update_stmt(worker_id: str):
+    """
+    UPDATE por fila para los resultados con datos propios (reintentos y
+    fallos con su next_attempt_at y last_error). Se ejecuta como executemany,
+    por eso es un UPDATE de Core sobre la tabla y no sobre la entidad ORM.
+    """
+    tasks = models.Task.__table__
+    return (
+        update(tasks)
+        .where(
+            tasks.c.id == bindparam("task_id"),
+            tasks.c.status == schemas.TaskStatus.processing,
+            tasks.c.claimed_by == worker_id
+        )
+        .values(
+            status=bindparam("new_status"),
+            next_attempt_at=bindparam("new_next_attempt_at"),
+            last_error=bindparam("new_last_error"),
+            attempts=bindparam("new_attempts")
+        )
+    )
+
+def bulk_update_task_status(
+    db: Session,
+    worker_id: str,
+    updates: Dict[schemas.TaskStatus, List[int]],
+    outcomes: Optional[List[Dict]] = None
+):
+    """
+    Aplica todas las transiciones de estado en una única transacción.
+
+    updates agrupa por estado los IDs sin datos adicionales (un UPDATE con
+    ANY por estado); outcomes son dicts con task_id, new_status,
+    new_next_attempt_at, new_last_error y new_attempts.
+    """
+    for status, task_ids in updates.items():
+        if task_ids:
+            db.execute(bulk_update_task_status_stmt(worker_id, status, task_ids))
+    if outcomes:
+        db.execute(task_outcome_update_stmt(worker_id), outcomes)
     db.commit()
-    db.refresh(db_task)
-    return db_task
 
-def get_due_tasks(db: Session):
-    now = datetime.utcnow()
-    # Busca tareas pendientes cuya hora programada esté en el pasado o en el próximo minuto
-    return db.query(models.Task).filter(
-        models.Task.status == schemas.TaskStatus.pending,
-        models.Task.scheduled_at <= now
+def renew_leases_stmt(worker_id: str, task_ids: List[int]):
+    """
+    Renueva el lease de las tareas que el worker sigue ejecutando (heartbeat).
+    Las que tiene en processing pero ya no están en curso (su resultado no
+    llegó a guardarse) no se renuevan: vencen y las recupera el reaper.
+    """
+    return (
+        update(models.Task)
+        .where(
+            models.Task.id == any_(bindparam("task_ids", task_ids, type_=ARRAY(Integer))),
+            _claimed_by_worker(worker_id)
+        )
+        .values(lease_expires_at=func.now() + timedelta(seconds=settings.WORKER_LEASE_SECONDS))
+        .execution_options(synchronize_session=False)
+    )
+
+def renew_leases(db: Session, worker_id: str, task_ids: List[int]) -> int:
+    result = db.execute(renew_leases_stmt(worker_id, task_ids))
+    db.commit()
+    return result.rowcount
+
+def mark_task_dispatched_stmt(worker_id: str, task_id: int):
+    return (
+        update(models.Task)
+        .where(models.Task.id == task_id, _claimed_by_worker(worker_id))
+        .values(dispatched_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+def mark_task_dispatched(db: Session, worker_id: str, task_id: int) -> bool:
+    """
+    Marca que se va a iniciar la petición al proveedor. Devuelve False si la
+    tarea ya no pertenece a este worker (su lease venció y fue recuperada):
+    en ese caso no debe enviarse.
+    """
+    result = db.execute(mark_task_dispatched_stmt(worker_id, task_id))
+    db.commit()
+    return result.rowcount == 1
+
+def reap_expired_leases(db: Session, at_most_once_types: List[str]):
+    """
+    Recupera las tareas en processing cuyo lease venció (el worker que las
+    reclamó cayó o dejó de renovarlo):
+
+    - si es de un canal at-most-once y ya se inició la petición al proveedor
+      (dispatched_at), pasa a failed: no sabemos si el mensaje salió y
+      reenviarlo podría duplicar una llamada o un SMS;
+    - si agotó sus intentos, pasa a failed;
+    - si no, vuelve a retrying para reintentarse de inmediato.
+
+    Devuelve (id, status) de las tareas recuperadas.
+    """
+    lease_expired = func.coalesce(
+        models.Task.lease_expires_at,
+        models.Task.claimed_at + timedelta(seconds=settings.WORKER_LEASE_SECONDS)
+    ) < func.now()
+    maybe_sent = and_(
+        models.Task.task_type.in_(at_most_once_types),
+        models.Task.dispatched_at.isnot(None)
+    )
+    exhausted = models.Task.attempts >= models.Task.max_attempts
+    new_status = cast(
+        case(
+            (or_(maybe_sent, exhausted), schemas.TaskStatus.failed.name),
+            else_=schemas.TaskStatus.retrying.name
+        ),
+        models.Task.status.type
+    )
+    stmt = (
+        update(models.Task)
+        .where(models.Task.status == schemas.TaskStatus.processing, lease_expired)
+        .values(
+            status=new_status,
+            next_attempt_at=case((or_(maybe_sent, exhausted), None), else_=func.now()),
+            lease_expires_at=None,
+            last_error=case(
+                (maybe_sent, "Lease vencido después de iniciar el envío; no se reintenta para evitar duplicados"),
+                else_="Lease vencido: el worker dejó de responder"
+            )
+        )
+        .returning(models.Task.id, models.Task.status)
+        .execution_options(synchronize_session=False)
+    )
+    reaped = db.execute(stmt).all()
+    db.commit()
+    return reaped
+
+def claim_due_recurring_tasks(db: Session, horizon: datetime, limit: int):
+    """
+    Definiciones activas con next_run_at <= horizon, bloqueadas hasta el
+    commit (SKIP LOCKED: cada réplica del worker materializa las suyas).
+    """
+    return db.scalars(
+        select(models.RecurringTask)
+        .where(models.RecurringTask.active.is_(True), models.RecurringTask.next_run_at <= horizon)
+        .order_by(models.RecurringTask.next_run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+def recurring_idempotency_key(recurring_id: int, occurrence: datetime) -> str:
+    """Clave de la Task de una ocurrencia: la misma ocurrencia nunca se crea dos veces."""
+    return f"recurring:{recurring_id}:{occurrence.astimezone(timezone.utc).isoformat()}"
+
+def cancel_recurring_occurrences_stmt(recurring_id: int):
+    """Borra las ocurrencias ya materializadas que aún no se han enviado."""
+    return (
+        delete(models.Task)
+        .where(
+            models.Task.recurring_task_id == recurring_id,
+            models.Task.status == schemas.TaskStatus.pending
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def archive_partition_name(month: datetime) -> str:
+    return f"tasks_archive_{month:%Y_%m}"
+
+def ensure_archive_partitions(db: Session, months: List[datetime]):
+    """
+    Crea (si no existen) las particiones mensuales de tasks_archive de esos
+    meses. Los meses son en UTC, independientemente de la zona de la sesión.
+    """
+    for month in months:
+        start = month.replace(day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        end = (start + timedelta(days=32)).replace(day=1)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {archive_partition_name(start)} PARTITION OF tasks_archive "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d} 00:00:00+00') TO ('{end:%Y-%m-%d} 00:00:00+00')"
+        ))
+
+def archive_finished_tasks(db: Session, older_than: datetime, limit: int) -> int:
+    """
+    Mueve a tasks_archive hasta limit tareas done/failed sin cambios desde
+    older_than (DELETE ... RETURNING dentro de un INSERT, en una sola
+    transacción). Devuelve cuántas se movieron.
+    """
+    finished = [schemas.TaskStatus.done, schemas.TaskStatus.failed]
+    batch = db.execute(
+        select(models.Task.id, func.date_trunc("month", func.timezone("UTC", models.Task.scheduled_at)))
+        .where(models.Task.status.in_(finished), models.Task.updated_at < older_than)
+        .order_by(models.Task.updated_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
     ).all()
+    if not batch:
+        db.commit()
+        return 0
+    ensure_archive_partitions(db, sorted({month for _, month in batch}))
 
-def update_task_status(db: Session, task_id: int, status: schemas.TaskStatus):
-    db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
-    if db_task:
-        db_task.status = status
+    columns = [column.name for column in models.Task.__table__.columns]
+    moved = (
+        delete(models.Task)
+        .where(models.Task.id.in_([task_id for task_id, _ in batch]))
+        .returning(*models.Task.__table__.columns)
+        .cte("moved")
+    )
+    db.execute(
+        insert(models.TaskArchive.__table__)
+        .from_select(columns, select(*[moved.c[name] for name in columns]))
+    )
+    db.commit()
+    return len(batch)
+
+def archive_partitions(db: Session) -> List[str]:
+    """Particiones de tasks_archive, de la más antigua a la más reciente."""
+    return sorted(db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'tasks_archive'::regclass"
+    )).scalars())
+
+def export_archive_partition(db: Session, name: str, fileobj):
+    """Vuelca la partición en fileobj como CSV con cabecera (COPY ... TO STDOUT)."""
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", fileobj)
+    finally:
+        cursor.close()
+    db.commit()
+
+def drop_archive_partition(db: Session, name: str):
+    db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    db.commit()
+
+def ensure_rate_limit_bucket(db: Session, provider: str, burst: float):
+    """Crea la fila del bucket del proveedor si no existe (lleno)."""
+    db.execute(
+        text("""
+            INSERT INTO provider_rate_limits (provider, tokens, updated_at)
+            VALUES (:provider, :burst, clock_timestamp())
+            ON CONFLICT (provider) DO NOTHING
+        """),
+        {"provider": provider, "burst": burst}
+    )
+    db.commit()
+
+def take_rate_limit_token(db: Session, provider: str, rate: float, burst: float) -> float:
+    """
+    Intenta tomar un token del bucket compartido del proveedor. Rellena el
+    bucket según el tiempo transcurrido y descuenta el token en un solo UPDATE
+    atómico. Devuelve 0 si se obtuvo el token, o los segundos a esperar.
+    """
+    params = {
+        "provider": provider, "rate": rate, "burst": burst,
+        "no_refill_wait": settings.RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS
+    }
+    refilled = "LEAST(:burst, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * :rate)"
+    taken = db.execute(
+        text(f"""
+            UPDATE provider_rate_limits
+            SET tokens = {refilled} - 1, updated_at = clock_timestamp()
+            WHERE provider = :provider
+              AND (blocked_until IS NULL OR blocked_until <= clock_timestamp())
+              AND {refilled} >= 1
+            RETURNING tokens
+        """),
+        params
+    ).first()
+    if taken is not None:
         db.commit()
-        db.refresh(db_task)
-    return db_task
\ No newline at end of file
+        return 0.0
+    wait = db.execute(
+        text(f"""
+            SELECT GREATEST(
+                COALESCE(EXTRACT(EPOCH FROM blocked_until - clock_timestamp()), 0),
+                -- Sin recarga (rate <= 0) no hay que dividir por rate
+                CASE WHEN :rate > 0 THEN (1 - {refilled}) / :rate ELSE :no_refill_wait END
+            )
+            FROM provider_rate_limits
+            WHERE provider = :provider
+        """),
+        params
+    ).scalar()
+    db.commit()
+    return max(float(wait or 0), 0.01)
+
+def block_rate_limit_bucket(db: Session, provider: str, seconds: float):
+    """Vacía el bucket y bloquea el proveedor durante seconds (Retry-After)."""
+    db.execute(
+        text("""
+            UPDATE provider_rate_limits
+            SET tokens = 0,
+                updated_at = clock_timestamp(),
+                blocked_until = GREATEST(
+                    COALESCE(blocked_until, clock_timestamp()),
+                    clock_timestamp() + make_interval(secs => :seconds)
+                )
+            WHERE provider = :provider
+        """),
+        {"provider": provider, "seconds": seconds}
+    )
+    db.commit()
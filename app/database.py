@@ -1,10 +1,70 @@
-from sqlalchemy import create_engine
+from uuid import uuid4
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from core.config import settings
+from core.pool_metrics import instrument_engine, instrumented_pool_class
 
-engine = create_engine(settings.DATABASE_URL)
+def _engine_options(async_driver: bool) -> dict:
+    """Opciones comunes de create_engine / create_async_engine según la configuración DB_*."""
+    connect_args = {}
+    if settings.DB_PGBOUNCER:
+        if async_driver:
+            # PgBouncer puede dar a cada transacción una conexión distinta:
+            # los prepared statements no pueden cachearse ni repetir nombre
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    elif settings.DB_STATEMENT_TIMEOUT_MS:
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if async_driver:
+            connect_args["server_settings"] = {"statement_timeout": timeout}
+        else:
+            connect_args["options"] = f"-c statement_timeout={timeout}"
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+def _set_local_statement_timeout(conn):
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.DB_STATEMENT_TIMEOUT_MS)}")
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    poolclass=instrumented_pool_class(QueuePool, "sync"),
+    **_engine_options(async_driver=False)
+)
+instrument_engine(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Motor asíncrono (asyncpg) sobre la misma base de datos, usado por el worker
+# asyncio y por los endpoints async de la API
+ASYNC_DATABASE_URL = make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg")
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=instrumented_pool_class(AsyncAdaptedQueuePool, "async"),
+    **_engine_options(async_driver=True)
+)
+instrument_engine(async_engine.sync_engine, "async")
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if settings.DB_PGBOUNCER and settings.DB_STATEMENT_TIMEOUT_MS:
+    # PgBouncer no reenvía el parámetro options al conectar
+    event.listen(engine, "begin", _set_local_statement_timeout)
+    event.listen(async_engine.sync_engine, "begin", _set_local_statement_timeout)
+
+# Conexión para LISTEN (modo "timer" del worker), que debe ser directa a
+# Postgres y durar lo que dure el worker: no pasa por el pool
+listen_engine = create_engine(settings.DATABASE_LISTEN_URL, poolclass=NullPool) \
+    if settings.DATABASE_LISTEN_URL else engine
+
 Base = declarative_base()
 
 def get_db():
@@ -12,4 +72,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,17 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta, timezone # <-- CORRECCIÓN 1: Se importa timezone
+import base64
+import json
+import logging
+import tempfile
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Body, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone # <-- CORRECCIÓN 1: Se importa timezone
+from typing import Optional, List, Dict, Any
 
 # Importaciones absolutas para compatibilidad con Docker y Uvicorn
+import async_crud
 import crud
-import models
 import schemas
-from database import engine, get_db
+from database import get_async_db, AsyncSessionLocal
+from core.config import settings
+from core.log import setup_logging
+from core.tracing import instrument_app, setup_tracing
+from core import metrics
+from core.pool_metrics import pool_stats
 from services import twilio_service
-from routers import calendar_router, outlook_calendar_router
+from routers import calendar_router, outlook_calendar_router, providers_router, recurring_router
 
-# Esta línea asegura que las tablas se creen al iniciar la API.
-models.Base.metadata.create_all(bind=engine)
+setup_logging("api")
+setup_tracing("api")
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="N8N Helper Service",
@@ -21,46 +34,301 @@ app = FastAPI(
 # Incluir los routers
 app.include_router(calendar_router.router)
 app.include_router(outlook_calendar_router.router)
+app.include_router(providers_router.router)
+app.include_router(recurring_router.router)
+instrument_app(app)
+
+# La profundidad de la cola se publica solo en la API, no en cada réplica del worker
+metrics.register_queue_depth()
+
+def _is_immediate(task: schemas.TaskCreate, now_utc: datetime) -> bool:
+    """Comprueba si la tarea cae en la ventana de los workers en modo "timer"."""
+    return crud.in_scheduler_window(task.scheduled_at, now_utc)
 
 @app.post("/tasks/", response_model=schemas.Task, status_code=201)
-def schedule_or_run_task(
+async def schedule_or_run_task(
     task: schemas.TaskCreate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Recibe una tarea desde n8n. Toda la lógica interna se maneja en UTC.
+
+    Con una Idempotency-Key (cabecera o campo idempotency_key), los reintentos
+    de la misma petición devuelven la tarea original con 200 y la cabecera
+    Idempotent-Replayed en lugar de crear otra.
     """
+    if idempotency_key is not None:
+        if task.idempotency_key is not None and task.idempotency_key != idempotency_key:
+            raise HTTPException(status_code=422, detail="La cabecera Idempotency-Key no coincide con idempotency_key.")
+        task.idempotency_key = idempotency_key
+
     # CORRECCIÓN 2: Usamos datetime.now(timezone.utc) para obtener la hora
     # actual en un formato "aware" (consciente de la zona horaria).
     now_utc = datetime.now(timezone.utc)
     
-    # Comprobamos si la hora programada ya pasó o está en el próximo minuto.
-    # Ahora la comparación es entre dos fechas "aware", lo cual es correcto.
-    is_immediate = task.scheduled_at <= (now_utc + timedelta(seconds=65))
+    is_immediate = _is_immediate(task, now_utc)
 
     if is_immediate:
-        print(f"Tarea inmediata recibida: {task.task_type} a {task.target}")
+        logger.info("Tarea inmediata recibida: %s a %s", task.task_type, task.target)
     else:
-        print(f"Tarea programada recibida para {task.scheduled_at.isoformat()}")
+        logger.info("Tarea programada recibida para %s", task.scheduled_at.isoformat())
+
+    # La función create_task_idempotent se encarga de guardar la nueva tarea
+    # en la BBDD. Las tareas inmediatas se notifican al worker (LISTEN/NOTIFY)
+    # para que se ejecuten a su hora sin esperar al siguiente ciclo.
+    db_task, created = await async_crud.create_task_idempotent(db=db, task=task, notify=is_immediate)
+    if not created:
+        logger.info("Tarea repetida con Idempotency-Key %s; se devuelve la tarea ID %s", task.idempotency_key, db_task.id)
+        response.status_code = 200
+        response.headers["Idempotent-Replayed"] = "true"
+    return db_task
+
+def _validation_errors(error: ValidationError) -> List[Dict[str, Any]]:
+    return [{"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]} for err in error.errors()]
+
+@app.post("/tasks/bulk", response_model=schemas.TaskBulkResponse)
+async def schedule_tasks_bulk(
+    items: List[Dict[str, Any]] = Body(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Crea hasta BULK_MAX_TASKS tareas en una sola petición y transacción.
+
+    Cada elemento se valida por separado: los inválidos se devuelven con sus
+    errores y no impiden crear el resto. Las tareas con idempotency_key ya
+    existente se devuelven como "replayed".
+    """
+    if len(items) > settings.BULK_MAX_TASKS:
+        raise HTTPException(status_code=413, detail=f"Máximo {settings.BULK_MAX_TASKS} tareas por petición.")
+
+    results: List[Optional[schemas.TaskBulkItemResult]] = [None] * len(items)
+    valid_indexes = []
+    valid_tasks = []
+    for index, item in enumerate(items):
+        try:
+            valid_tasks.append(schemas.TaskCreate.model_validate(item))
+            valid_indexes.append(index)
+        except ValidationError as e:
+            results[index] = schemas.TaskBulkItemResult(index=index, status="error", errors=_validation_errors(e))
+
+    now_utc = datetime.now(timezone.utc)
+    notify = any(_is_immediate(task, now_utc) for task in valid_tasks)
+    created = await async_crud.create_tasks_bulk(db, valid_tasks, notify=notify)
+    for index, (task_id, inserted) in zip(valid_indexes, created):
+        results[index] = schemas.TaskBulkItemResult(
+            index=index, status="created" if inserted else "replayed", id=task_id
+        )
+
+    created_count = sum(1 for _, inserted in created if inserted)
+    logger.info("Alta masiva: %s tareas creadas de %s recibidas", created_count, len(items))
+    return schemas.TaskBulkResponse(
+        created=created_count,
+        replayed=len(created) - created_count,
+        failed=len(items) - len(created),
+        results=results
+    )
+
+@app.post("/tasks/stream")
+async def schedule_tasks_stream(request: Request):
+    """
+    Alta masiva en streaming: recibe application/x-ndjson (una TaskCreate por
+    línea) y responde en NDJSON con un resultado por línea, terminando con
+    una línea "summary".
+
+    El cuerpo se lee a medida que llega y las tareas se escriben en bloques
+    de NDJSON_CHUNK_SIZE, cada uno en su propia transacción, así la memoria
+    no depende del tamaño de la carga. Si la conexión se corta, los bloques
+    ya confirmados se conservan: reenviar la carga con idempotency_key es
+    seguro.
+
+    Los resultados se guardan en un fichero temporal y se envían al terminar
+    la carga: los clientes HTTP/1.1 (n8n, curl, httpx) no leen la respuesta
+    hasta haber enviado todo el cuerpo, y responder antes bloquearía a ambos
+    lados en cuanto se llenaran los buffers del socket.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != "application/x-ndjson":
+        raise HTTPException(status_code=415, detail="Se espera Content-Type: application/x-ndjson.")
+    results = tempfile.SpooledTemporaryFile(max_size=settings.NDJSON_RESULTS_MEMORY_BYTES)
+    try:
+        async with AsyncSessionLocal() as db:
+            totals = await _ingest_ndjson(request, db, results)
+    except BaseException:
+        results.close()
+        raise
+    logger.info("Alta en streaming: %s tareas creadas, %s repetidas, %s con errores", totals['created'], totals['replayed'], totals['failed'])
+    results.write((json.dumps({"summary": totals}) + "\n").encode())
+    results.seek(0)
+    return StreamingResponse(_read_results(results), media_type="application/x-ndjson")
 
-    # La función create_task se encarga de guardar la nueva tarea en la BBDD.
-    return crud.create_task(db=db, task=task)
+def _read_results(results, chunk_size: int = 65536):
+    try:
+        while chunk := results.read(chunk_size):
+            yield chunk
+    finally:
+        results.close()
+
+async def _ndjson_lines(request: Request):
+    """
+    Líneas (número, bytes) del cuerpo a medida que llegan. Una línea mayor que
+    NDJSON_MAX_LINE_BYTES se entrega como None y se descarta sin acumularla.
+    """
+    buffer = b""
+    line_no = 0
+    skipping = False
+    async for chunk in request.stream():
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if skipping:
+                # Final de una línea demasiado larga, ya informada
+                skipping = False
+                continue
+            line_no += 1
+            yield line_no, line if len(line) <= settings.NDJSON_MAX_LINE_BYTES else None
+        if skipping:
+            buffer = b""
+        elif len(buffer) > settings.NDJSON_MAX_LINE_BYTES:
+            line_no += 1
+            yield line_no, None
+            buffer = b""
+            skipping = True
+    if buffer and not skipping:
+        yield line_no + 1, buffer
+
+async def _ingest_ndjson(request: Request, db: AsyncSession, results) -> Dict[str, int]:
+    """Procesa el cuerpo por bloques y escribe en results una línea por resultado."""
+    totals = {"created": 0, "replayed": 0, "failed": 0}
+    # Resultados del bloque en curso, en orden de línea: TaskCreate pendiente
+    # de insertar o el resultado ya resuelto (errores)
+    pending: List[tuple] = []
+
+    async def flush():
+        tasks = [item for _, item in pending if isinstance(item, schemas.TaskCreate)]
+        now_utc = datetime.now(timezone.utc)
+        notify = any(_is_immediate(task, now_utc) for task in tasks)
+        created = iter(await async_crud.create_tasks_bulk(db, tasks, notify) if tasks else [])
+        lines = []
+        for line_no, item in pending:
+            if isinstance(item, schemas.TaskCreate):
+                task_id, inserted = next(created)
+                status = "created" if inserted else "replayed"
+                result = schemas.TaskStreamLineResult(line=line_no, status=status, id=task_id)
+            else:
+                result = item
+            totals[result.status if result.status != "error" else "failed"] += 1
+            lines.append(result.model_dump_json(exclude_none=True))
+        pending.clear()
+        if lines:
+            results.write(("\n".join(lines) + "\n").encode())
+
+    async for line_no, line in _ndjson_lines(request):
+        if line is None:
+            pending.append((line_no, schemas.TaskStreamLineResult(
+                line=line_no, status="error",
+                errors=[{"msg": f"Línea mayor que {settings.NDJSON_MAX_LINE_BYTES} bytes", "type": "line_too_long"}]
+            )))
+        elif line.strip():
+            try:
+                pending.append((line_no, schemas.TaskCreate.model_validate(json.loads(line))))
+            except ValueError as e:
+                # json.JSONDecodeError y ValidationError heredan de ValueError
+                errors = _validation_errors(e) if isinstance(e, ValidationError) else [{"msg": str(e), "type": "json_invalid"}]
+                pending.append((line_no, schemas.TaskStreamLineResult(line=line_no, status="error", errors=errors)))
+        # Se cuentan también los errores: un cuerpo casi todo inválido no debe
+        # acumular sus resultados en memoria hasta el final
+        if len(pending) >= settings.NDJSON_CHUNK_SIZE:
+            await flush()
+    await flush()
+    return totals
+
+def _encode_cursor(scheduled_at: datetime, task_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([scheduled_at.isoformat(), task_id]).encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        scheduled_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(scheduled_at), int(task_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+
+@app.get("/tasks/", response_model=schemas.TaskPage)
+async def list_tasks(
+    status: Optional[List[schemas.TaskStatus]] = Query(None, description="Uno o varios estados"),
+    task_type: Optional[List[schemas.TaskType]] = Query(None, description="Uno o varios canales"),
+    target: Optional[str] = Query(None, description="Destinatario exacto"),
+    scheduled_from: Optional[datetime] = Query(None, description="scheduled_at >= scheduled_from"),
+    scheduled_to: Optional[datetime] = Query(None, description="scheduled_at < scheduled_to"),
+    limit: int = Query(100, ge=1, le=settings.TASKS_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+    descending: bool = Query(False, description="Más recientes primero"),
+    estimate: bool = Query(False, description="Incluir estimated_total (estimación, no un COUNT exacto)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Lista tareas ordenadas por (scheduled_at, id), con paginación por cursor.
+    Solo incluye la tabla tasks: las tareas archivadas están en tasks_archive.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    rows, estimated_total = await async_crud.list_tasks(
+        db, limit, after, descending, estimate,
+        statuses=status, task_types=task_type, target=target,
+        scheduled_from=scheduled_from, scheduled_to=scheduled_to
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].scheduled_at, rows[-1].id)
+    return schemas.TaskPage(
+        items=[schemas.TaskSummary.model_validate(row) for row in rows],
+        next_cursor=next_cursor,
+        estimated_total=estimated_total
+    )
+
+@app.get("/tasks/{task_id}", response_model=schemas.Task)
+async def get_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Detalle completo de una tarea."""
+    db_task = await async_crud.get_task(db, task_id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada.")
+    return db_task
 
 @app.get("/")
 def read_root():
     """Endpoint raíz para verificar que el servicio está activo."""
     return {"status": "N8N Helper Service is running!"}
 
+@app.get("/db/pool")
+def get_pool_stats():
+    """
+    Métricas de los pools de conexiones de este proceso de la API (conexiones
+    en uso, overflow e histograma de espera). Cada réplica del worker expone
+    las suyas en GET /pool del puerto WORKER_STATUS_PORT.
+    """
+    return pool_stats()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    Métricas Prometheus de este proceso: cola de tareas por tipo, latencia y
+    errores de los proveedores llamados desde la API. El retraso de envío y
+    los ciclos del worker están en GET /metrics del puerto WORKER_STATUS_PORT.
+    """
+    content_type, body = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 
 # La función de ayuda que tenías es útil para el futuro, la conservamos.
 # No se usa por ahora, pero podría ser activada con BackgroundTasks.
 def execute_task(task_data: schemas.TaskCreate):
     """Función que ejecuta la acción real de la tarea."""
     if task_data.task_type == schemas.TaskType.call:
-        print("Realizando llamada...")
+        logger.info("Realizando llamada...")
         # twilio_service.make_call(to_number=task_data.target, message=task_data.message)
     elif task_data.task_type == schemas.TaskType.sms:
-        print("Enviando SMS...")
+        logger.info("Enviando SMS...")
         # twilio_service.send_sms(to_number=task_data.target, message=task_data.message)
     # ... agregar lógica para otros tipos de tarea
\ No newline at end of file
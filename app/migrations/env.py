@@ -0,0 +1,57 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+import models
+from core.config import settings
+
+# Migraciones del esquema (Alembic). Sustituyen al create_all que hacían la
+# API y los workers al importarse: alembic upgrade head, desde app/.
+#
+# Las migraciones deben poder aplicarse con la aplicación en marcha:
+# - los índices sobre tasks se crean con CREATE INDEX CONCURRENTLY (dentro de
+#   op.get_context().autocommit_block()), que no bloquea las escrituras;
+# - lock_timeout hace que un ALTER TABLE que no consigue su lock falle en
+#   lugar de quedarse en cola bloqueando detrás de él todos los INSERT.
+
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name)
+
+target_metadata = models.Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Las particiones mensuales de tasks_archive las crea el archivador y no
+    # están en los modelos: autogenerate no debe proponer borrarlas
+    return not (type_ == "table" and reflected and compare_to is None and name.startswith("tasks_archive_"))
+
+
+def run_migrations_offline():
+    context.configure(
+        url=settings.DATABASE_URL,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connect_args = {}
+    if settings.MIGRATION_LOCK_TIMEOUT_MS:
+        connect_args["options"] = f"-c lock_timeout={settings.MIGRATION_LOCK_TIMEOUT_MS}"
+    engine = create_engine(settings.DATABASE_LISTEN_URL or settings.DATABASE_URL,
+                           poolclass=pool.NullPool, connect_args=connect_args)
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
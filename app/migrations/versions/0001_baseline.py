@@ -0,0 +1,50 @@
+"""Esquema inicial (el que creaba create_all antes de usar migraciones)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las bases de datos creadas con create_all ya tienen la tabla: en ese
+    # caso basta con marcar esta revisión (no se toca nada)
+    if sa.inspect(op.get_bind()).has_table("tasks"):
+        return
+
+    task_type = postgresql.ENUM(
+        "call", "sms", "whatsapp", "email", "calendar_event", "outlook_event",
+        name="tasktype", create_type=False
+    )
+    task_status = postgresql.ENUM("pending", "done", "failed", name="taskstatus", create_type=False)
+    task_type.create(op.get_bind(), checkfirst=True)
+    task_status.create(op.get_bind(), checkfirst=True)
+
+    op.create_table(
+        "tasks",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("target", sa.String(), nullable=False),
+        sa.Column("message", sa.String(), nullable=False),
+        sa.Column("task_type", task_type, nullable=False),
+        sa.Column("status", task_status, nullable=False),
+        sa.Column("scheduled_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("extra_data", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_tasks_id", "tasks", ["id"])
+    op.create_index("ix_tasks_target", "tasks", ["target"])
+
+
+def downgrade():
+    op.drop_table("tasks")
+    op.execute("DROP TYPE IF EXISTS taskstatus")
+    op.execute("DROP TYPE IF EXISTS tasktype")
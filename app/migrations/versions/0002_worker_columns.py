@@ -0,0 +1,57 @@
+"""Columnas del worker (reclamo, leases, reintentos), idempotencia y rate limits
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Columnas añadidas a tasks después del esquema inicial. Las bases creadas con
+# create_all pueden tener ya algunas: todo va con IF NOT EXISTS. Ninguna
+# reescribe la tabla (nullable o con DEFAULT constante), así que el
+# ALTER TABLE solo necesita el lock un instante.
+TASK_COLUMNS = [
+    ("idempotency_key", "VARCHAR(255)"),
+    ("claimed_by", "VARCHAR"),
+    ("claimed_at", "TIMESTAMP WITH TIME ZONE"),
+    ("lease_expires_at", "TIMESTAMP WITH TIME ZONE"),
+    ("dispatched_at", "TIMESTAMP WITH TIME ZONE"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("max_attempts", "INTEGER NOT NULL DEFAULT 5"),
+    ("next_attempt_at", "TIMESTAMP WITH TIME ZONE"),
+    ("last_error", "TEXT"),
+]
+
+
+def upgrade():
+    # ALTER TYPE ... ADD VALUE no puede usarse en la misma transacción que lo
+    # añade, así que va fuera de ella
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE taskstatus ADD VALUE IF NOT EXISTS 'processing' AFTER 'pending'")
+        op.execute("ALTER TYPE taskstatus ADD VALUE IF NOT EXISTS 'retrying' AFTER 'processing'")
+
+    op.execute(
+        "ALTER TABLE tasks "
+        + ", ".join(f"ADD COLUMN IF NOT EXISTS {name} {definition}" for name, definition in TASK_COLUMNS)
+    )
+
+    if not sa.inspect(op.get_bind()).has_table("provider_rate_limits"):
+        op.create_table(
+            "provider_rate_limits",
+            sa.Column("provider", sa.String(), primary_key=True),
+            sa.Column("tokens", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("blocked_until", sa.DateTime(timezone=True), nullable=True),
+        )
+
+
+def downgrade():
+    # Postgres no permite quitar valores de un enum: processing y retrying se quedan
+    op.drop_table("provider_rate_limits")
+    op.execute("ALTER TABLE tasks " + ", ".join(f"DROP COLUMN IF EXISTS {name}" for name, _ in TASK_COLUMNS))
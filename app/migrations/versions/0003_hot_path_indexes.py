@@ -0,0 +1,78 @@
+"""Índices del reclamo de tareas, de los reportes y de idempotency_key
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Todos se crean con CONCURRENTLY para no bloquear los INSERT en una tabla
+# tasks en uso. Deben coincidir con los de models.Task.
+INDEXES = [
+    # Unicidad de las claves de idempotencia (ON CONFLICT (idempotency_key));
+    # mismo nombre que la restricción que crea create_all
+    ("tasks_idempotency_key_key", "CREATE UNIQUE INDEX CONCURRENTLY tasks_idempotency_key_key ON tasks (idempotency_key)"),
+    # Reclamo de las tareas pendientes vencidas, en orden (scheduled_at, id)
+    ("ix_tasks_pending_scheduled_at",
+     "CREATE INDEX CONCURRENTLY ix_tasks_pending_scheduled_at ON tasks (status, scheduled_at, id) "
+     "WHERE status = 'pending'"),
+    # Reintentos vencidos
+    ("ix_tasks_retrying_next_attempt_at",
+     "CREATE INDEX CONCURRENTLY ix_tasks_retrying_next_attempt_at ON tasks (next_attempt_at, id) "
+     "WHERE status = 'retrying'"),
+    # Leases de las tareas en curso (reaper)
+    ("ix_tasks_processing_lease_expires_at",
+     "CREATE INDEX CONCURRENTLY ix_tasks_processing_lease_expires_at ON tasks (lease_expires_at) "
+     "WHERE status = 'processing'"),
+    # Reportes por estado y fecha de la última actualización
+    ("ix_tasks_status_updated_at", "CREATE INDEX CONCURRENTLY ix_tasks_status_updated_at ON tasks (status, updated_at)"),
+]
+
+
+def _index_state(name):
+    """None si el índice no existe, si no su indisvalid."""
+    return op.get_bind().exec_driver_sql(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = %(name)s AND c.relnamespace = current_schema()::regnamespace",
+        {"name": name}
+    ).scalar()
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, create_sql in INDEXES:
+            valid = _index_state(name)
+            if valid:
+                continue
+            if valid is not None:
+                # Un CREATE INDEX CONCURRENTLY interrumpido deja el índice
+                # marcado como inválido: se borra y se vuelve a crear
+                op.execute(f"DROP INDEX CONCURRENTLY {name}")
+            op.execute(create_sql)
+
+    # create_all declara idempotency_key como restricción UNIQUE: se asocia
+    # al índice ya creado, sin volver a recorrer la tabla
+    if not _is_constraint("tasks_idempotency_key_key"):
+        op.execute(
+            "ALTER TABLE tasks ADD CONSTRAINT tasks_idempotency_key_key "
+            "UNIQUE USING INDEX tasks_idempotency_key_key"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            if name == "tasks_idempotency_key_key":
+                op.execute(f"ALTER TABLE tasks DROP CONSTRAINT IF EXISTS {name}")
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _is_constraint(name):
+    return op.get_bind().exec_driver_sql(
+        "SELECT 1 FROM pg_constraint WHERE conname = %(name)s", {"name": name}
+    ).scalar() is not None
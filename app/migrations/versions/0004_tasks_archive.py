@@ -0,0 +1,51 @@
+"""Tabla tasks_archive particionada por mes para las tareas terminadas
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tabla nueva: no bloquea tasks. Las particiones mensuales las crea el
+    # archivador cuando las necesita (crud.ensure_archive_partitions).
+    task_type = postgresql.ENUM(name="tasktype", create_type=False)
+    task_status = postgresql.ENUM(name="taskstatus", create_type=False)
+    op.create_table(
+        "tasks_archive",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("target", sa.String(), nullable=False),
+        sa.Column("message", sa.String(), nullable=False),
+        sa.Column("task_type", task_type, nullable=False),
+        sa.Column("status", task_status, nullable=False),
+        sa.Column("scheduled_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("extra_data", sa.JSON(), nullable=True),
+        sa.Column("idempotency_key", sa.String(length=255), nullable=True),
+        sa.Column("claimed_by", sa.String(), nullable=True),
+        sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("dispatched_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("id", "scheduled_at"),
+        postgresql_partition_by="RANGE (scheduled_at)",
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    # Borra también todas las particiones y lo archivado en ellas
+    op.drop_table("tasks_archive")
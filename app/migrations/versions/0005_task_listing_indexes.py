@@ -0,0 +1,40 @@
+"""Índices del listado de tareas (keyset sobre scheduled_at, id)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_tasks_scheduled_at_id", "CREATE INDEX CONCURRENTLY ix_tasks_scheduled_at_id ON tasks (scheduled_at, id)"),
+    ("ix_tasks_status_scheduled_at_id",
+     "CREATE INDEX CONCURRENTLY ix_tasks_status_scheduled_at_id ON tasks (status, scheduled_at, id)"),
+]
+
+
+def upgrade():
+    # Igual que en 0003: CONCURRENTLY, rehaciendo los que quedaron inválidos
+    with op.get_context().autocommit_block():
+        for name, create_sql in INDEXES:
+            valid = op.get_bind().exec_driver_sql(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = %(name)s AND c.relnamespace = current_schema()::regnamespace",
+                {"name": name}
+            ).scalar()
+            if valid:
+                continue
+            if valid is not None:
+                op.execute(f"DROP INDEX CONCURRENTLY {name}")
+            op.execute(create_sql)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,48 @@
+"""Tabla recurring_tasks para los recordatorios recurrentes (cron / RRULE)
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    task_type = postgresql.ENUM(name="tasktype", create_type=False)
+    op.create_table(
+        "recurring_tasks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("target", sa.String(), nullable=False),
+        sa.Column("message", sa.String(), nullable=False),
+        sa.Column("task_type", task_type, nullable=False),
+        sa.Column("extra_data", sa.JSON(), nullable=True),
+        sa.Column("max_attempts", sa.Integer(), server_default="5", nullable=False),
+        sa.Column("cron", sa.String(), nullable=True),
+        sa.Column("rrule", sa.Text(), nullable=True),
+        sa.Column("timezone", sa.String(), server_default="UTC", nullable=False),
+        sa.Column("starts_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("ends_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("active", sa.Boolean(), server_default="true", nullable=False),
+        sa.Column("next_run_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # Tabla nueva y vacía: el índice no necesita CONCURRENTLY
+    op.create_index(
+        "ix_recurring_tasks_active_next_run_at", "recurring_tasks", ["next_run_at"],
+        postgresql_where=sa.text("active IS true")
+    )
+
+
+def downgrade():
+    # Las Task ya materializadas se conservan
+    op.drop_index("ix_recurring_tasks_active_next_run_at", table_name="recurring_tasks")
+    op.drop_table("recurring_tasks")
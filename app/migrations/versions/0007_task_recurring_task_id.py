@@ -0,0 +1,65 @@
+"""Columna tasks.recurring_task_id (ocurrencias de cada tarea recurrente)
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = "ix_tasks_recurring_task_id"
+CREATE_INDEX = (
+    f"CREATE INDEX CONCURRENTLY {INDEX_NAME} ON tasks (recurring_task_id) "
+    "WHERE recurring_task_id IS NOT NULL"
+)
+
+
+def upgrade():
+    # Columna nullable sin DEFAULT: no reescribe ninguna de las dos tablas.
+    # tasks_archive la necesita porque el archivador copia todas las columnas.
+    op.execute("ALTER TABLE tasks ADD COLUMN IF NOT EXISTS recurring_task_id INTEGER")
+    op.execute("ALTER TABLE tasks_archive ADD COLUMN IF NOT EXISTS recurring_task_id INTEGER")
+    # NOT VALID: la FK se comprueba desde ya en las filas nuevas sin recorrer
+    # la tabla con el lock del ALTER; el VALIDATE de después no bloquea escrituras.
+    # Las bases creadas con create_all ya la tienen.
+    has_fkey = op.get_bind().exec_driver_sql(
+        "SELECT 1 FROM pg_constraint WHERE conname = 'tasks_recurring_task_id_fkey' "
+        "AND conrelid = 'tasks'::regclass"
+    ).scalar()
+    if not has_fkey:
+        op.execute(
+            "ALTER TABLE tasks ADD CONSTRAINT tasks_recurring_task_id_fkey "
+            "FOREIGN KEY (recurring_task_id) REFERENCES recurring_tasks (id) ON DELETE SET NULL NOT VALID"
+        )
+    # Ocurrencias materializadas antes de esta revisión: el id sale de su
+    # idempotency_key (recurring:<id>:<fecha UTC>)
+    op.execute(
+        "UPDATE tasks t SET recurring_task_id = r.id FROM recurring_tasks r "
+        "WHERE t.idempotency_key LIKE 'recurring:%' AND t.recurring_task_id IS NULL "
+        "AND split_part(t.idempotency_key, ':', 2) = r.id::text"
+    )
+    op.execute("ALTER TABLE tasks VALIDATE CONSTRAINT tasks_recurring_task_id_fkey")
+
+    # Igual que en 0003 y 0005: CONCURRENTLY, rehaciéndolo si quedó inválido
+    with op.get_context().autocommit_block():
+        valid = op.get_bind().exec_driver_sql(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = %(name)s AND c.relnamespace = current_schema()::regnamespace",
+            {"name": INDEX_NAME}
+        ).scalar()
+        if not valid:
+            if valid is not None:
+                op.execute(f"DROP INDEX CONCURRENTLY {INDEX_NAME}")
+            op.execute(CREATE_INDEX)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+    op.execute("ALTER TABLE tasks DROP CONSTRAINT IF EXISTS tasks_recurring_task_id_fkey")
+    op.execute("ALTER TABLE tasks DROP COLUMN IF EXISTS recurring_task_id")
+    op.execute("ALTER TABLE tasks_archive DROP COLUMN IF EXISTS recurring_task_id")
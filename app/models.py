@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, JSON
+from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, Enum, JSON, Index, PrimaryKeyConstraint, ForeignKey
 from sqlalchemy.sql import func
 from database import Base
 from schemas import TaskStatus, TaskType
@@ -13,5 +13,137 @@ class Task(Base):
     status = Column(Enum(TaskStatus), default=TaskStatus.pending, nullable=False)
     scheduled_at = Column(DateTime(timezone=True), nullable=False)
     extra_data = Column(JSON, nullable=True)
+    # Clave enviada por el cliente (Idempotency-Key); una tarea por clave
+    idempotency_key = Column(String(255), nullable=True, unique=True)
+    # Definición de la que se materializó (worker/recurring.py); se pone a
+    # NULL al borrarla, conservando las ocurrencias ya enviadas
+    recurring_task_id = Column(Integer, ForeignKey("recurring_tasks.id", ondelete="SET NULL"), nullable=True)
+    # Worker que reclamó la tarea (status=processing) y cuándo lo hizo
+    claimed_by = Column(String, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    # El worker renueva el lease mientras la tarea está en processing; si
+    # vence (worker caído) el reaper la recupera
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    # Momento en que se inició la petición al proveedor en los canales
+    # "at-most-once" (AT_MOST_ONCE_TASK_TYPES)
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+    # Reintentos ante errores transitorios (status=retrying)
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    max_attempts = Column(Integer, default=5, server_default="5", nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    __table_args__ = (
+        # Índice parcial para el reclamo de tareas vencidas: solo cubre las
+        # pendientes y sigue el orden (scheduled_at, id) con el que se leen.
+        Index(
+            "ix_tasks_pending_scheduled_at",
+            status, scheduled_at, id,
+            postgresql_where=(status == TaskStatus.pending)
+        ),
+        # Ídem para los reintentos, que vencen según next_attempt_at
+        Index(
+            "ix_tasks_retrying_next_attempt_at",
+            next_attempt_at, id,
+            postgresql_where=(status == TaskStatus.retrying)
+        ),
+        # Leases de las tareas en curso, para el reaper
+        Index(
+            "ix_tasks_processing_lease_expires_at",
+            lease_expires_at,
+            postgresql_where=(status == TaskStatus.processing)
+        ),
+        # Reportes por estado y fecha de la última actualización
+        Index("ix_tasks_status_updated_at", status, updated_at),
+        # Listado GET /tasks/ por keyset (scheduled_at, id), con y sin filtro de estado
+        Index("ix_tasks_scheduled_at_id", scheduled_at, id),
+        Index("ix_tasks_status_scheduled_at_id", status, scheduled_at, id),
+        # Ocurrencias de una recurrencia, al borrarla (y para el ON DELETE de la FK)
+        Index(
+            "ix_tasks_recurring_task_id",
+            recurring_task_id,
+            postgresql_where=(recurring_task_id.isnot(None))
+        ),
+    )
+
+class RecurringTask(Base):
+    """
+    Definición de una tarea que se repite (cron o RRULE en su zona horaria).
+    El worker no crea todas las ocurrencias por adelantado: materializa como
+    Task solo las que caen dentro de RECURRING_LOOKAHEAD_SECONDS y avanza
+    next_run_at (ver worker/recurring.py).
+    """
+    __tablename__ = "recurring_tasks"
+
+    id = Column(Integer, primary_key=True)
+    target = Column(String, nullable=False)
+    message = Column(String, nullable=False)
+    task_type = Column(Enum(TaskType), nullable=False)
+    extra_data = Column(JSON, nullable=True)
+    max_attempts = Column(Integer, default=5, server_default="5", nullable=False)
+    # Exactamente uno de los dos
+    cron = Column(String, nullable=True)
+    rrule = Column(Text, nullable=True)
+    timezone = Column(String, default="UTC", server_default="UTC", nullable=False)
+    starts_at = Column(DateTime(timezone=True), nullable=False)
+    ends_at = Column(DateTime(timezone=True), nullable=True)
+    active = Column(Boolean, default=True, server_default="true", nullable=False)
+    # Próxima ocurrencia aún no materializada; None cuando la recurrencia terminó
+    next_run_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    __table_args__ = (
+        Index(
+            "ix_recurring_tasks_active_next_run_at",
+            next_run_at,
+            postgresql_where=(active.is_(True))
+        ),
+    )
+
+class TaskArchive(Base):
+    """
+    Tareas terminadas (done/failed) que el archivador (worker/archiver.py)
+    sacó de tasks. Particionada por mes de scheduled_at: las particiones
+    antiguas se pueden exportar y borrar enteras sin tocar el resto.
+    """
+    __tablename__ = "tasks_archive"
+
+    id = Column(Integer, nullable=False)
+    target = Column(String, nullable=False)
+    message = Column(String, nullable=False)
+    task_type = Column(Enum(TaskType), nullable=False)
+    status = Column(Enum(TaskStatus), nullable=False)
+    scheduled_at = Column(DateTime(timezone=True), nullable=False)
+    extra_data = Column(JSON, nullable=True)
+    idempotency_key = Column(String(255), nullable=True)
+    recurring_task_id = Column(Integer, nullable=True)
+    claimed_by = Column(String, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False)
+    max_attempts = Column(Integer, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # En una tabla particionada la clave primaria debe incluir la de partición
+        PrimaryKeyConstraint(id, scheduled_at),
+        {"postgresql_partition_by": "RANGE (scheduled_at)"},
+    )
+
+class ProviderRateLimit(Base):
+    """Estado compartido del token bucket de cada proveedor (RATE_LIMIT_BACKEND=database)."""
+    __tablename__ = "provider_rate_limits"
+
+    provider = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Hasta cuándo el proveedor pidió no enviar más (Retry-After)
+    blocked_until = Column(DateTime(timezone=True), nullable=True)
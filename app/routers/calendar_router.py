@@ -1,9 +1,11 @@
+import logging
 from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 
-from database import get_db
+from database import get_db, get_async_db
 from schemas import (
     CalendarEventCreate, 
     CalendarEventUpdate, 
@@ -13,7 +15,10 @@ from schemas import (
     Task
 )
 from services import google_calendar_service, email_service
-import crud
+import async_crud
+from crud import in_scheduler_window
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/calendar",
@@ -65,7 +70,7 @@ def create_calendar_event(
                         body=email_body
                     )
                 except Exception as e:
-                    print(f"Error al enviar correo a {attendee_email}: {e}")
+                    logger.warning("Error al enviar correo a %s: %s", attendee_email, e)
 
         return CalendarEventResponse(**result)
 
@@ -73,10 +78,10 @@ def create_calendar_event(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/events/schedule/", response_model=Task, status_code=201)
-def schedule_calendar_event(
+async def schedule_calendar_event(
     event: CalendarEventCreate,
     scheduled_at: datetime,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Programa un evento de calendario para ser creado en el futuro.
@@ -102,7 +107,8 @@ def schedule_calendar_event(
         }
     )
     
-    return crud.create_task(db=db, task=task_data)
+    # Como en POST /tasks/, se avisa a los workers en modo "timer" si vence pronto
+    return await async_crud.create_task(db=db, task=task_data, notify=in_scheduler_window(task_data.scheduled_at))
 
 @router.get("/events/{event_id}", response_model=CalendarEventResponse)
 def get_calendar_event(
@@ -1,9 +1,11 @@
+import logging
 from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 
-from database import get_db
+from database import get_db, get_async_db
 from schemas import (
     OutlookEventCreate,
     OutlookEventUpdate,
@@ -14,7 +16,10 @@ from schemas import (
     Task
 )
 from services import outlook_calendar_service, email_service
-import crud
+import async_crud
+from crud import in_scheduler_window
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/outlook/calendar",
@@ -75,7 +80,7 @@ def create_outlook_event(
                         body=email_body
                     )
                 except Exception as e:
-                    print(f"Error al enviar correo adicional a {attendee_email}: {e}")
+                    logger.warning("Error al enviar correo adicional a %s: %s", attendee_email, e)
 
         return OutlookEventResponse(**result)
 
@@ -83,10 +88,10 @@ def create_outlook_event(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/events/schedule/", response_model=Task, status_code=201)
-def schedule_outlook_event(
+async def schedule_outlook_event(
     event: OutlookEventCreate,
     scheduled_at: datetime,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Programa un evento de Outlook para ser creado en el futuro.
@@ -115,7 +120,8 @@ def schedule_outlook_event(
         }
     )
     
-    return crud.create_task(db=db, task=task_data)
+    # Como en POST /tasks/, se avisa a los workers en modo "timer" si vence pronto
+    return await async_crud.create_task(db=db, task=task_data, notify=in_scheduler_window(task_data.scheduled_at))
 
 @router.get("/events/{event_id}", response_model=OutlookEventResponse)
 def get_outlook_event(event_id: str):
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from typing import List
+
+from schemas import CircuitState
+from services.providers import circuit_states
+
+router = APIRouter(
+    prefix="/providers",
+    tags=["providers"],
+)
+
+@router.get("/circuits", response_model=List[CircuitState])
+def get_circuits():
+    """
+    Estado de los circuit breakers de los proveedores en este proceso de la API.
+    Cada réplica del worker expone los suyos en GET /circuits del puerto
+    WORKER_STATUS_PORT.
+    """
+    return circuit_states()
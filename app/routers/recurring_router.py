@@ -0,0 +1,44 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from database import get_async_db
+from schemas import RecurringTask, RecurringTaskCreate
+import async_crud
+
+router = APIRouter(
+    prefix="/recurring-tasks",
+    tags=["recurring-tasks"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.post("/", response_model=RecurringTask, status_code=201)
+async def create_recurring_task(definition: RecurringTaskCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Programa un recordatorio recurrente con una expresión cron de 5 campos o
+    una RRULE, interpretadas en timezone. El worker crea cada ocurrencia como
+    una tarea normal poco antes de que toque (RECURRING_LOOKAHEAD_SECONDS).
+    """
+    return await async_crud.create_recurring_task(db, definition)
+
+@router.get("/", response_model=List[RecurringTask])
+async def list_recurring_tasks(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    active: Optional[bool] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await async_crud.list_recurring_tasks(db, skip=skip, limit=limit, active=active)
+
+@router.get("/{recurring_id}", response_model=RecurringTask)
+async def get_recurring_task(recurring_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_definition = await async_crud.get_recurring_task(db, recurring_id)
+    if db_definition is None:
+        raise HTTPException(status_code=404, detail="Tarea recurrente no encontrada.")
+    return db_definition
+
+@router.delete("/{recurring_id}", status_code=204)
+async def delete_recurring_task(recurring_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Deja de generar ocurrencias y cancela las ya creadas que siguen pendientes."""
+    if not await async_crud.delete_recurring_task(db, recurring_id):
+        raise HTTPException(status_code=404, detail="Tarea recurrente no encontrada.")
@@ -1,8 +1,10 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
 
+from services.recurrence import validate_schedule
+
 
 class TaskType(str, Enum):
     call = "call"
@@ -14,6 +16,8 @@ class TaskType(str, Enum):
 
 class TaskStatus(str, Enum):
     pending = "pending"
+    processing = "processing"
+    retrying = "retrying"
     done = "done"
     failed = "failed"
 
@@ -23,10 +27,15 @@ class TaskCreate(BaseModel):
     task_type: TaskType
     scheduled_at: datetime = Field(default_factory=datetime.utcnow, description="Fecha y hora UTC para ejecutar la tarea.")
     extra_data: Optional[Dict[str, Any]] = None # Para datos adicionales como el título de un evento de calendario
+    max_attempts: int = Field(5, ge=1, le=20, description="Intentos máximos ante errores transitorios del proveedor.")
+    idempotency_key: Optional[str] = Field(None, max_length=255, description="Clave para que los reintentos del cliente no dupliquen la tarea (también se acepta la cabecera Idempotency-Key).")
 
 class Task(TaskCreate):
     id: int
     status: TaskStatus
+    attempts: int = 0
+    next_attempt_at: Optional[datetime] = None
+    last_error: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -109,4 +118,89 @@ class FreeBusyRequest(BaseModel):
     start_time: datetime = Field(..., example="2024-01-15T08:00:00")
     end_time: datetime = Field(..., example="2024-01-15T18:00:00")
     interval_minutes: int = Field(30, example=30)
-    timezone: str = Field("UTC", example="America/Mexico_City", description="Zona horaria para la consulta")
\ No newline at end of file
+    timezone: str = Field("UTC", example="America/Mexico_City", description="Zona horaria para la consulta")
+class CircuitState(BaseModel):
+    provider: str
+    state: str = Field(..., example="closed", description="closed, open o half_open")
+    calls: int
+    failures: int
+    failure_rate: float
+    retry_after_seconds: float
+
+class TaskBulkItemResult(BaseModel):
+    index: int = Field(..., description="Posición de la tarea en la lista enviada.")
+    status: str = Field(..., example="created", description="created, replayed o error")
+    id: Optional[int] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+class TaskBulkResponse(BaseModel):
+    created: int
+    replayed: int
+    failed: int
+    results: List[TaskBulkItemResult]
+
+class TaskStreamLineResult(BaseModel):
+    line: int = Field(..., description="Número de línea en el cuerpo NDJSON.")
+    status: str = Field(..., example="created", description="created, replayed o error")
+    id: Optional[int] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+class TaskSummary(BaseModel):
+    """Proyección ligera de una tarea para los listados."""
+    id: int
+    target: str
+    task_type: TaskType
+    status: TaskStatus
+    scheduled_at: datetime
+    attempts: int
+    last_error: Optional[str] = None
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class TaskPage(BaseModel):
+    items: List[TaskSummary]
+    next_cursor: Optional[str] = Field(None, description="Se pasa como cursor para obtener la página siguiente; null en la última.")
+    estimated_total: Optional[int] = Field(None, description="Estimación del planificador de Postgres (solo con estimate=true).")
+
+class RecurringTaskCreate(BaseModel):
+    target: str = Field(..., example="+1234567890")
+    message: str = Field(..., example="Recordatorio: tomar la medicación.")
+    task_type: TaskType
+    extra_data: Optional[Dict[str, Any]] = None
+    max_attempts: int = Field(5, ge=1, le=20)
+    cron: Optional[str] = Field(None, example="0 9 * * 1-5", description="Expresión cron de 5 campos (minuto hora día mes día_de_la_semana).")
+    rrule: Optional[str] = Field(None, example="FREQ=WEEKLY;BYDAY=MO,WE;BYHOUR=9;BYMINUTE=0", description="RRULE (RFC 5545), sin DTSTART.")
+    timezone: str = Field("UTC", example="America/Mexico_City", description="Zona horaria en la que se interpreta cron o rrule.")
+    starts_at: Optional[datetime] = Field(None, description="Inicio de la recurrencia (por defecto, ahora). En una RRULE fija también la hora por defecto.")
+    ends_at: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def _check_schedule(self):
+        validate_schedule(self.cron, self.rrule, self.timezone, self.starts_at)
+        return self
+
+class RecurringOccurrence(TaskCreate):
+    """Task materializada de una definición recurrente (uso interno, no se expone en la API)."""
+    recurring_task_id: int
+
+class RecurringTask(BaseModel):
+    id: int
+    target: str
+    message: str
+    task_type: TaskType
+    extra_data: Optional[Dict[str, Any]] = None
+    max_attempts: int
+    cron: Optional[str] = None
+    rrule: Optional[str] = None
+    timezone: str
+    starts_at: datetime
+    ends_at: Optional[datetime] = None
+    active: bool
+    next_run_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
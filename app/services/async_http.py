@@ -0,0 +1,27 @@
+import httpx
+from typing import Optional
+from core.config import settings
+
+# Cliente HTTP asíncrono compartido por el worker asyncio (Evolution API y
+# Microsoft Graph). Reutiliza conexiones keep-alive entre peticiones.
+_client: Optional[httpx.AsyncClient] = None
+
+def get_async_client() -> httpx.AsyncClient:
+    """Devuelve el cliente httpx compartido, creándolo la primera vez."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=settings.ASYNC_HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+async def aclose_async_client():
+    """Cierra el cliente compartido (al apagar el worker)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
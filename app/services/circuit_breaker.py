@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker por proveedor.
+#
+# closed: las peticiones pasan y se registra su resultado en una ventana de
+#   CIRCUIT_BREAKER_WINDOW_SECONDS. Si hay al menos CIRCUIT_BREAKER_MIN_CALLS
+#   y la proporción de fallos llega a CIRCUIT_BREAKER_FAILURE_RATE, se abre.
+# open: no se llama al proveedor durante CIRCUIT_BREAKER_OPEN_SECONDS; las
+#   tareas de ese canal se difieren en lugar de esperar un timeout completo.
+# half_open: pasado ese tiempo se deja pasar una única petición de prueba; si
+#   va bien el circuito se cierra y si falla vuelve a abrirse.
+#
+# Solo cuentan como fallo los errores transitorios (5xx, timeouts, errores de
+# conexión); un 4xx indica que el proveedor responde. El estado es propio de
+# cada proceso.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+
+    def __init__(self, provider: str, window_seconds: float, min_calls: int, failure_rate: float, open_seconds: float):
+        self.provider = provider
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._calls = deque()  # (instante, ok)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> float:
+        """Devuelve 0 si se puede llamar al proveedor, o los segundos a esperar."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    return remaining
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    return self.open_seconds
+                self._probe_in_flight = True
+            return 0.0
+
+    def retry_after(self) -> float:
+        """Como allow, pero sin reservar la petición de prueba."""
+        with self._lock:
+            if self.state == OPEN:
+                return max(self._opened_at + self.open_seconds - time.monotonic(), 0.0)
+            if self.state == HALF_OPEN and self._probe_in_flight:
+                return self.open_seconds
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._close()
+            else:
+                self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+            self._record(False)
+            calls = len(self._calls)
+            if self.state == CLOSED and calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+                self._open()
+
+    def release(self):
+        """La petición no llegó a hacerse (o se canceló): libera la prueba."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            calls = len(self._calls)
+            return {
+                "provider": self.provider,
+                "state": self.state,
+                "calls": calls,
+                "failures": self._failures,
+                "failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+                "retry_after_seconds": round(max(self._opened_at + self.open_seconds - time.monotonic(), 0.0), 1)
+                if self.state == OPEN else 0.0,
+            }
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._calls.append((now, ok))
+        if not ok:
+            self._failures += 1
+        self._trim(now)
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            _, ok = self._calls.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        logger.warning("Circuito de %s abierto durante %ss", self.provider, self.open_seconds)
+
+    def _close(self):
+        self.state = CLOSED
+        self._calls.clear()
+        self._failures = 0
+        self._probe_in_flight = False
+        logger.info("Circuito de %s cerrado", self.provider)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """Devuelve (creándolo la primera vez) el circuit breaker del proveedor."""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider,
+                settings.CIRCUIT_BREAKER_WINDOW_SECONDS,
+                settings.CIRCUIT_BREAKER_MIN_CALLS,
+                settings.CIRCUIT_BREAKER_FAILURE_RATE,
+                settings.CIRCUIT_BREAKER_OPEN_SECONDS
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+
+def breaker_states(providers: List[str]) -> List[dict]:
+    """Estado actual de los circuitos de los proveedores indicados."""
+    return [get_breaker(provider).snapshot() for provider in providers]
@@ -1,11 +1,20 @@
+import logging
+import asyncio
+import httpx
 import msal
 import requests
 from core.config import settings
+from .async_http import get_async_client
+from .providers import MICROSOFT_GRAPH, provider_call, provider_call_async
+
+logger = logging.getLogger(__name__)
 
 # La URL de la autoridad de Microsoft para obtener tokens
-AUTHORITY = f"https://login.microsoftonline.com/{settings.OUTLOOK_TENANT_ID}"
+AUTHORITY = f"{settings.MICROSOFT_LOGIN_URL.rstrip('/')}/{settings.OUTLOOK_TENANT_ID}"
 # El "alcance" o permiso que solicitamos. '.default' usa los permisos asignados en Azure.
 SCOPE = ["https://graph.microsoft.com/.default"]
+# La URL base de Microsoft Graph
+GRAPH_API_BASE = settings.MICROSOFT_GRAPH_URL.rstrip("/")
 
 # Creamos una instancia de la aplicación cliente confidencial.
 # Podemos reutilizar esta instancia.
@@ -13,6 +22,9 @@ msal_app = msal.ConfidentialClientApplication(
     client_id=settings.OUTLOOK_CLIENT_ID,
     authority=AUTHORITY,
     client_credential=settings.OUTLOOK_CLIENT_SECRET,
+    # La instance discovery consulta siempre login.microsoftonline.com; con
+    # otra autoridad (el simulador) se omite
+    instance_discovery=settings.MICROSOFT_LOGIN_URL.rstrip("/") == "https://login.microsoftonline.com",
 )
 
 def _get_access_token():
@@ -23,31 +35,18 @@ def _get_access_token():
     result = msal_app.acquire_token_silent(scopes=SCOPE, account=None)
     
     if not result:
-        print("No se encontró un token en caché, solicitando uno nuevo...")
+        logger.info("No se encontró un token en caché, solicitando uno nuevo...")
         result = msal_app.acquire_token_for_client(scopes=SCOPE)
     
     if "access_token" in result:
         return result['access_token']
     else:
-        print("Error al adquirir el token:", result.get("error_description"))
+        logger.error("Error al adquirir el token: %s", result.get("error_description"))
         raise Exception("No se pudo obtener el token de acceso para Microsoft Graph.")
 
-def send_email(to_email: str, subject: str, body: str):
-    """
-    Envía un correo electrónico usando la API de Microsoft Graph.
-    """
-    access_token = _get_access_token()
-    
-    # Endpoint de la API de Graph para enviar correos desde la cuenta del usuario especificado
-    url = f"https://graph.microsoft.com/v1.0/users/{settings.OUTLOOK_SENDER_EMAIL}/sendMail"
-    
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
-    
-    # El cuerpo del correo en el formato que espera la API de Graph
-    email_payload = {
+def _build_email_payload(to_email: str, subject: str, body: str):
+    """Cuerpo del correo en el formato que espera la API de Graph."""
+    return {
         'message': {
             'subject': subject,
             'body': {
@@ -64,14 +63,57 @@ def send_email(to_email: str, subject: str, body: str):
         },
         'saveToSentItems': 'true'
     }
+
+def send_email(to_email: str, subject: str, body: str):
+    """
+    Envía un correo electrónico usando la API de Microsoft Graph.
+    """
+    access_token = _get_access_token()
+    
+    # Endpoint de la API de Graph para enviar correos desde la cuenta del usuario especificado
+    url = f"{GRAPH_API_BASE}/users/{settings.OUTLOOK_SENDER_EMAIL}/sendMail"
+    
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+    
+    email_payload = _build_email_payload(to_email, subject, body)
     
     try:
-        response = requests.post(url, headers=headers, json=email_payload)
-        # Esto lanzará un error si la solicitud falla (ej. 400, 401, 500)
-        response.raise_for_status() 
-        print(f"Correo enviado exitosamente a {to_email}. Estado: {response.status_code}")
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.post(url, headers=headers, json=email_payload)
+            # Esto lanzará un error si la solicitud falla (ej. 400, 401, 500)
+            response.raise_for_status()
+        logger.info("Correo enviado exitosamente a %s. Estado: %s", to_email, response.status_code)
     except requests.exceptions.HTTPError as e:
-        print(f"Error HTTP al enviar correo a {to_email}: {e}")
+        logger.error("Error HTTP al enviar correo a %s: %s", to_email, e)
         # Imprimimos el cuerpo del error para más detalles
-        print(f"Cuerpo de la respuesta de error: {e.response.text}")
+        logger.error("Cuerpo de la respuesta de error: %s", e.response.text)
+        raise
+
+async def send_email_async(to_email: str, subject: str, body: str):
+    """
+    Versión asíncrona de send_email para el worker asyncio.
+    Usa el cliente httpx compartido; MSAL se ejecuta en un hilo.
+    """
+    access_token = await asyncio.to_thread(_get_access_token)
+
+    url = f"{GRAPH_API_BASE}/users/{settings.OUTLOOK_SENDER_EMAIL}/sendMail"
+
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+
+    try:
+        async with provider_call_async(MICROSOFT_GRAPH):
+            response = await get_async_client().post(
+                url, headers=headers, json=_build_email_payload(to_email, subject, body)
+            )
+            response.raise_for_status()
+        logger.info("Correo enviado exitosamente a %s. Estado: %s", to_email, response.status_code)
+    except httpx.HTTPStatusError as e:
+        logger.error("Error HTTP al enviar correo a %s: %s", to_email, e)
+        logger.error("Cuerpo de la respuesta de error: %s", e.response.text)
         raise
\ No newline at end of file
@@ -1,33 +1,111 @@
+import logging
 import os
 import json
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+import google.auth.transport.requests
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 from core.config import settings
+from .providers import GOOGLE_CALENDAR, provider_call
 from typing import Optional, Dict, Any, List
 
+logger = logging.getLogger(__name__)
+
 # Configuración de credenciales de Google
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# El cliente se reutiliza entre llamadas: las credenciales de la cuenta de
+# servicio se cargan una vez y las comparten todos los hilos; el servicio se
+# construye una vez por hilo (httplib2 no es thread-safe) a partir del
+# documento de discovery incluido en google-api-python-client, y conserva
+# su conexión TLS abierta.
+_credentials = None
+_credentials_lock = threading.Lock()
+# La renovación tiene su propio lock: provider_call puede esperar al rate
+# limit de Google, y mientras tanto el resto de hilos siguen usando el token
+# vigente (solo esperan si ya caducó)
+_refresh_lock = threading.Lock()
+_token_request = google.auth.transport.requests.Request()
+_thread_local = threading.local()
+
+@lru_cache(maxsize=None)
+def _discovery_document() -> str:
+    # Se pasa como texto: build_from_document modifica el dict que recibe
+    return get_static_doc('calendar', 'v3')
+
+def _load_credentials():
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            credentials = service_account.Credentials.from_service_account_file(
+                settings.GOOGLE_CREDENTIALS_JSON,
+                scopes=SCOPES
+            )
+            if settings.GOOGLE_TOKEN_URL:
+                credentials = credentials.with_token_uri(settings.GOOGLE_TOKEN_URL)
+            _credentials = credentials
+        return _credentials
+
+def _token_state(credentials):
+    """(hay que renovarlo, ya caducó) según el token actual."""
+    if credentials.token is None or credentials.expiry is None:
+        return True, True
+    # expiry es UTC sin zona horaria
+    now = datetime.now(dt_timezone.utc).replace(tzinfo=None)
+    remaining = credentials.expiry - now
+    return remaining < timedelta(seconds=settings.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS), remaining <= timedelta(0)
+
+def _get_credentials():
+    """
+    Credenciales compartidas, con el token renovado
+    GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS antes de que caduque. Un solo hilo
+    pide el token nuevo; si el actual aún vale, los demás no lo esperan.
+    """
+    credentials = _load_credentials()
+    stale, expired = _token_state(credentials)
+    if not stale:
+        return credentials
+    if not _refresh_lock.acquire(blocking=expired):
+        # Otro hilo lo está renovando y el token actual todavía sirve
+        return credentials
+    try:
+        # Puede que otro hilo lo haya renovado mientras se esperaba el lock
+        if _token_state(credentials)[0]:
+            with provider_call(GOOGLE_CALENDAR):
+                credentials.refresh(_token_request)
+    finally:
+        _refresh_lock.release()
+    return credentials
+
 def get_calendar_service():
     """
-    Crea y retorna un servicio de Google Calendar autenticado.
+    Retorna el servicio de Google Calendar autenticado del hilo actual
+    (se construye la primera vez que el hilo lo pide).
     """
     try:
-        # Cargar las credenciales desde el archivo JSON
-        credentials = service_account.Credentials.from_service_account_file(
-            settings.GOOGLE_CREDENTIALS_JSON,
-            scopes=SCOPES
-        )
-        
-        # Construir el servicio
-        service = build('calendar', 'v3', credentials=credentials)
+        credentials = _get_credentials()
+        service = getattr(_thread_local, "service", None)
+        if service is None:
+            client_options = {"api_endpoint": settings.GOOGLE_CALENDAR_API_URL} if settings.GOOGLE_CALENDAR_API_URL else None
+            service = build_from_document(_discovery_document(), credentials=credentials, client_options=client_options)
+            _thread_local.service = service
+            # service.events() genera en cada llamada todos los métodos del
+            # recurso (con sus docstrings); se genera una vez por hilo
+            _thread_local.events = service.events()
         return service
     except Exception as e:
-        print(f"Error al crear el servicio de Google Calendar: {e}")
+        logger.error("Error al crear el servicio de Google Calendar: %s", e)
         raise
 
+def get_events_resource():
+    """Recurso events() del servicio del hilo actual."""
+    get_calendar_service()
+    return _thread_local.events
+
 def create_event(
     summary: str,
     description: str,
@@ -59,7 +137,7 @@ def create_event(
         Dict con la información del evento creado
     """
     try:
-        service = get_calendar_service()
+        events_resource = get_events_resource()
         
         # Construir el cuerpo del evento
         event = {
@@ -97,20 +175,21 @@ def create_event(
             event['reminders'] = {'useDefault': True}
         
         # Crear el evento
-        event_result = service.events().insert(
-            calendarId=calendar_id,
-            body=event,
-            sendNotifications=send_notifications
-        ).execute()
+        with provider_call(GOOGLE_CALENDAR):
+            event_result = events_resource.insert(
+                calendarId=calendar_id,
+                body=event,
+                sendNotifications=send_notifications
+            ).execute()
         
-        print(f"Evento creado exitosamente: {event_result.get('htmlLink')}")
+        logger.info("Evento creado exitosamente: %s", event_result.get('htmlLink'))
         return event_result
         
     except HttpError as error:
-        print(f"Error HTTP al crear evento: {error}")
+        logger.error("Error HTTP al crear evento: %s", error)
         raise
     except Exception as e:
-        print(f"Error al crear evento: {e}")
+        logger.error("Error al crear evento: %s", e)
         raise
 
 def update_event(
@@ -130,10 +209,11 @@ def update_event(
         Dict con la información del evento actualizado
     """
     try:
-        service = get_calendar_service()
+        events_resource = get_events_resource()
         
         # Obtener el evento actual
-        event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+        with provider_call(GOOGLE_CALENDAR):
+            event = events_resource.get(calendarId=calendar_id, eventId=event_id).execute()
         
         # Actualizar campos proporcionados
         if 'summary' in kwargs:
@@ -158,21 +238,22 @@ def update_event(
             event['attendees'] = [{'email': email} for email in kwargs['attendees']]
         
         # Actualizar el evento
-        updated_event = service.events().update(
-            calendarId=calendar_id,
-            eventId=event_id,
-            body=event,
-            sendNotifications=kwargs.get('send_notifications', True)
-        ).execute()
+        with provider_call(GOOGLE_CALENDAR):
+            updated_event = events_resource.update(
+                calendarId=calendar_id,
+                eventId=event_id,
+                body=event,
+                sendNotifications=kwargs.get('send_notifications', True)
+            ).execute()
         
-        print(f"Evento actualizado exitosamente: {updated_event.get('htmlLink')}")
+        logger.info("Evento actualizado exitosamente: %s", updated_event.get('htmlLink'))
         return updated_event
         
     except HttpError as error:
-        print(f"Error HTTP al actualizar evento: {error}")
+        logger.error("Error HTTP al actualizar evento: %s", error)
         raise
     except Exception as e:
-        print(f"Error al actualizar evento: {e}")
+        logger.error("Error al actualizar evento: %s", e)
         raise
 
 def delete_event(
@@ -192,22 +273,23 @@ def delete_event(
         True si se eliminó exitosamente
     """
     try:
-        service = get_calendar_service()
+        events_resource = get_events_resource()
         
-        service.events().delete(
-            calendarId=calendar_id,
-            eventId=event_id,
-            sendUpdates='all' if send_notifications else 'none'
-        ).execute()
+        with provider_call(GOOGLE_CALENDAR):
+            events_resource.delete(
+                calendarId=calendar_id,
+                eventId=event_id,
+                sendUpdates='all' if send_notifications else 'none'
+            ).execute()
         
-        print(f"Evento {event_id} eliminado exitosamente")
+        logger.info("Evento %s eliminado exitosamente", event_id)
         return True
         
     except HttpError as error:
-        print(f"Error HTTP al eliminar evento: {error}")
+        logger.error("Error HTTP al eliminar evento: %s", error)
         raise
     except Exception as e:
-        print(f"Error al eliminar evento: {e}")
+        logger.error("Error al eliminar evento: %s", e)
         raise
 
 def get_event(
@@ -225,16 +307,17 @@ def get_event(
         Dict con la información del evento
     """
     try:
-        service = get_calendar_service()
+        events_resource = get_events_resource()
         
-        event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+        with provider_call(GOOGLE_CALENDAR):
+            event = events_resource.get(calendarId=calendar_id, eventId=event_id).execute()
         return event
         
     except HttpError as error:
-        print(f"Error HTTP al obtener evento: {error}")
+        logger.error("Error HTTP al obtener evento: %s", error)
         raise
     except Exception as e:
-        print(f"Error al obtener evento: {e}")
+        logger.error("Error al obtener evento: %s", e)
         raise
 
 def list_events(
@@ -258,7 +341,7 @@ def list_events(
         Lista de eventos
     """
     try:
-        service = get_calendar_service()
+        events_resource = get_events_resource()
         
         # Si no se proporciona time_min, usar ahora
         if not time_min:
@@ -280,15 +363,16 @@ def list_events(
             params['q'] = query
         
         # Ejecutar consulta
-        events_result = service.events().list(**params).execute()
+        with provider_call(GOOGLE_CALENDAR):
+            events_result = events_resource.list(**params).execute()
         events = events_result.get('items', [])
         
         return events
         
     except HttpError as error:
-        print(f"Error HTTP al listar eventos: {error}")
+        logger.error("Error HTTP al listar eventos: %s", error)
         raise
     except Exception as e:
-        print(f"Error al listar eventos: {e}")
+        logger.error("Error al listar eventos: %s", e)
         raise
 
@@ -1,58 +1,32 @@
+import logging
+import asyncio
+import httpx
 import msal
 import requests
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from core.config import settings
-from .email_service import _get_access_token, send_email
+from .email_service import GRAPH_API_BASE, _get_access_token, send_email
+from .async_http import get_async_client
+from .providers import MICROSOFT_GRAPH, ProviderUnavailableError, provider_call, provider_call_async
 
-# La URL base de Microsoft Graph
-GRAPH_API_BASE = "https://graph.microsoft.com/v1.0"
+logger = logging.getLogger(__name__)
 
-def create_outlook_event(
+def _build_event_payload(
     subject: str,
     body: str,
     start_time: datetime,
     end_time: datetime,
-    attendees: Optional[List[str]] = None,
-    location: Optional[str] = None,
-    is_online_meeting: bool = False,
-    reminder_minutes_before_start: int = 15,
-    categories: Optional[List[str]] = None,
-    importance: str = "normal",  # low, normal, high
-    send_response: bool = True,
-    timezone: str = "UTC"
+    attendees: Optional[List[str]],
+    location: Optional[str],
+    is_online_meeting: bool,
+    reminder_minutes_before_start: int,
+    categories: Optional[List[str]],
+    importance: str,
+    send_response: bool,
+    timezone: str
 ) -> Dict[str, Any]:
-    """
-    Crea un evento en el calendario de Outlook usando Microsoft Graph API.
-    
-    Args:
-        subject: Asunto del evento
-        body: Descripción del evento
-        start_time: Fecha y hora de inicio
-        end_time: Fecha y hora de fin
-        attendees: Lista de emails de los asistentes
-        location: Ubicación del evento
-        is_online_meeting: Si crear una reunión de Teams
-        reminder_minutes_before_start: Minutos antes para el recordatorio
-        categories: Categorías del evento
-        importance: Importancia del evento
-        send_response: Si enviar invitaciones a los asistentes
-        timezone: Zona horaria del evento
-    
-    Returns:
-        Dict con la información del evento creado
-    """
-    access_token = _get_access_token()
-    
-    # Endpoint para crear eventos
-    url = f"{GRAPH_API_BASE}/users/{settings.OUTLOOK_SENDER_EMAIL}/events"
-    
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
-    
-    # Construir el cuerpo del evento
+    """Construye el cuerpo del evento en el formato de Microsoft Graph."""
     event_payload = {
         "subject": subject,
         "body": {
@@ -100,12 +74,64 @@ def create_outlook_event(
         event_payload["isOnlineMeeting"] = True
         event_payload["onlineMeetingProvider"] = "teamsForBusiness"
     
+    return event_payload
+
+def create_outlook_event(
+    subject: str,
+    body: str,
+    start_time: datetime,
+    end_time: datetime,
+    attendees: Optional[List[str]] = None,
+    location: Optional[str] = None,
+    is_online_meeting: bool = False,
+    reminder_minutes_before_start: int = 15,
+    categories: Optional[List[str]] = None,
+    importance: str = "normal",  # low, normal, high
+    send_response: bool = True,
+    timezone: str = "UTC"
+) -> Dict[str, Any]:
+    """
+    Crea un evento en el calendario de Outlook usando Microsoft Graph API.
+    
+    Args:
+        subject: Asunto del evento
+        body: Descripción del evento
+        start_time: Fecha y hora de inicio
+        end_time: Fecha y hora de fin
+        attendees: Lista de emails de los asistentes
+        location: Ubicación del evento
+        is_online_meeting: Si crear una reunión de Teams
+        reminder_minutes_before_start: Minutos antes para el recordatorio
+        categories: Categorías del evento
+        importance: Importancia del evento
+        send_response: Si enviar invitaciones a los asistentes
+        timezone: Zona horaria del evento
+    
+    Returns:
+        Dict con la información del evento creado
+    """
+    access_token = _get_access_token()
+    
+    # Endpoint para crear eventos
+    url = f"{GRAPH_API_BASE}/users/{settings.OUTLOOK_SENDER_EMAIL}/events"
+    
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+    
+    event_payload = _build_event_payload(
+        subject, body, start_time, end_time, attendees, location, is_online_meeting,
+        reminder_minutes_before_start, categories, importance, send_response, timezone
+    )
+    
     try:
-        response = requests.post(url, headers=headers, json=event_payload)
-        response.raise_for_status()
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.post(url, headers=headers, json=event_payload)
+            response.raise_for_status()
         
         event_data = response.json()
-        print(f"Evento de Outlook creado exitosamente: {event_data.get('webLink')}")
+        logger.info("Evento de Outlook creado exitosamente: %s", event_data.get('webLink'))
         
         # Si hay asistentes y se debe enviar respuesta, enviar las invitaciones
         if attendees and send_response:
@@ -114,8 +140,8 @@ def create_outlook_event(
         return event_data
         
     except requests.exceptions.HTTPError as e:
-        print(f"Error HTTP al crear evento en Outlook: {e}")
-        print(f"Respuesta de error: {e.response.text}")
+        logger.error("Error HTTP al crear evento en Outlook: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
         raise
 
 def send_event_invitations(event_id: str):
@@ -132,12 +158,15 @@ def send_event_invitations(event_id: str):
     }
     
     try:
-        response = requests.post(url, headers=headers)
-        response.raise_for_status()
-        print("Invitaciones enviadas exitosamente")
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.post(url, headers=headers)
+            response.raise_for_status()
+        logger.info("Invitaciones enviadas exitosamente")
     except requests.exceptions.HTTPError as e:
-        print(f"Error al enviar invitaciones: {e}")
-        print(f"Respuesta de error: {e.response.text}")
+        logger.error("Error al enviar invitaciones: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
+    except ProviderUnavailableError as e:
+        logger.error("Error al enviar invitaciones: %s", e)
 
 def update_outlook_event(
     event_id: str,
@@ -198,16 +227,17 @@ def update_outlook_event(
         ]
     
     try:
-        response = requests.patch(url, headers=headers, json=update_payload)
-        response.raise_for_status()
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.patch(url, headers=headers, json=update_payload)
+            response.raise_for_status()
         
         event_data = response.json()
-        print(f"Evento actualizado exitosamente: {event_data.get('webLink')}")
+        logger.info("Evento actualizado exitosamente: %s", event_data.get('webLink'))
         return event_data
         
     except requests.exceptions.HTTPError as e:
-        print(f"Error HTTP al actualizar evento: {e}")
-        print(f"Respuesta de error: {e.response.text}")
+        logger.error("Error HTTP al actualizar evento: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
         raise
 
 def delete_outlook_event(
@@ -240,12 +270,15 @@ def delete_outlook_event(
         }
         
         try:
-            response = requests.post(cancel_url, headers=headers, json=cancel_payload)
-            response.raise_for_status()
-            print(f"Evento {event_id} cancelado y notificaciones enviadas")
+            with provider_call(MICROSOFT_GRAPH):
+                response = requests.post(cancel_url, headers=headers, json=cancel_payload)
+                response.raise_for_status()
+            logger.info("Evento %s cancelado y notificaciones enviadas", event_id)
         except requests.exceptions.HTTPError as e:
-            print(f"Error al cancelar evento: {e}")
-            print(f"Respuesta de error: {e.response.text}")
+            logger.error("Error al cancelar evento: %s", e)
+            logger.error("Respuesta de error: %s", e.response.text)
+        except ProviderUnavailableError as e:
+            logger.error("Error al cancelar evento: %s", e)
     
     # Luego eliminar el evento
     delete_url = f"{GRAPH_API_BASE}/users/{settings.OUTLOOK_SENDER_EMAIL}/events/{event_id}"
@@ -255,14 +288,15 @@ def delete_outlook_event(
     }
     
     try:
-        response = requests.delete(delete_url, headers=headers)
-        response.raise_for_status()
-        print(f"Evento {event_id} eliminado exitosamente")
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.delete(delete_url, headers=headers)
+            response.raise_for_status()
+        logger.info("Evento %s eliminado exitosamente", event_id)
         return True
         
     except requests.exceptions.HTTPError as e:
-        print(f"Error HTTP al eliminar evento: {e}")
-        print(f"Respuesta de error: {e.response.text}")
+        logger.error("Error HTTP al eliminar evento: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
         raise
 
 def get_outlook_event(event_id: str) -> Dict[str, Any]:
@@ -284,13 +318,14 @@ def get_outlook_event(event_id: str) -> Dict[str, Any]:
     }
     
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.get(url, headers=headers)
+            response.raise_for_status()
         return response.json()
         
     except requests.exceptions.HTTPError as e:
-        print(f"Error HTTP al obtener evento: {e}")
-        print(f"Respuesta de error: {e.response.text}")
+        logger.error("Error HTTP al obtener evento: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
         raise
 
 def list_outlook_events(
@@ -342,15 +377,16 @@ def list_outlook_events(
         params["$search"] = f'"{search}"'
     
     try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.get(url, headers=headers, params=params)
+            response.raise_for_status()
         
         data = response.json()
         return data.get('value', [])
         
     except requests.exceptions.HTTPError as e:
-        print(f"Error HTTP al listar eventos: {e}")
-        print(f"Respuesta de error: {e.response.text}")
+        logger.error("Error HTTP al listar eventos: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
         raise
 
 
@@ -398,12 +434,84 @@ def get_free_busy_schedule(
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
+        with provider_call(MICROSOFT_GRAPH):
+            response = requests.post(url, headers=headers, json=payload)
+            response.raise_for_status()
         
         return response.json()
         
     except requests.exceptions.HTTPError as e:
-        print(f"Error HTTP al obtener disponibilidad: {e}")
-        print(f"Respuesta de error: {e.response.text}")
-        raise
\ No newline at end of file
+        logger.error("Error HTTP al obtener disponibilidad: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
+        raise
+
+async def create_outlook_event_async(
+    subject: str,
+    body: str,
+    start_time: datetime,
+    end_time: datetime,
+    attendees: Optional[List[str]] = None,
+    location: Optional[str] = None,
+    is_online_meeting: bool = False,
+    reminder_minutes_before_start: int = 15,
+    categories: Optional[List[str]] = None,
+    importance: str = "normal",
+    send_response: bool = True,
+    timezone: str = "UTC"
+) -> Dict[str, Any]:
+    """
+    Versión asíncrona de create_outlook_event para el worker asyncio.
+    """
+    access_token = await asyncio.to_thread(_get_access_token)
+
+    url = f"{GRAPH_API_BASE}/users/{settings.OUTLOOK_SENDER_EMAIL}/events"
+
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+
+    event_payload = _build_event_payload(
+        subject, body, start_time, end_time, attendees, location, is_online_meeting,
+        reminder_minutes_before_start, categories, importance, send_response, timezone
+    )
+
+    try:
+        async with provider_call_async(MICROSOFT_GRAPH):
+            response = await get_async_client().post(url, headers=headers, json=event_payload)
+            response.raise_for_status()
+
+        event_data = response.json()
+        logger.info("Evento de Outlook creado exitosamente: %s", event_data.get('webLink'))
+
+        if attendees and send_response:
+            await send_event_invitations_async(event_data['id'], access_token)
+
+        return event_data
+
+    except httpx.HTTPStatusError as e:
+        logger.error("Error HTTP al crear evento en Outlook: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
+        raise
+
+async def send_event_invitations_async(event_id: str, access_token: str):
+    """
+    Versión asíncrona de send_event_invitations.
+    """
+    url = f"{GRAPH_API_BASE}/users/{settings.OUTLOOK_SENDER_EMAIL}/events/{event_id}/send"
+
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Length': '0'
+    }
+
+    try:
+        async with provider_call_async(MICROSOFT_GRAPH):
+            response = await get_async_client().post(url, headers=headers)
+            response.raise_for_status()
+        logger.info("Invitaciones enviadas exitosamente")
+    except httpx.HTTPStatusError as e:
+        logger.error("Error al enviar invitaciones: %s", e)
+        logger.error("Respuesta de error: %s", e.response.text)
+    except ProviderUnavailableError as e:
+        logger.error("Error al enviar invitaciones: %s", e)
@@ -0,0 +1,323 @@
+import asyncio
+import time
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+import requests
+from googleapiclient.errors import HttpError
+from twilio.base.exceptions import TwilioRestException
+
+from core.config import settings
+from core.metrics import PROVIDER_ERRORS, PROVIDER_LATENCY
+from core.tracing import provider_span
+from schemas import TaskType
+from .circuit_breaker import breaker_states, get_breaker
+from .rate_limiter import TokenBucket, get_bucket
+
+# Proveedores externos; cada uno tiene su propio límite en settings.RATE_LIMITS
+TWILIO_SMS = "twilio_sms"
+TWILIO_VOICE = "twilio_voice"
+EVOLUTION_API = "evolution_api"
+MICROSOFT_GRAPH = "microsoft_graph"
+GOOGLE_CALENDAR = "google_calendar"
+
+PROVIDERS = [TWILIO_SMS, TWILIO_VOICE, EVOLUTION_API, MICROSOFT_GRAPH, GOOGLE_CALENDAR]
+
+# Proveedor del que depende cada tipo de tarea. Los correos adicionales a los
+# asistentes de un evento no cuentan: si fallan, la tarea no falla.
+TASK_TYPE_PROVIDERS = {
+    TaskType.sms: TWILIO_SMS,
+    TaskType.call: TWILIO_VOICE,
+    TaskType.whatsapp: EVOLUTION_API,
+    TaskType.email: MICROSOFT_GRAPH,
+    TaskType.calendar_event: GOOGLE_CALENDAR,
+    TaskType.outlook_event: MICROSOFT_GRAPH,
+}
+
+# Códigos HTTP que indican un problema temporal del proveedor
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class ProviderUnavailableError(Exception):
+    """
+    No se llamó al proveedor, o este pidió esperar. El worker difiere la tarea
+    retry_after segundos sin consumir un intento.
+    """
+
+    def __init__(self, provider: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class RateLimitedError(ProviderUnavailableError):
+    """
+    El proveedor está limitando las peticiones (429 / Retry-After) o no hubo
+    token disponible dentro de RATE_LIMIT_MAX_WAIT_SECONDS.
+    """
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, retry_after, f"Proveedor {provider} limitado; reintentar en {retry_after:.1f}s")
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """El circuito del proveedor está abierto: se evita la petición."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, retry_after, f"Circuito de {provider} abierto; reintentar en {retry_after:.1f}s")
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """Extrae el código HTTP de las excepciones de Twilio, requests, httpx o Google."""
+    if isinstance(error, TwilioRestException):
+        return error.status
+    if isinstance(error, (requests.exceptions.HTTPError, httpx.HTTPStatusError)):
+        return error.response.status_code if error.response is not None else None
+    if isinstance(error, HttpError):
+        return error.resp.status
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    """True si vale la pena reintentar: 429/5xx, timeouts o errores de conexión."""
+    status = status_code(error)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        httpx.TransportError,
+        ConnectionError,
+        TimeoutError,
+    ))
+
+
+def _header(error: Exception, name: str) -> Optional[str]:
+    if isinstance(error, (requests.exceptions.HTTPError, httpx.HTTPStatusError)) and error.response is not None:
+        return error.response.headers.get(name)
+    if isinstance(error, HttpError):
+        # httplib2 guarda las cabeceras en minúsculas
+        return error.resp.get(name.lower())
+    return None
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Si el error indica que el proveedor nos está limitando, devuelve cuántos
+    segundos esperar; si no, None. Se usa Retry-After (segundos o fecha HTTP)
+    o x-ms-retry-after-ms de Microsoft Graph; un 429 sin cabeceras usa
+    RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS.
+    """
+    status = status_code(error)
+    retry_after_ms = _header(error, "x-ms-retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return max(float(retry_after_ms) / 1000, 0)
+        except ValueError:
+            pass
+    retry_after = _header(error, "Retry-After")
+    if retry_after is not None and status in (429, 503):
+        parsed = _parse_retry_after(retry_after)
+        if parsed is not None:
+            return parsed
+    if status == 429:
+        return settings.RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS
+    # Google Calendar responde 403 rateLimitExceeded / userRateLimitExceeded
+    if isinstance(error, HttpError) and status == 403 and b"RateLimitExceeded" in (error.content or b""):
+        return settings.RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS
+    return None
+
+
+def _acquire(provider: str):
+    bucket = get_bucket(provider)
+    if bucket is None:
+        return
+    deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT_SECONDS
+    while True:
+        wait = bucket.try_acquire()
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimitedError(provider, wait)
+        time.sleep(wait)
+
+
+async def _get_bucket_async(provider: str):
+    # Con RATE_LIMIT_BACKEND=database, crear el bucket consulta la BBDD
+    if settings.RATE_LIMIT_BACKEND == "database":
+        return await asyncio.to_thread(get_bucket, provider)
+    return get_bucket(provider)
+
+
+async def _acquire_async(provider: str):
+    bucket = await _get_bucket_async(provider)
+    if bucket is None:
+        return
+    deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT_SECONDS
+    while True:
+        # El bucket en BBDD hace I/O bloqueante; se consulta en un hilo
+        if isinstance(bucket, TokenBucket):
+            wait = bucket.try_acquire()
+        else:
+            wait = await asyncio.to_thread(bucket.try_acquire)
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise RateLimitedError(provider, wait)
+        await asyncio.sleep(wait)
+
+
+def _throttled(provider: str, error: Exception) -> Optional[RateLimitedError]:
+    """
+    Error a lanzar si el proveedor pidió esperar. El bucket se bloquea aparte
+    (_block_bucket / _block_bucket_async) para no hacer I/O bloqueante en el
+    bucle asyncio.
+    """
+    delay = retry_after_seconds(error)
+    if delay is None:
+        return None
+    return RateLimitedError(provider, delay)
+
+
+def _block_bucket(provider: str, seconds: float):
+    bucket = get_bucket(provider)
+    if bucket is not None:
+        bucket.block(seconds)
+
+
+async def _block_bucket_async(provider: str, seconds: float):
+    bucket = await _get_bucket_async(provider)
+    if bucket is None:
+        return
+    if isinstance(bucket, TokenBucket):
+        bucket.block(seconds)
+    else:
+        await asyncio.to_thread(bucket.block, seconds)
+
+
+def _check_circuit(provider: str):
+    wait = get_breaker(provider).allow()
+    if wait > 0:
+        PROVIDER_ERRORS.labels(provider, "circuit_open").inc()
+        raise CircuitOpenError(provider, wait)
+
+
+def _record_failure(provider: str, error: Exception) -> Optional[RateLimitedError]:
+    """
+    Registra en el circuito (y en las métricas) el resultado de una petición
+    fallida. Un error de la propia tarea (4xx) o un límite de peticiones
+    indica que el proveedor responde, así que cuenta como éxito.
+    """
+    breaker = get_breaker(provider)
+    if isinstance(error, ProviderUnavailableError):
+        # Viene de otra llamada anidada, no de este proveedor
+        breaker.release()
+        return None
+    throttled = _throttled(provider, error)
+    if throttled is not None:
+        PROVIDER_ERRORS.labels(provider, "rate_limited").inc()
+        breaker.record_success()
+    elif is_transient(error):
+        PROVIDER_ERRORS.labels(provider, "transient").inc()
+        breaker.record_failure()
+    else:
+        PROVIDER_ERRORS.labels(provider, "permanent").inc()
+        breaker.record_success()
+    return throttled
+
+
+def circuit_open_error(task_type: TaskType) -> Optional[CircuitOpenError]:
+    """Error con el que diferir una tarea si el circuito de su proveedor está abierto."""
+    provider = TASK_TYPE_PROVIDERS.get(task_type)
+    if provider is None:
+        return None
+    wait = get_breaker(provider).retry_after()
+    return CircuitOpenError(provider, wait) if wait > 0 else None
+
+
+def circuit_states():
+    return breaker_states(PROVIDERS)
+
+
+@contextmanager
+def provider_call(provider: str):
+    """
+    Envuelve cada petición a un proveedor externo:
+
+        with provider_call(TWILIO_SMS):
+            client.messages.create(...)
+
+    Si el circuito del proveedor está abierto lanza CircuitOpenError sin hacer
+    la petición. Si no, espera un token del bucket del proveedor y, si la
+    respuesta es un 429 / Retry-After, bloquea el bucket y lanza
+    RateLimitedError. Cada petición (con su espera) es un span de la traza.
+    """
+    with provider_span(provider):
+        _check_circuit(provider)
+        try:
+            _acquire(provider)
+        except BaseException as e:
+            if isinstance(e, RateLimitedError):
+                PROVIDER_ERRORS.labels(provider, "rate_limited").inc()
+            get_breaker(provider).release()
+            raise
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            PROVIDER_LATENCY.labels(provider).observe(time.perf_counter() - start)
+            throttled = _record_failure(provider, e)
+            if throttled is None:
+                raise
+            _block_bucket(provider, throttled.retry_after)
+            raise throttled from e
+        except BaseException:
+            get_breaker(provider).release()
+            raise
+        PROVIDER_LATENCY.labels(provider).observe(time.perf_counter() - start)
+        get_breaker(provider).record_success()
+
+
+@asynccontextmanager
+async def provider_call_async(provider: str):
+    """Versión asíncrona de provider_call para el worker asyncio."""
+    with provider_span(provider):
+        _check_circuit(provider)
+        try:
+            await _acquire_async(provider)
+        except BaseException as e:
+            if isinstance(e, RateLimitedError):
+                PROVIDER_ERRORS.labels(provider, "rate_limited").inc()
+            get_breaker(provider).release()
+            raise
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            PROVIDER_LATENCY.labels(provider).observe(time.perf_counter() - start)
+            throttled = _record_failure(provider, e)
+            if throttled is None:
+                raise
+            await _block_bucket_async(provider, throttled.retry_after)
+            raise throttled from e
+        except BaseException:
+            # Cancelación de la tarea asyncio: la petición no terminó
+            get_breaker(provider).release()
+            raise
+        PROVIDER_LATENCY.labels(provider).observe(time.perf_counter() - start)
+        get_breaker(provider).record_success()
@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Dict
+
+import crud
+from core.config import settings
+from database import SessionLocal
+
+# Límite de peticiones por proveedor con token buckets.
+#
+# Cada proveedor (ver services/providers.py) tiene un bucket con "rate" tokens
+# por segundo y capacidad "burst" (settings.RATE_LIMITS). Antes de cada
+# petición se toma un token; si no hay, se espera. Cuando el proveedor
+# responde 429 (o envía Retry-After) el bucket se bloquea durante ese tiempo,
+# así el resto de envíos esperan en lugar de fallar contra el proveedor.
+#
+# Con RATE_LIMIT_BACKEND=database el estado del bucket vive en la tabla
+# provider_rate_limits y se comparte entre todas las réplicas del worker y la
+# API, a costa de una consulta por petición.
+#
+# Un rate de 0 (o negativo) deja el bucket sin recarga: agotado el burst, las
+# peticiones se difieren RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS cada vez.
+
+
+class TokenBucket:
+    """Bucket en memoria, compartido por los hilos de un proceso."""
+
+    def __init__(self, provider: str, rate: float, burst: float):
+        self.provider = provider
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Toma un token. Devuelve 0 si lo obtuvo, o los segundos a esperar."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            if self.rate <= 0:
+                return settings.RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS
+            return (1 - self._tokens) / self.rate
+
+    def block(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = 0
+            self._updated = now
+            self._blocked_until = max(self._blocked_until, now + seconds)
+
+
+class DatabaseTokenBucket:
+    """Bucket compartido entre réplicas a través de provider_rate_limits."""
+
+    def __init__(self, provider: str, rate: float, burst: float):
+        self.provider = provider
+        self.rate = rate
+        self.burst = burst
+        db = SessionLocal()
+        try:
+            crud.ensure_rate_limit_bucket(db, provider, burst)
+        finally:
+            db.close()
+
+    def try_acquire(self) -> float:
+        db = SessionLocal()
+        try:
+            return crud.take_rate_limit_token(db, self.provider, self.rate, self.burst)
+        finally:
+            db.close()
+
+    def block(self, seconds: float):
+        db = SessionLocal()
+        try:
+            crud.block_rate_limit_bucket(db, self.provider, seconds)
+        finally:
+            db.close()
+
+
+_buckets: Dict[str, object] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider: str):
+    """Devuelve el bucket del proveedor, o None si no tiene límite configurado."""
+    with _buckets_lock:
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            limits = settings.RATE_LIMITS.get(provider)
+            if not limits:
+                return None
+            bucket_class = DatabaseTokenBucket if settings.RATE_LIMIT_BACKEND == "database" else TokenBucket
+            bucket = bucket_class(provider, float(limits["rate"]), float(limits["burst"]))
+            _buckets[provider] = bucket
+        return bucket
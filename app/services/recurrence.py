@@ -0,0 +1,88 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from apscheduler.triggers.cron import CronTrigger
+from dateutil.rrule import rrulestr
+
+# Cálculo de las ocurrencias de una tarea recurrente (models.RecurringTask),
+# definida con una expresión cron de 5 campos o una RRULE (RFC 5545), en la
+# zona horaria de la definición: "0 9 * * 1-5" en Europe/Madrid son las 9:00
+# de Madrid también tras el cambio de hora.
+
+# crontab numera los días desde el domingo (0 y 7); APScheduler 3 desde el
+# lunes, así que los números se traducen a nombres
+_CRON_WEEKDAYS = ["sun", "mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def _cron_day_of_week(field: str) -> str:
+    days = []
+    for part in field.split(","):
+        match = re.fullmatch(r"(\d)(?:-(\d))?(?:/(\d+))?", part)
+        if match is None:
+            # *, */n o nombres (mon-fri), que APScheduler entiende igual
+            days.append(part)
+            continue
+        start = int(match[1])
+        end = int(match[2]) if match[2] else start
+        if end > 7 or start > end:
+            raise ValueError(f"Día de la semana inválido en la expresión cron: {part}")
+        days.extend(_CRON_WEEKDAYS[day] for day in range(start, end + 1, int(match[3] or 1)))
+    return ",".join(days)
+
+
+def cron_trigger(expression: str, tz: ZoneInfo, starts_at: Optional[datetime] = None,
+                 ends_at: Optional[datetime] = None) -> CronTrigger:
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError("La expresión cron debe tener 5 campos: minuto hora día mes día_de_la_semana")
+    minute, hour, day, month, day_of_week = fields
+    return CronTrigger(
+        minute=minute, hour=hour, day=day, month=month, day_of_week=_cron_day_of_week(day_of_week),
+        start_date=starts_at, end_date=ends_at, timezone=tz
+    )
+
+
+def get_zone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Zona horaria desconocida: {name}")
+
+
+def parse_rrule(rule: str, tz: ZoneInfo, starts_at: datetime):
+    if "DTSTART" in rule.upper():
+        raise ValueError("La fecha de inicio se indica con starts_at, no con DTSTART en la RRULE")
+    # La primera ocurrencia y la hora por defecto salen de starts_at, en la
+    # zona de la definición
+    return rrulestr(rule, dtstart=starts_at.astimezone(tz))
+
+
+def next_occurrence(cron: Optional[str], rrule: Optional[str], tz_name: str, after: datetime,
+                    starts_at: Optional[datetime] = None, ends_at: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Primera ocurrencia estrictamente posterior a after, en UTC, o None si la
+    recurrencia terminó (ends_at, COUNT o UNTIL de la RRULE).
+    """
+    tz = get_zone(tz_name)
+    if cron:
+        occurrence = cron_trigger(cron, tz, starts_at, ends_at).get_next_fire_time(
+            None, after + timedelta(microseconds=1)
+        )
+    else:
+        occurrence = parse_rrule(rrule, tz, starts_at or after).after(after, inc=False)
+        if occurrence is not None and ends_at is not None and occurrence > ends_at:
+            occurrence = None
+    return occurrence.astimezone(timezone.utc) if occurrence is not None else None
+
+
+def validate_schedule(cron: Optional[str], rrule: Optional[str], tz_name: str, starts_at: Optional[datetime]):
+    """Lanza ValueError si la definición no es válida."""
+    if bool(cron) == bool(rrule):
+        raise ValueError("Indica exactamente uno de cron o rrule")
+    tz = get_zone(tz_name)
+    if cron:
+        cron_trigger(cron, tz)
+    else:
+        parse_rrule(rrule, tz, starts_at or datetime.now(timezone.utc))
@@ -1,68 +1,148 @@
+import logging
 from twilio.rest import Client
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from core.config import settings # (En tu código ya está importado así, es correcto)
+import httpx
 import requests
+from .async_http import get_async_client
+from .providers import TWILIO_SMS, TWILIO_VOICE, EVOLUTION_API, provider_call, provider_call_async, ProviderUnavailableError
+
+logger = logging.getLogger(__name__)
 
 client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+# Messages y Calls están en el dominio api (por defecto https://api.twilio.com)
+client.api.base_url = settings.TWILIO_API_BASE_URL
+
+# Cliente de Twilio para el worker asyncio; se crea al primer uso porque
+# AsyncTwilioHttpClient necesita un event loop en ejecución.
+_async_client = None
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = Client(
+            settings.TWILIO_ACCOUNT_SID,
+            settings.TWILIO_AUTH_TOKEN,
+            http_client=AsyncTwilioHttpClient()
+        )
+        _async_client.api.base_url = settings.TWILIO_API_BASE_URL
+    return _async_client
+
+async def aclose_async_client():
+    """Cierra la sesión HTTP del cliente asíncrono de Twilio."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.http_client.close()
+        _async_client = None
+
+def _twiml(message: str) -> str:
+    return f'<Response><Say language="es-MX">{message}</Say></Response>'
+
+def _whatsapp_request(to_number: str, message: str):
+    """Endpoint, headers y payload para Evolution API."""
+    endpoint = f"{settings.EVOLUTION_API_URL}/message/sendText/{settings.EVOLUTION_API_INSTANCE}"
+    headers = {
+        "Content-Type": "application/json",
+        "apikey": settings.EVOLUTION_API_KEY,
+    }
+    message_ready = message.replace("+", "")
+    body = {
+        "number": to_number,
+        "text": f"{message_ready}.s.whatsapp.net",
+    }
+    return endpoint, headers, body
 
 def send_sms(to_number: str, message: str):
     """Envía un mensaje SMS."""
     try:
-        message = client.messages.create(
-            body=message,
-            # CAMBIO: Usamos el número específico para SMS
-            from_=settings.TWILIO_SMS_NUMBER,
-            to=to_number
-        )
-        print(f"SMS enviado a {to_number} desde {settings.TWILIO_SMS_NUMBER}. SID: {message.sid}", flush=True)
+        with provider_call(TWILIO_SMS):
+            message = client.messages.create(
+                body=message,
+                # CAMBIO: Usamos el número específico para SMS
+                from_=settings.TWILIO_SMS_NUMBER,
+                to=to_number
+            )
+        logger.info("SMS enviado a %s desde %s. SID: %s", to_number, settings.TWILIO_SMS_NUMBER, message.sid)
         return message.sid
     except Exception as e:
-        print(f"Error al enviar SMS a {to_number}: {e}", flush=True)
+        logger.warning("Error al enviar SMS a %s: %s", to_number, e)
         raise
 
 def make_call(to_number: str, message: str):
     """Realiza una llamada y reproduce un mensaje usando TwiML."""
     try:
-        twiml_message = f'<Response><Say language="es-MX">{message}</Say></Response>'
-        
-        call = client.calls.create(
-            twiml=twiml_message,
-            to=to_number,
-            # SIN CAMBIOS: Esta función ya usa el número correcto para llamadas
-            from_=settings.TWILIO_PHONE_NUMBER
-        )
-        print(f"Llamada iniciada a {to_number} desde {settings.TWILIO_PHONE_NUMBER}. SID: {call.sid}", flush=True)
+        twiml_message = _twiml(message)
+
+        with provider_call(TWILIO_VOICE):
+            call = client.calls.create(
+                twiml=twiml_message,
+                to=to_number,
+                # SIN CAMBIOS: Esta función ya usa el número correcto para llamadas
+                from_=settings.TWILIO_PHONE_NUMBER
+            )
+        logger.info("Llamada iniciada a %s desde %s. SID: %s", to_number, settings.TWILIO_PHONE_NUMBER, call.sid)
         return call.sid
     except Exception as e:
-        print(f"Error al realizar llamada a {to_number}: {e}", flush=True)
+        logger.warning("Error al realizar llamada a %s: %s", to_number, e)
         raise
 
 def send_whatsapp(to_number: str, message: str):
     """Envía un mensaje a través de Evolution API."""
+    endpoint, headers, body = _whatsapp_request(to_number, message)
+    # Sin el texto del mensaje: los logs no deben guardar su contenido
+    logger.info("Enviando mensaje a %s vía Evolution API (%s caracteres)", to_number, len(message))
     try:
-        # Configura el endpoint y los headers aquí
-        endpoint = f"{settings.EVOLUTION_API_URL}/message/sendText/{settings.EVOLUTION_API_INSTANCE}"
-        headers = {
-            "Content-Type": "application/json",
-            "apikey": settings.EVOLUTION_API_KEY,
-        }
-
-        message_ready = message.replace("+", "") 
-        print(f"Enviando mensaje a {to_number} vía Evolution API: {message_ready}", flush=True)
+        with provider_call(EVOLUTION_API):
+            response = requests.post(endpoint, json=body, headers=headers)
+            response.raise_for_status()
+        logger.info("Mensaje enviado a %s vía Evolution API. Estado: %s", to_number, response.status_code)
+        return response.json()
+    except (requests.exceptions.RequestException, ProviderUnavailableError) as e:
+        logger.warning("Error al enviar mensaje a %s vía Evolution API: %s", to_number, e)
+        raise
+    except Exception as e:
+        logger.warning("Error al enviar WhatsApp a %s: %s", to_number, e)
+        raise
 
-        # Configura el payload
-        body = {
-            "number": to_number,
-            "text": f"{message_ready}.s.whatsapp.net",
-        }
+async def send_sms_async(to_number: str, message: str):
+    """Versión asíncrona de send_sms (AsyncTwilioHttpClient)."""
+    try:
+        async with provider_call_async(TWILIO_SMS):
+            sms = await _get_async_client().messages.create_async(
+                body=message,
+                from_=settings.TWILIO_SMS_NUMBER,
+                to=to_number
+            )
+        logger.info("SMS enviado a %s desde %s. SID: %s", to_number, settings.TWILIO_SMS_NUMBER, sms.sid)
+        return sms.sid
+    except Exception as e:
+        logger.warning("Error al enviar SMS a %s: %s", to_number, e)
+        raise
 
-        # Realiza la petición POST
-        response = requests.post(endpoint, json=body, headers=headers)
-        response.raise_for_status()
+async def make_call_async(to_number: str, message: str):
+    """Versión asíncrona de make_call (AsyncTwilioHttpClient)."""
+    try:
+        async with provider_call_async(TWILIO_VOICE):
+            call = await _get_async_client().calls.create_async(
+                twiml=_twiml(message),
+                to=to_number,
+                from_=settings.TWILIO_PHONE_NUMBER
+            )
+        logger.info("Llamada iniciada a %s desde %s. SID: %s", to_number, settings.TWILIO_PHONE_NUMBER, call.sid)
+        return call.sid
+    except Exception as e:
+        logger.warning("Error al realizar llamada a %s: %s", to_number, e)
+        raise
 
-        print(f"Mensaje enviado a {to_number} vía Evolution API. Response: {response.json()}", flush=True)
+async def send_whatsapp_async(to_number: str, message: str):
+    """Versión asíncrona de send_whatsapp usando el cliente httpx compartido."""
+    endpoint, headers, body = _whatsapp_request(to_number, message)
+    try:
+        async with provider_call_async(EVOLUTION_API):
+            response = await get_async_client().post(endpoint, json=body, headers=headers)
+            response.raise_for_status()
+        logger.info("Mensaje enviado a %s vía Evolution API. Estado: %s", to_number, response.status_code)
         return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error al enviar mensaje a {to_number} vía Evolution API: {e}", flush=True)
+    except (httpx.HTTPError, ProviderUnavailableError) as e:
+        logger.warning("Error al enviar mensaje a %s vía Evolution API: %s", to_number, e)
         raise
-    except Exception as e:
-        print(f"Error al enviar WhatsApp a {to_number}: {e}", flush=True)
\ No newline at end of file
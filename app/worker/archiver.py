@@ -0,0 +1,99 @@
+import logging
+import gzip
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import crud
+from core.config import settings
+from core.log import setup_logging
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Archivador de tareas terminadas: python -m worker.archiver
+#
+# tasks solo debería contener el trabajo vivo (pending, retrying,
+# processing) y lo terminado recientemente. Cada ARCHIVE_INTERVAL_SECONDS se
+# mueven a tasks_archive, en lotes de ARCHIVE_BATCH_SIZE (una transacción
+# cada uno), las tareas done/failed sin cambios desde hace ARCHIVE_AFTER_DAYS;
+# el espacio que dejan en tasks lo reutiliza autovacuum, así que la tabla no
+# crece con el historial.
+#
+# tasks_archive está particionada por mes de scheduled_at. Con
+# ARCHIVE_RETENTION_MONTHS > 0 las particiones más antiguas se exportan a
+# ARCHIVE_EXPORT_DIR (tasks_archive_AAAA_MM.csv.gz) y se borran enteras.
+#
+# Una tarea archivada libera su idempotency_key: ARCHIVE_AFTER_DAYS debe ser
+# mayor que la ventana en la que los clientes reintentan sus peticiones.
+
+
+def archive_finished_tasks() -> int:
+    older_than = datetime.now(timezone.utc) - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            moved = crud.archive_finished_tasks(db, older_than, settings.ARCHIVE_BATCH_SIZE)
+        finally:
+            db.close()
+        total += moved
+        if moved < settings.ARCHIVE_BATCH_SIZE:
+            return total
+
+
+def expired_partitions(partitions, now: datetime, retention_months: int):
+    """Particiones (tasks_archive_AAAA_MM) anteriores a los últimos retention_months meses."""
+    current = now.year * 12 + now.month - 1
+    expired = []
+    for name in partitions:
+        year, month = name.rsplit("_", 2)[-2:]
+        if current - (int(year) * 12 + int(month) - 1) >= retention_months:
+            expired.append(name)
+    return expired
+
+
+def export_partition(db, name: str):
+    """Exporta la partición a ARCHIVE_EXPORT_DIR; el fichero solo aparece completo."""
+    path = os.path.join(settings.ARCHIVE_EXPORT_DIR, f"{name}.csv.gz")
+    partial = path + ".partial"
+    with gzip.open(partial, "wt", newline="") as fileobj:
+        crud.export_archive_partition(db, name, fileobj)
+    os.replace(partial, path)
+    return path
+
+
+def drop_expired_partitions():
+    if not settings.ARCHIVE_RETENTION_MONTHS:
+        return []
+    db = SessionLocal()
+    try:
+        expired = expired_partitions(
+            crud.archive_partitions(db), datetime.now(timezone.utc), settings.ARCHIVE_RETENTION_MONTHS
+        )
+        for name in expired:
+            if settings.ARCHIVE_EXPORT_DIR:
+                path = export_partition(db, name)
+                logger.info("Archivador: partición %s exportada a %s", name, path)
+            crud.drop_archive_partition(db, name)
+            logger.info("Archivador: partición %s borrada", name)
+    finally:
+        db.close()
+    return expired
+
+
+def run_once():
+    archived = archive_finished_tasks()
+    logger.info("Archivador: %s tareas terminadas movidas a tasks_archive", archived)
+    drop_expired_partitions()
+
+
+if __name__ == "__main__":
+    setup_logging("archiver")
+    logger.info("Iniciando el archivador de tareas...")
+    while True:
+        try:
+            run_once()
+        except Exception as e:
+            logger.exception("Archivador: ERROR: %s", e)
+        time.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
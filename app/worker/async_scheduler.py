@@ -0,0 +1,220 @@
+import logging
+import asyncio
+from datetime import datetime
+
+import async_crud
+from core.config import settings
+from core.log import setup_logging, task_context
+from core.tracing import setup_tracing, task_span, tracer
+from core.metrics import cycle_timer, observe_dispatch_lag
+from database import AsyncSessionLocal, async_engine
+from schemas import TaskType, TaskStatus
+from services import twilio_service, email_service
+from services import google_calendar_service, outlook_calendar_service
+from services.async_http import aclose_async_client
+from services.providers import circuit_open_error
+from worker.event_emails import google_event_email_body, outlook_event_email_body
+from worker.leases import LeaseKeeper, LeaseLostError, in_flight, is_at_most_once
+from worker.recurring import RecurrenceExpander
+from worker.status_server import start_status_server
+from worker.status_writer import AsyncStatusWriter
+
+logger = logging.getLogger(__name__)
+
+# Worker alternativo basado en asyncio: python -m worker.async_scheduler
+#
+# Mantiene la misma semántica que worker/scheduler.py (reclamo con SKIP
+# LOCKED, límite de concurrencia por canal, done/failed por tarea), pero todas
+# las peticiones salientes comparten un único event loop y clientes HTTP con
+# conexiones reutilizadas. Google Calendar no tiene cliente asíncrono, así que
+# sus llamadas se ejecutan en hilos con asyncio.to_thread.
+
+# Un semáforo por canal (TaskType), con los límites de WORKER_CHANNEL_CONCURRENCY
+_semaphores = {}
+
+def _get_semaphore(task_type: TaskType) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(task_type)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.WORKER_CHANNEL_CONCURRENCY.get(task_type.value, 1))
+        _semaphores[task_type] = semaphore
+    return semaphore
+
+async def process_pending_tasks():
+    with cycle_timer("asyncio"), tracer.start_as_current_span("process_pending_tasks"):
+        await _process_pending_tasks()
+
+async def _process_pending_tasks():
+    logger.info("Worker (asyncio): Buscando tareas pendientes...")
+    async with AsyncSessionLocal() as db:
+        claimed = 0
+        while True:
+            due_tasks = await async_crud.claim_due_tasks(db, settings.WORKER_ID, settings.WORKER_BATCH_SIZE)
+            if not due_tasks:
+                break
+
+            claimed += len(due_tasks)
+            logger.info("Worker %s: Se reclamaron %s tareas para procesar.", settings.WORKER_ID, len(due_tasks))
+            await run_tasks(db, due_tasks)
+            if len(due_tasks) < settings.WORKER_BATCH_SIZE:
+                break
+
+        if not claimed:
+            logger.info("Worker (asyncio): No hay tareas pendientes.")
+
+async def _run_one(task):
+    # Cada _run_one es una tarea asyncio con su propia copia del contexto
+    with task_context(task), task_span(task):
+        async with _get_semaphore(task.task_type):
+            try:
+                if is_at_most_once(task):
+                    await _mark_dispatched(task)
+                observe_dispatch_lag(task)
+                await execute_task(task)
+                return task, None
+            except Exception as e:
+                return task, e
+
+async def _mark_dispatched(task):
+    """Versión asíncrona de worker.leases.mark_dispatched."""
+    async with AsyncSessionLocal() as db:
+        if not await async_crud.mark_task_dispatched(db, settings.WORKER_ID, task.id):
+            raise LeaseLostError(f"La tarea {task.id} ya no está reclamada por este worker")
+
+async def run_tasks(db, tasks):
+    """
+    Ejecuta las tareas reclamadas concurrentemente y actualiza su estado.
+    Las tareas cuyo proveedor tiene el circuito abierto se difieren sin enviarse.
+    """
+    writer = AsyncStatusWriter(db)
+    in_flight.add(task.id for task in tasks)
+    pending = set()
+    try:
+        for task in tasks:
+            circuit_open = circuit_open_error(task.task_type)
+            if circuit_open is not None:
+                with task_context(task):
+                    logger.info("Worker: Tarea ID %s diferida. %s", task.id, circuit_open)
+                await writer.add_failure(task, circuit_open)
+            else:
+                pending.add(asyncio.ensure_future(_run_one(task)))
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=writer.time_until_flush(), return_when=asyncio.FIRST_COMPLETED
+            )
+            for finished in done:
+                task, error = finished.result()
+                with task_context(task):
+                    if error is None:
+                        logger.info("Worker: Tarea ID %s completada exitosamente.", task.id)
+                    else:
+                        logger.warning("Worker: ERROR al procesar tarea ID %s. Error: %s", task.id, error)
+                if error is None:
+                    await writer.add(task.id, TaskStatus.done)
+                else:
+                    await writer.add_failure(task, error)
+            if writer.should_flush():
+                await writer.flush()
+    finally:
+        await writer.close()
+
+async def execute_task(task):
+    """Equivalente asíncrono de worker.scheduler.execute_task."""
+    logger.info("Worker: Procesando tarea ID %s (%s)", task.id, task.task_type)
+    if task.task_type == TaskType.sms:
+        await twilio_service.send_sms_async(to_number=task.target, message=task.message)
+    elif task.task_type == TaskType.call:
+        await twilio_service.make_call_async(to_number=task.target, message=task.message)
+    elif task.task_type == TaskType.whatsapp:
+        await twilio_service.send_whatsapp_async(to_number=task.target, message=task.message)
+    elif task.task_type == TaskType.email:
+        subject = task.extra_data.get('subject', 'Recordatorio del Sistema')
+        await email_service.send_email_async(
+            to_email=task.target,
+            subject=subject,
+            body=task.message
+        )
+    elif task.task_type == TaskType.calendar_event:
+        event_data = task.extra_data or {}
+        start_time = datetime.fromisoformat(event_data.get('start_time'))
+        end_time = datetime.fromisoformat(event_data.get('end_time'))
+        timezone = event_data.get('timezone', 'UTC')
+
+        result = await asyncio.to_thread(
+            google_calendar_service.create_event,
+            summary=event_data.get('summary', 'Evento sin título'),
+            description=event_data.get('description', task.message),
+            start_time=start_time,
+            end_time=end_time,
+            attendees=event_data.get('attendees', [task.target]),
+            location=event_data.get('location'),
+            reminder_minutes=event_data.get('reminder_minutes', [30, 10]),
+            timezone=timezone
+        )
+
+        if event_data.get('send_email_notification', False):
+            email_body = google_event_email_body(task, event_data, start_time, end_time, timezone, result)
+            await _send_attendee_emails(
+                event_data.get('attendees', [task.target]),
+                f"Invitación: {event_data.get('summary', 'Evento sin título')}",
+                email_body
+            )
+
+    elif task.task_type == TaskType.outlook_event:
+        event_data = task.extra_data or {}
+        start_time = datetime.fromisoformat(event_data.get('start_time'))
+        end_time = datetime.fromisoformat(event_data.get('end_time'))
+        timezone = event_data.get('timezone', 'UTC')
+
+        result = await outlook_calendar_service.create_outlook_event_async(
+            subject=event_data.get('subject', 'Evento sin título'),
+            body=event_data.get('body', task.message),
+            start_time=start_time,
+            end_time=end_time,
+            attendees=event_data.get('attendees', [task.target]),
+            location=event_data.get('location'),
+            is_online_meeting=event_data.get('is_online_meeting', False),
+            reminder_minutes_before_start=event_data.get('reminder_minutes_before_start', 15),
+            categories=event_data.get('categories'),
+            importance=event_data.get('importance', 'normal'),
+            timezone=timezone
+        )
+
+        if event_data.get('send_email_notification', False):
+            email_body = outlook_event_email_body(task, event_data, start_time, end_time, timezone, result)
+            await _send_attendee_emails(
+                event_data.get('attendees', [task.target]),
+                f"Confirmación: {event_data.get('subject', 'Evento sin título')}",
+                email_body
+            )
+
+async def _send_attendee_emails(attendees, subject: str, body: str):
+    """Envía el correo adicional a cada asistente; los errores no fallan la tarea."""
+    results = await asyncio.gather(
+        *(email_service.send_email_async(to_email=email, subject=subject, body=body) for email in attendees),
+        return_exceptions=True
+    )
+    for attendee_email, result in zip(attendees, results):
+        if isinstance(result, Exception):
+            logger.warning("Error al enviar correo a %s: %s", attendee_email, result)
+
+async def main():
+    logger.info("Iniciando Worker de Tareas en modo 'asyncio'...")
+    start_status_server()
+    # Heartbeat y reaper en un hilo con la sesión síncrona, fuera del event loop
+    lease_keeper = LeaseKeeper().start()
+    recurrence_expander = RecurrenceExpander().start()
+    try:
+        while True:
+            await process_pending_tasks()
+            await asyncio.sleep(settings.WORKER_POLL_INTERVAL_SECONDS)
+    finally:
+        lease_keeper.stop()
+        recurrence_expander.stop()
+        await aclose_async_client()
+        await twilio_service.aclose_async_client()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    setup_logging("worker")
+    setup_tracing("worker")
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Any, Dict
+
+
+def google_event_email_body(
+    task,
+    event_data: Dict[str, Any],
+    start_time: datetime,
+    end_time: datetime,
+    timezone: str,
+    result: Dict[str, Any]
+) -> str:
+    """Arma el correo que acompaña a un evento de Google Calendar programado."""
+    email_body = f"""
+    <h2>Nuevo evento agendado: {event_data.get('summary', 'Evento sin título')}</h2>
+    <p><strong>Fecha y hora:</strong> {start_time.strftime('%d/%m/%Y %H:%M')} - {end_time.strftime('%H:%M')} ({timezone})</p>
+    <p><strong>Descripción:</strong> {event_data.get('description', task.message)}</p>
+    """
+    if event_data.get('location'):
+        email_body += f"<p><strong>Ubicación:</strong> {event_data.get('location')}</p>"
+    if event_data.get('additional_email_body'):
+        email_body += f"<br/>{event_data.get('additional_email_body')}"
+    email_body += f'''
+    <br/>
+    <p>Se ha agregado este evento a tu calendario de Google. Recibirás recordatorios 30 y 10 minutos antes del evento.</p>
+    <p><a href="{result.get('htmlLink')}">Ver evento en Google Calendar</a></p>
+    '''
+    return email_body
+
+
+def outlook_event_email_body(
+    task,
+    event_data: Dict[str, Any],
+    start_time: datetime,
+    end_time: datetime,
+    timezone: str,
+    result: Dict[str, Any]
+) -> str:
+    """Arma el correo que acompaña a un evento de Outlook programado."""
+    email_body = f"""
+    <h2>Nuevo evento agendado: {event_data.get('subject', 'Evento sin título')}</h2>
+    <p><strong>Fecha y hora:</strong> {start_time.strftime('%d/%m/%Y %H:%M')} - {end_time.strftime('%H:%M')} ({timezone})</p>
+    <p><strong>Descripción:</strong></p>
+    <div style="margin-left: 20px;">{event_data.get('body', task.message)}</div>
+    """
+    if event_data.get('location'):
+        email_body += f"<p><strong>Ubicación:</strong> {event_data.get('location')}</p>"
+    if event_data.get('is_online_meeting') and result.get('onlineMeeting'):
+        join_url = result['onlineMeeting'].get('joinUrl', '')
+        if join_url:
+            email_body += f'<p><strong>Unirse a la reunión:</strong> <a href="{join_url}">Click aquí para unirse a Teams</a></p>'
+    if event_data.get('additional_email_content'):
+        email_body += f"<br/><h3>Información adicional:</h3>{event_data.get('additional_email_content')}"
+    email_body += f"""
+    <br/>
+    <p>Se ha agregado este evento a tu calendario de Outlook. Recibirás un recordatorio {event_data.get('reminder_minutes_before_start', 15)} minutos antes del evento.</p>
+    <p><a href="{result.get('webLink')}">Ver evento en Outlook</a></p>
+    """
+    return email_body
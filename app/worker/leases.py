@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from typing import Iterable, List
+
+import crud
+from core.config import settings
+from database import SessionLocal
+from schemas import TaskType
+
+logger = logging.getLogger(__name__)
+
+# Recuperación ante caídas del worker.
+#
+# Al reclamar una tarea se le asigna un lease de WORKER_LEASE_SECONDS. Un
+# hilo del worker lo renueva cada WORKER_HEARTBEAT_SECONDS solo para las
+# tareas que este proceso tiene en curso (in_flight: desde que se envían
+# hasta que su estado final se guarda), y cada REAPER_INTERVAL_SECONDS
+# recupera las tareas (de cualquier réplica) cuyo lease venció; ver
+# crud.reap_expired_leases. Una tarea cuyo resultado no llegó a guardarse
+# sale de in_flight, deja de renovarse y el reaper la recupera.
+#
+# En los canales at-most-once (AT_MOST_ONCE_TASK_TYPES) se marca
+# dispatched_at justo antes de llamar al proveedor. Si el worker cae entre
+# esa marca y el cambio de estado, la tarea queda failed en lugar de
+# reenviarse: se prefiere perder un recordatorio a repetir una llamada.
+
+
+class LeaseLostError(Exception):
+    """La tarea ya no pertenece a este worker: su lease venció y fue recuperada."""
+
+
+class InFlightTasks:
+    """IDs de las tareas reclamadas por este proceso cuyo estado final aún no se ha guardado."""
+
+    def __init__(self):
+        self._ids = set()
+        self._lock = threading.Lock()
+
+    def add(self, task_ids: Iterable[int]):
+        with self._lock:
+            self._ids.update(task_ids)
+
+    def discard(self, task_ids: Iterable[int]):
+        with self._lock:
+            self._ids.difference_update(task_ids)
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return list(self._ids)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids)
+
+
+in_flight = InFlightTasks()
+
+
+def at_most_once_types():
+    return [TaskType(task_type) for task_type in settings.AT_MOST_ONCE_TASK_TYPES]
+
+
+def is_at_most_once(task) -> bool:
+    return task.task_type.value in settings.AT_MOST_ONCE_TASK_TYPES
+
+
+def mark_dispatched(task, worker_id: str = None):
+    """Registra el inicio del envío; lanza LeaseLostError si la tarea ya no es nuestra."""
+    db = SessionLocal()
+    try:
+        if not crud.mark_task_dispatched(db, worker_id or settings.WORKER_ID, task.id):
+            raise LeaseLostError(f"La tarea {task.id} ya no está reclamada por este worker")
+    finally:
+        db.close()
+
+
+def reap_expired_leases():
+    db = SessionLocal()
+    try:
+        reaped = crud.reap_expired_leases(db, at_most_once_types())
+    finally:
+        db.close()
+    for task_id, status in reaped:
+        logger.warning("Reaper: Tarea ID %s con lease vencido pasa a %s.", task_id, status.value)
+    return reaped
+
+
+class LeaseKeeper:
+    """Hilo en segundo plano que renueva los leases de este worker y ejecuta el reaper."""
+
+    def __init__(self, worker_id: str = None):
+        self.worker_id = worker_id or settings.WORKER_ID
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        next_reap = time.monotonic()
+        while True:
+            try:
+                if time.monotonic() >= next_reap:
+                    reap_expired_leases()
+                    next_reap = time.monotonic() + settings.REAPER_INTERVAL_SECONDS
+                task_ids = in_flight.ids()
+                if task_ids:
+                    db = SessionLocal()
+                    try:
+                        crud.renew_leases(db, self.worker_id, task_ids)
+                    finally:
+                        db.close()
+            except Exception as e:
+                logger.exception("Worker: ERROR al renovar leases: %s", e)
+            if self._stop.wait(settings.WORKER_HEARTBEAT_SECONDS):
+                return
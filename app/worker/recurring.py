@@ -0,0 +1,118 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import crud
+import schemas
+from core.config import settings
+from database import SessionLocal
+from services.recurrence import next_occurrence
+
+logger = logging.getLogger(__name__)
+
+# Materialización de las tareas recurrentes (models.RecurringTask).
+#
+# Una definición no genera todas sus ocurrencias al crearse: guarda solo la
+# siguiente (next_run_at) y cada RECURRING_INTERVAL_SECONDS este proceso crea
+# como Task normales las que caen dentro de RECURRING_LOOKAHEAD_SECONDS,
+# avanzando next_run_at. Las Task se envían después por el camino de siempre
+# (reintentos, leases, rate limit...).
+#
+# Varias réplicas pueden ejecutarlo a la vez: cada una bloquea con SKIP LOCKED
+# las definiciones que materializa, y la idempotency_key de cada ocurrencia
+# (recurring:<id>:<fecha UTC>) impide crear dos veces la misma Task aunque
+# una réplica caiga entre el INSERT y el commit.
+
+
+def _occurrences(definition, now: datetime, horizon: datetime):
+    """Ocurrencias pendientes de la definición hasta horizon y su nuevo next_run_at."""
+    def after(moment):
+        return next_occurrence(
+            definition.cron, definition.rrule, definition.timezone, moment,
+            definition.starts_at, definition.ends_at
+        )
+
+    occurrences = []
+    next_run = definition.next_run_at
+    skip_before = now - timedelta(seconds=settings.RECURRING_MISFIRE_GRACE_SECONDS)
+    if next_run < skip_before:
+        # Demasiado tarde para enviarlas: se salta a la primera dentro del margen
+        next_run = after(skip_before - timedelta(microseconds=1))
+    while next_run is not None and next_run <= horizon and len(occurrences) < settings.RECURRING_MAX_OCCURRENCES:
+        occurrences.append(next_run)
+        next_run = after(next_run)
+    return occurrences, next_run
+
+
+def _task_for(definition, occurrence: datetime) -> schemas.RecurringOccurrence:
+    return schemas.RecurringOccurrence(
+        target=definition.target,
+        message=definition.message,
+        task_type=definition.task_type,
+        scheduled_at=occurrence,
+        extra_data=definition.extra_data,
+        max_attempts=definition.max_attempts,
+        idempotency_key=crud.recurring_idempotency_key(definition.id, occurrence),
+        recurring_task_id=definition.id,
+    )
+
+
+def materialize_batch(now: datetime) -> int:
+    """Materializa un lote de definiciones; devuelve cuántas procesó."""
+    horizon = now + timedelta(seconds=settings.RECURRING_LOOKAHEAD_SECONDS)
+    db = SessionLocal()
+    try:
+        definitions = crud.claim_due_recurring_tasks(db, horizon, settings.RECURRING_BATCH_SIZE)
+        tasks = []
+        for definition in definitions:
+            try:
+                occurrences, next_run = _occurrences(definition, now, horizon)
+            except ValueError as e:
+                # Definición que ya no se puede interpretar (p. ej. zona horaria retirada)
+                logger.warning("Recurrentes: definición %s desactivada: %s", definition.id, e)
+                definition.active = False
+                continue
+            tasks.extend(_task_for(definition, occurrence) for occurrence in occurrences)
+            definition.next_run_at = next_run
+            if next_run is None:
+                definition.active = False
+        # Las Task y el avance de next_run_at van en la misma transacción
+        results = crud.create_tasks_bulk(db, tasks, notify=True)
+        db.commit()
+    finally:
+        db.close()
+    created = sum(1 for _, inserted in results if inserted)
+    if created:
+        logger.info("Recurrentes: %s ocurrencias creadas de %s definiciones", created, len(definitions))
+    return len(definitions)
+
+
+def materialize_recurring_tasks():
+    now = datetime.now(timezone.utc)
+    while materialize_batch(now) >= settings.RECURRING_BATCH_SIZE:
+        pass
+
+
+class RecurrenceExpander:
+    """Hilo en segundo plano que materializa las tareas recurrentes cada RECURRING_INTERVAL_SECONDS."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="recurrence-expander", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                materialize_recurring_tasks()
+            except Exception as e:
+                logger.exception("Recurrentes: ERROR al materializar: %s", e)
+            if self._stop.wait(settings.RECURRING_INTERVAL_SECONDS):
+                return
@@ -0,0 +1,57 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from core.config import settings
+from schemas import TaskStatus
+from services.providers import ProviderUnavailableError, is_transient
+
+# Largo máximo guardado en tasks.last_error
+MAX_ERROR_LENGTH = 1000
+
+
+def backoff_seconds(attempt: int) -> float:
+    """
+    Backoff exponencial con jitter: base * 2^(intento-1), acotado por
+    RETRY_BACKOFF_MAX_SECONDS y escogido al azar en [mitad, total] para que
+    los reintentos de muchas tareas no caigan todos en el mismo instante.
+    """
+    delay = min(
+        settings.RETRY_BACKOFF_BASE_SECONDS * (2 ** max(attempt - 1, 0)),
+        settings.RETRY_BACKOFF_MAX_SECONDS
+    )
+    return random.uniform(delay / 2, delay)
+
+
+def failure_outcome(task, error: Exception) -> dict:
+    """
+    Decide qué hacer con una tarea que falló: reintentarla más tarde
+    (status=retrying con next_attempt_at) o marcarla como failed. Devuelve los
+    parámetros que espera crud.bulk_update_task_status en outcomes.
+    """
+    last_error = f"{type(error).__name__}: {error}"[:MAX_ERROR_LENGTH]
+    if isinstance(error, ProviderUnavailableError):
+        # Proveedor limitado o con el circuito abierto: se difiere la tarea
+        # sin gastar un intento
+        return {
+            "task_id": task.id,
+            "new_status": TaskStatus.retrying,
+            "new_next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=error.retry_after),
+            "new_last_error": last_error,
+            "new_attempts": max(task.attempts - 1, 0),
+        }
+    if is_transient(error) and task.attempts < task.max_attempts:
+        next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=backoff_seconds(task.attempts))
+        return {
+            "task_id": task.id,
+            "new_status": TaskStatus.retrying,
+            "new_next_attempt_at": next_attempt_at,
+            "new_last_error": last_error,
+            "new_attempts": task.attempts,
+        }
+    return {
+        "task_id": task.id,
+        "new_status": TaskStatus.failed,
+        "new_next_attempt_at": None,
+        "new_last_error": last_error,
+        "new_attempts": task.attempts,
+    }
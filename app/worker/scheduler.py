@@ -1,155 +1,273 @@
+import logging
+import contextvars
+import queue
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Optional
 
 
 import sys
 import os
 
-from database import engine
-import models
-
 from database import SessionLocal
-from crud import get_due_tasks, update_task_status
+from core.config import settings
+from core.log import setup_logging, task_context
+from core.tracing import setup_tracing, task_span, tracer
+from core.metrics import cycle_timer, observe_dispatch_lag
+from crud import claim_due_tasks
 from schemas import TaskType, TaskStatus
 from services import twilio_service, email_service
 from services import google_calendar_service, outlook_calendar_service
+from services.providers import circuit_open_error
+from worker.event_emails import google_event_email_body, outlook_event_email_body
+from worker.leases import LeaseKeeper, in_flight, is_at_most_once, mark_dispatched
+from worker.recurring import RecurrenceExpander
+from worker.status_server import start_status_server
+from worker.status_writer import StatusWriter
+
+logger = logging.getLogger(__name__)
 
-# Asegura que las tablas existan
-models.Base.metadata.create_all(bind=engine)
+# Un pool de hilos por canal (TaskType), creados bajo demanda
+_executors = {}
+_executors_lock = threading.Lock()
 
 def process_pending_tasks():
-    # Usamos flush=True para forzar la salida inmediata en los logs de Docker
-    print(f"[{datetime.utcnow()}] Worker: Buscando tareas pendientes...", flush=True)
+    with cycle_timer("poll"), tracer.start_as_current_span("process_pending_tasks"):
+        _process_pending_tasks()
+
+def _process_pending_tasks():
+    logger.info("Worker: Buscando tareas pendientes...")
     db: Session = SessionLocal()
     try:
-        due_tasks = get_due_tasks(db)
-        if not due_tasks:
-            print("Worker: No hay tareas pendientes.", flush=True)
-            return
+        # Reclamamos las tareas (status=processing) en lotes de WORKER_BATCH_SIZE
+        # hasta vaciar el backlog; así nunca hay más de un lote en memoria.
+        claimed = 0
+        while True:
+            due_tasks = claim_due_tasks(db, settings.WORKER_ID, settings.WORKER_BATCH_SIZE)
+            if not due_tasks:
+                break
+
+            claimed += len(due_tasks)
+            logger.info("Worker %s: Se reclamaron %s tareas para procesar.", settings.WORKER_ID, len(due_tasks))
+            run_tasks(db, due_tasks)
+            if len(due_tasks) < settings.WORKER_BATCH_SIZE:
+                break
+
+        if not claimed:
+            logger.info("Worker: No hay tareas pendientes.")
+    finally:
+        db.close()
+
+def _get_executor(task_type: TaskType) -> ThreadPoolExecutor:
+    """Devuelve (creándolo la primera vez) el pool acotado del canal."""
+    with _executors_lock:
+        executor = _executors.get(task_type)
+        if executor is None:
+            max_workers = settings.WORKER_CHANNEL_CONCURRENCY.get(task_type.value, 1)
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix=f"worker-{task_type.value}"
+            )
+            _executors[task_type] = executor
+        return executor
+
+def run_tasks(db: Session, tasks):
+    """
+    Ejecuta las tareas ya reclamadas y actualiza su estado.
+
+    Cada TaskType se envía a su propio pool de hilos acotado
+    (WORKER_CHANNEL_CONCURRENCY), así una llamada lenta a Google o Graph no
+    bloquea los SMS y WhatsApp que vienen detrás. Los estados se actualizan
+    en este hilo, que es el único que usa la sesión de BBDD, y se escriben
+    en lote con StatusWriter.
+
+    Las tareas cuyo proveedor tiene el circuito abierto no se envían: se
+    difieren hasta que el circuito vuelva a probar.
+    """
+    writer = StatusWriter(db)
+    in_flight.add(task.id for task in tasks)
+    futures = {}
+    for task in tasks:
+        circuit_open = circuit_open_error(task.task_type)
+        if circuit_open is not None:
+            with task_context(task):
+                logger.info("Worker: Tarea ID %s diferida. %s", task.id, circuit_open)
+            writer.add_failure(task, circuit_open)
+            continue
+        futures[_submit(task)] = task
+    pending = set(futures)
+    try:
+        while pending:
+            # Esperamos al siguiente resultado, o al vencimiento del lote de estados
+            done, pending = wait(pending, timeout=writer.time_until_flush(), return_when=FIRST_COMPLETED)
+            for future in done:
+                _record_result(writer, futures[future], future.exception())
+            if writer.should_flush():
+                writer.flush()
+    finally:
+        writer.close()
+
+def _submit(task):
+    # Con una copia del contexto, el span de la tarea cuelga del span del ciclo
+    return _get_executor(task.task_type).submit(contextvars.copy_context().run, _dispatch, task)
+
+def _record_result(writer: StatusWriter, task, error: Optional[BaseException]):
+    if error is not None:
+        with task_context(task):
+            logger.warning("Worker: ERROR al procesar tarea ID %s. Error: %s", task.id, error)
+        writer.add_failure(task, error)
+    else:
+        with task_context(task):
+            logger.info("Worker: Tarea ID %s completada exitosamente.", task.id)
+        writer.add(task.id, TaskStatus.done)
 
-        print(f"Worker: Se encontraron {len(due_tasks)} tareas para procesar.", flush=True)
+class BackgroundDispatcher:
+    """
+    Ejecuta tareas ya reclamadas sin esperar a los proveedores (modo "timer").
 
-        for task in due_tasks:
-            print(f"Worker: Procesando tarea ID {task.id} ({task.task_type})", flush=True)
+    submit() reparte las tareas entre los pools por canal y vuelve enseguida,
+    así el bucle del TimerScheduler sigue leyendo NOTIFY y disparando timers
+    mientras un proveedor lento responde. Un hilo propio recoge los
+    resultados y los escribe en lote con StatusWriter, en su propia sesión.
+    """
+
+    def __init__(self):
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="status-collector", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, tasks):
+        in_flight.add(task.id for task in tasks)
+        for task in tasks:
+            circuit_open = circuit_open_error(task.task_type)
+            if circuit_open is not None:
+                with task_context(task):
+                    logger.info("Worker: Tarea ID %s diferida. %s", task.id, circuit_open)
+                self._results.put((task, circuit_open))
+                continue
+            _submit(task).add_done_callback(lambda future, task=task: self._results.put((task, future.exception())))
+
+    def _run(self):
+        # El writer dura lo que el hilo: si un vaciado falla, sus resultados
+        # siguen en el buffer y se reintentan (la sesión sigue sirviendo tras
+        # el rollback)
+        writer = StatusWriter(SessionLocal())
+        while True:
             try:
-                if task.task_type == TaskType.sms:
-                    twilio_service.send_sms(to_number=task.target, message=task.message)
-                elif task.task_type == TaskType.call:
-                    twilio_service.make_call(to_number=task.target, message=task.message)
-                elif task.task_type == TaskType.whatsapp:
-                    twilio_service.send_whatsapp(to_number=task.target, message=task.message)
-                elif task.task_type == TaskType.email:
-                    subject = task.extra_data.get('subject', 'Recordatorio del Sistema')
+                task, error = self._results.get(timeout=writer.time_until_flush())
+            except queue.Empty:
+                pass
+            else:
+                _record_result(writer, task, error)
+            # Con WORKER_BATCH_SIZE tareas en curso el TimerScheduler no reclama
+            # más hasta que se guarden: no se espera a STATUS_FLUSH_INTERVAL_SECONDS
+            saturated = len(in_flight) >= settings.WORKER_BATCH_SIZE and self._results.empty()
+            if writer.should_flush(eager=saturated):
+                writer.flush()
+
+def _dispatch(task):
+    with task_context(task), task_span(task):
+        # En los canales at-most-once se deja constancia antes de llamar al
+        # proveedor, para no reenviar si el worker cae a mitad del envío
+        if is_at_most_once(task):
+            mark_dispatched(task)
+        observe_dispatch_lag(task)
+        execute_task(task)
+
+def execute_task(task):
+    """Realiza la acción de la tarea. Lanza una excepción si algo falla."""
+    logger.info("Worker: Procesando tarea ID %s (%s)", task.id, task.task_type)
+    if task.task_type == TaskType.sms:
+        twilio_service.send_sms(to_number=task.target, message=task.message)
+    elif task.task_type == TaskType.call:
+        twilio_service.make_call(to_number=task.target, message=task.message)
+    elif task.task_type == TaskType.whatsapp:
+        twilio_service.send_whatsapp(to_number=task.target, message=task.message)
+    elif task.task_type == TaskType.email:
+        subject = task.extra_data.get('subject', 'Recordatorio del Sistema')
+        email_service.send_email(
+            to_email=task.target, 
+            subject=subject, 
+            body=task.message
+        )
+    elif task.task_type == TaskType.calendar_event:
+        event_data = task.extra_data or {}
+        start_time = datetime.fromisoformat(event_data.get('start_time'))
+        end_time = datetime.fromisoformat(event_data.get('end_time'))
+        timezone = event_data.get('timezone', 'UTC')
+
+        result = google_calendar_service.create_event(
+            summary=event_data.get('summary', 'Evento sin título'),
+            description=event_data.get('description', task.message),
+            start_time=start_time,
+            end_time=end_time,
+            attendees=event_data.get('attendees', [task.target]),
+            location=event_data.get('location'),
+            reminder_minutes=event_data.get('reminder_minutes', [30, 10]),
+            timezone=timezone
+        )
+
+        if event_data.get('send_email_notification', False):
+            email_body = google_event_email_body(task, event_data, start_time, end_time, timezone, result)
+            for attendee_email in event_data.get('attendees', [task.target]):
+                try:
                     email_service.send_email(
-                        to_email=task.target, 
-                        subject=subject, 
-                        body=task.message
-                    )
-                elif task.task_type == TaskType.calendar_event:
-                    event_data = task.extra_data or {}
-                    start_time = datetime.fromisoformat(event_data.get('start_time'))
-                    end_time = datetime.fromisoformat(event_data.get('end_time'))
-                    timezone = event_data.get('timezone', 'UTC')
-
-                    result = google_calendar_service.create_event(
-                        summary=event_data.get('summary', 'Evento sin título'),
-                        description=event_data.get('description', task.message),
-                        start_time=start_time,
-                        end_time=end_time,
-                        attendees=event_data.get('attendees', [task.target]),
-                        location=event_data.get('location'),
-                        reminder_minutes=event_data.get('reminder_minutes', [30, 10]),
-                        timezone=timezone
+                        to_email=attendee_email,
+                        subject=f"Invitación: {event_data.get('summary', 'Evento sin título')}",
+                        body=email_body
                     )
+                except Exception as e:
+                    logger.warning("Error al enviar correo a %s: %s", attendee_email, e)
 
-                    if event_data.get('send_email_notification', False):
-                        email_body = f"""
-                        <h2>Nuevo evento agendado: {event_data.get('summary', 'Evento sin título')}</h2>
-                        <p><strong>Fecha y hora:</strong> {start_time.strftime('%d/%m/%Y %H:%M')} - {end_time.strftime('%H:%M')} ({timezone})</p>
-                        <p><strong>Descripción:</strong> {event_data.get('description', task.message)}</p>
-                        """
-                        if event_data.get('location'):
-                            email_body += f"<p><strong>Ubicación:</strong> {event_data.get('location')}</p>"
-                        if event_data.get('additional_email_body'):
-                            email_body += f"<br/>{event_data.get('additional_email_body')}"
-                        email_body += f'''
-                        <br/>
-                        <p>Se ha agregado este evento a tu calendario de Google. Recibirás recordatorios 30 y 10 minutos antes del evento.</p>
-                        <p><a href="{result.get('htmlLink')}">Ver evento en Google Calendar</a></p>
-                        '''
-                        for attendee_email in event_data.get('attendees', [task.target]):
-                            try:
-                                email_service.send_email(
-                                    to_email=attendee_email,
-                                    subject=f"Invitación: {event_data.get('summary', 'Evento sin título')}",
-                                    body=email_body
-                                )
-                            except Exception as e:
-                                print(f"Error al enviar correo a {attendee_email}: {e}")
-
-                elif task.task_type == TaskType.outlook_event:
-                    event_data = task.extra_data or {}
-                    start_time = datetime.fromisoformat(event_data.get('start_time'))
-                    end_time = datetime.fromisoformat(event_data.get('end_time'))
-                    timezone = event_data.get('timezone', 'UTC')
-
-                    result = outlook_calendar_service.create_outlook_event(
-                        subject=event_data.get('subject', 'Evento sin título'),
-                        body=event_data.get('body', task.message),
-                        start_time=start_time,
-                        end_time=end_time,
-                        attendees=event_data.get('attendees', [task.target]),
-                        location=event_data.get('location'),
-                        is_online_meeting=event_data.get('is_online_meeting', False),
-                        reminder_minutes_before_start=event_data.get('reminder_minutes_before_start', 15),
-                        categories=event_data.get('categories'),
-                        importance=event_data.get('importance', 'normal'),
-                        timezone=timezone
-                    )
+    elif task.task_type == TaskType.outlook_event:
+        event_data = task.extra_data or {}
+        start_time = datetime.fromisoformat(event_data.get('start_time'))
+        end_time = datetime.fromisoformat(event_data.get('end_time'))
+        timezone = event_data.get('timezone', 'UTC')
 
-                    if event_data.get('send_email_notification', False):
-                        email_body = f"""
-                        <h2>Nuevo evento agendado: {event_data.get('subject', 'Evento sin título')}</h2>
-                        <p><strong>Fecha y hora:</strong> {start_time.strftime('%d/%m/%Y %H:%M')} - {end_time.strftime('%H:%M')} ({timezone})</p>
-                        <p><strong>Descripción:</strong></p>
-                        <div style="margin-left: 20px;">{event_data.get('body', task.message)}</div>
-                        """
-                        if event_data.get('location'):
-                            email_body += f"<p><strong>Ubicación:</strong> {event_data.get('location')}</p>"
-                        if event_data.get('is_online_meeting') and result.get('onlineMeeting'):
-                            join_url = result['onlineMeeting'].get('joinUrl', '')
-                            if join_url:
-                                email_body += f'<p><strong>Unirse a la reunión:</strong> <a href="{join_url}">Click aquí para unirse a Teams</a></p>'
-                        if event_data.get('additional_email_content'):
-                            email_body += f"<br/><h3>Información adicional:</h3>{event_data.get('additional_email_content')}"
-                        email_body += f"""
-                        <br/>
-                        <p>Se ha agregado este evento a tu calendario de Outlook. Recibirás un recordatorio {event_data.get('reminder_minutes_before_start', 15)} minutos antes del evento.</p>
-                        <p><a href="{result.get('webLink')}">Ver evento en Outlook</a></p>
-                        """
-                        for attendee_email in event_data.get('attendees', [task.target]):
-                            try:
-                                email_service.send_email(
-                                    to_email=attendee_email,
-                                    subject=f"Confirmación: {event_data.get('subject', 'Evento sin título')}",
-                                    body=email_body
-                                )
-                            except Exception as e:
-                                print(f"Error al enviar correo adicional a {attendee_email}: {e}")
-
-                print(f"Worker: Tarea ID {task.id} completada exitosamente.", flush=True)
-                update_task_status(db, task.id, TaskStatus.done)
-
-            except Exception as e:
-                # Esta es la línea clave que queremos ver
-                print(f"Worker: ERROR al procesar tarea ID {task.id}. Error: {e}", flush=True)
-                update_task_status(db, task.id, TaskStatus.failed)
-    finally:
-        db.close()
+        result = outlook_calendar_service.create_outlook_event(
+            subject=event_data.get('subject', 'Evento sin título'),
+            body=event_data.get('body', task.message),
+            start_time=start_time,
+            end_time=end_time,
+            attendees=event_data.get('attendees', [task.target]),
+            location=event_data.get('location'),
+            is_online_meeting=event_data.get('is_online_meeting', False),
+            reminder_minutes_before_start=event_data.get('reminder_minutes_before_start', 15),
+            categories=event_data.get('categories'),
+            importance=event_data.get('importance', 'normal'),
+            timezone=timezone
+        )
+
+        if event_data.get('send_email_notification', False):
+            email_body = outlook_event_email_body(task, event_data, start_time, end_time, timezone, result)
+            for attendee_email in event_data.get('attendees', [task.target]):
+                try:
+                    email_service.send_email(
+                        to_email=attendee_email,
+                        subject=f"Confirmación: {event_data.get('subject', 'Evento sin título')}",
+                        body=email_body
+                    )
+                except Exception as e:
+                    logger.warning("Error al enviar correo adicional a %s: %s", attendee_email, e)
 
 if __name__ == "__main__":
-    print("Iniciando Worker de Tareas 'Ruidoso'...", flush=True)
-    while True:
-        process_pending_tasks()
-        time.sleep(60)
\ No newline at end of file
+    setup_logging("worker")
+    setup_tracing("worker")
+    logger.info("Iniciando Worker de Tareas en modo '%s'...", settings.WORKER_MODE)
+    start_status_server()
+    LeaseKeeper().start()
+    RecurrenceExpander().start()
+    if settings.WORKER_MODE == "timer":
+        from worker.timer_scheduler import TimerScheduler
+        TimerScheduler(dispatch=BackgroundDispatcher().start().submit).run()
+    else:
+        while True:
+            process_pending_tasks()
+            time.sleep(settings.WORKER_POLL_INTERVAL_SECONDS)
\ No newline at end of file
@@ -0,0 +1,55 @@
+import logging
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.config import settings
+from core import metrics
+from core.pool_metrics import pool_stats
+from services.providers import circuit_states
+
+logger = logging.getLogger(__name__)
+
+# Servidor HTTP mínimo para consultar el estado interno del worker, que no
+# tiene API propia. Corre en un hilo en segundo plano en WORKER_STATUS_PORT.
+
+ROUTES = {
+    "/circuits": circuit_states,
+    "/pool": pool_stats,
+    # Formato de texto de Prometheus; el resto de rutas devuelven JSON
+    "/metrics": metrics.render,
+}
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        route = ROUTES.get(self.path.split("?", 1)[0])
+        if route is None:
+            self.send_error(404)
+            return
+        result = route()
+        if isinstance(result, tuple):
+            content_type, body = result
+        else:
+            content_type, body = "application/json", json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sin una línea de log por cada consulta
+        pass
+
+
+def start_status_server(port: int = None):
+    """Arranca el servidor de estado (no hace nada si el puerto es 0)."""
+    port = settings.WORKER_STATUS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _StatusHandler)
+    threading.Thread(target=server.serve_forever, name="status-server", daemon=True).start()
+    logger.info("Servidor de estado del worker en el puerto %s", port)
+    return server
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import async_crud
+import crud
+from core.config import settings
+from schemas import TaskStatus
+from worker.leases import in_flight
+from worker.retry import failure_outcome
+
+logger = logging.getLogger(__name__)
+
+
+class _StatusBuffer:
+    """
+    Acumula los resultados de un ciclo de envío (task_id -> estado final)
+    para escribirlos en lote con un UPDATE ... WHERE id = ANY(:ids) por estado,
+    en lugar de un SELECT + COMMIT + REFRESH por tarea.
+
+    Las tareas fallidas se guardan aparte con su resultado (retrying con
+    next_attempt_at, o failed) y last_error, y se escriben con un executemany.
+
+    Se vacía al llegar a STATUS_FLUSH_BATCH_SIZE resultados o cuando el
+    resultado más antiguo lleva STATUS_FLUSH_INTERVAL_SECONDS esperando.
+
+    Si el worker cae antes de vaciar el buffer, esas tareas siguen en
+    processing (reclamadas por este worker): ninguna otra réplica las vuelve
+    a enviar. Cada vaciado es una única transacción, así que un lote se aplica
+    completo o no se aplica: si falla (caída de la BBDD, statement timeout...)
+    se hace rollback, los resultados vuelven al buffer y se reintenta tras
+    STATUS_FLUSH_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, worker_id: str, max_batch: int, max_delay: float):
+        self.worker_id = worker_id
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: Dict[TaskStatus, List[int]] = {}
+        self._outcomes: List[dict] = []
+        self._count = 0
+        self._oldest: Optional[float] = None
+        # Tras un vaciado fallido no se reintenta antes de este instante
+        self._retry_at = 0.0
+
+    def add(self, task_id: int, status: TaskStatus):
+        self._pending.setdefault(status, []).append(task_id)
+        self._track()
+
+    def add_failure(self, task, error: Exception):
+        """Registra una tarea fallida; failure_outcome decide si se reintenta."""
+        self._outcomes.append(failure_outcome(task, error))
+        self._track()
+
+    def _track(self):
+        self._count += 1
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    def should_flush(self, eager: bool = False) -> bool:
+        """Con eager, cualquier resultado pendiente basta (salvo tras un vaciado fallido)."""
+        if not self._count:
+            return False
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        return eager or self._count >= self.max_batch or now - self._oldest >= self.max_delay
+
+    def time_until_flush(self) -> Optional[float]:
+        """Segundos hasta el próximo vaciado por tiempo (None si está vacío)."""
+        if self._oldest is None:
+            return None
+        now = time.monotonic()
+        return max(self.max_delay - (now - self._oldest), self._retry_at - now, 0)
+
+    def _drain(self):
+        """Saca el lote del buffer; si no se llega a escribir, vuelve con _restore."""
+        batch = self._pending, self._outcomes, self._count, self._oldest
+        self._pending = {}
+        self._outcomes = []
+        self._count = 0
+        self._oldest = None
+        return batch
+
+    def _restore(self, batch):
+        """Devuelve al buffer un lote que no se pudo escribir (por delante de lo añadido después)."""
+        pending, outcomes, count, oldest = batch
+        for status, task_ids in self._pending.items():
+            pending.setdefault(status, []).extend(task_ids)
+        self._pending = pending
+        self._outcomes = outcomes + self._outcomes
+        self._count += count
+        self._oldest = oldest if self._oldest is None else min(oldest, self._oldest)
+        self._retry_at = time.monotonic() + self.max_delay
+
+    def _flush_failed(self, batch, error: Exception):
+        logger.error(
+            "Worker: ERROR al guardar el estado de %s tareas, se reintentará: %s", batch[2], error
+        )
+        self._restore(batch)
+
+    @staticmethod
+    def _written(batch):
+        """Las tareas del lote ya tienen su estado final guardado: dejan de renovarse."""
+        pending, outcomes, _, _ = batch
+        for task_ids in pending.values():
+            in_flight.discard(task_ids)
+        in_flight.discard(outcome["task_id"] for outcome in outcomes)
+
+    def _close_deadline(self) -> float:
+        # Mientras el lease de las tareas siga vigente se puede seguir reintentando
+        return time.monotonic() + settings.WORKER_LEASE_SECONDS
+
+    def _drop(self):
+        """
+        Descarta lo que no se pudo escribir al cerrar: esas tareas siguen en
+        processing hasta que venza su lease (ya no se renueva) y el reaper
+        las recupere.
+        """
+        batch = self._drain()
+        self._written(batch)
+        logger.error("Worker: Se descartan los estados de %s tareas tras no poder guardarlos.", batch[2])
+
+
+class StatusWriter(_StatusBuffer):
+    """Escritor de estados en lote para el worker por hilos."""
+
+    def __init__(self, db, worker_id: str = None):
+        super().__init__(
+            worker_id or settings.WORKER_ID,
+            settings.STATUS_FLUSH_BATCH_SIZE,
+            settings.STATUS_FLUSH_INTERVAL_SECONDS
+        )
+        self.db = db
+
+    def add(self, task_id: int, status: TaskStatus):
+        super().add(task_id, status)
+        if self.should_flush():
+            self.flush()
+
+    def add_failure(self, task, error: Exception):
+        super().add_failure(task, error)
+        if self.should_flush():
+            self.flush()
+
+    def flush(self) -> bool:
+        """Escribe el buffer; devuelve False (y lo conserva) si la escritura falla."""
+        if not self._count:
+            return True
+        batch = self._drain()
+        try:
+            crud.bulk_update_task_status(self.db, self.worker_id, batch[0], batch[1])
+        except Exception as e:
+            self.db.rollback()
+            self._flush_failed(batch, e)
+            return False
+        self._written(batch)
+        return True
+
+    def close(self):
+        """Último vaciado de un writer que se va a descartar: se reintenta mientras sirva."""
+        deadline = self._close_deadline()
+        while not self.flush():
+            if time.monotonic() >= deadline:
+                self._drop()
+                return
+            time.sleep(self.time_until_flush() or 0)
+
+
+class AsyncStatusWriter(_StatusBuffer):
+    """Escritor de estados en lote para el worker asyncio."""
+
+    def __init__(self, db, worker_id: str = None):
+        super().__init__(
+            worker_id or settings.WORKER_ID,
+            settings.STATUS_FLUSH_BATCH_SIZE,
+            settings.STATUS_FLUSH_INTERVAL_SECONDS
+        )
+        self.db = db
+
+    async def add(self, task_id: int, status: TaskStatus):
+        super().add(task_id, status)
+        if self.should_flush():
+            await self.flush()
+
+    async def add_failure(self, task, error: Exception):
+        super().add_failure(task, error)
+        if self.should_flush():
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Igual que StatusWriter.flush, sobre la sesión asíncrona."""
+        if not self._count:
+            return True
+        batch = self._drain()
+        try:
+            await async_crud.bulk_update_task_status(self.db, self.worker_id, batch[0], batch[1])
+        except Exception as e:
+            await self.db.rollback()
+            self._flush_failed(batch, e)
+            return False
+        self._written(batch)
+        return True
+
+    async def close(self):
+        deadline = self._close_deadline()
+        while not await self.flush():
+            if time.monotonic() >= deadline:
+                self._drop()
+                return
+            await asyncio.sleep(self.time_until_flush() or 0)
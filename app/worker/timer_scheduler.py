@@ -0,0 +1,171 @@
+import logging
+import heapq
+import json
+import select
+import time
+from datetime import datetime, timedelta, timezone
+
+from core.config import settings
+from core.metrics import cycle_timer
+from core.tracing import tracer
+from crud import claim_due_tasks, get_upcoming_tasks
+from database import SessionLocal, listen_engine
+from worker.leases import in_flight
+
+logger = logging.getLogger(__name__)
+
+# Espera antes de volver a intentar reclamar una tarea que la BBDD aún no dio por vencida
+CLAIM_RETRY_DELAY = timedelta(seconds=1)
+# Con WORKER_BATCH_SIZE tareas en curso, cada cuánto se mira si ya hay hueco
+BACKLOG_POLL_SECONDS = 0.1
+
+
+class TimerScheduler:
+    """
+    Modo "timer" del worker.
+
+    Mantiene en un heap (scheduled_at, id) las tareas que vencen dentro de la
+    ventana SCHEDULER_LOOKAHEAD_SECONDS y duerme exactamente hasta la próxima.
+    La API envía un NOTIFY al crear tareas inmediatas, lo que despierta al
+    worker si la nueva tarea vence antes que la cabeza del heap. Cada
+    SCHEDULER_REFRESH_SECONDS se recarga la ventana desde la BBDD para
+    recoger tareas creadas sin notificación.
+
+    El reclamo sigue usando SKIP LOCKED, por lo que varias réplicas en modo
+    "timer" pueden convivir sin duplicar envíos. Como en el modo "poll", el
+    proceso no tiene más de WORKER_BATCH_SIZE tareas reclamadas a la vez: si
+    vencen más (tras una recarga o un atasco), las demás esperan en el heap a
+    que se guarde el resultado de las que están en curso.
+    """
+
+    def __init__(self, dispatch):
+        # dispatch(tasks) ejecuta las tareas ya reclamadas sin bloquear el bucle
+        # (BackgroundDispatcher.submit)
+        self.dispatch = dispatch
+        self._heap = []
+        self._queued = set()
+        self._listen_conn = None
+        self._refresh_requested = False
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+                self._loop()
+            except Exception as e:
+                logger.exception("Worker (timer): ERROR en el bucle principal: %s. Reintentando en 5s...", e)
+                self._close_listener()
+                time.sleep(5)
+
+    def _listen(self):
+        raw = listen_engine.raw_connection()
+        self._listen_conn = raw
+        conn = raw.driver_connection
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{settings.SCHEDULER_NOTIFY_CHANNEL}"')
+
+    def _close_listener(self):
+        if self._listen_conn is not None:
+            try:
+                self._listen_conn.invalidate()
+            except Exception:
+                pass
+            self._listen_conn = None
+
+    def _loop(self):
+        next_refresh = 0.0
+        while True:
+            if self._refresh_requested or time.monotonic() >= next_refresh:
+                self._refresh_requested = False
+                self._prefetch()
+                next_refresh = time.monotonic() + settings.SCHEDULER_REFRESH_SECONDS
+
+            self._fire_due()
+
+            timeout = next_refresh - time.monotonic()
+            if self._heap:
+                until_head = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+                if until_head <= 0:
+                    # Quedan tareas vencidas: se espera a que haya hueco
+                    until_head = BACKLOG_POLL_SECONDS
+                timeout = min(timeout, until_head)
+            self._wait_for_notifications(max(timeout, 0))
+
+    def _push(self, task_id: int, scheduled_at: datetime):
+        if task_id in self._queued:
+            return
+        if scheduled_at.tzinfo is None:
+            scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+        heapq.heappush(self._heap, (scheduled_at, task_id))
+        self._queued.add(task_id)
+
+    def _prefetch(self):
+        db = SessionLocal()
+        try:
+            upcoming = get_upcoming_tasks(
+                db,
+                settings.SCHEDULER_LOOKAHEAD_SECONDS,
+                settings.SCHEDULER_PREFETCH_LIMIT
+            )
+        finally:
+            db.close()
+        for task_id, scheduled_at in upcoming:
+            self._push(task_id, scheduled_at)
+
+    def _fire_due(self):
+        now = datetime.now(timezone.utc)
+        capacity = settings.WORKER_BATCH_SIZE - len(in_flight)
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now and len(due_ids) < capacity:
+            _, task_id = heapq.heappop(self._heap)
+            self._queued.discard(task_id)
+            due_ids.append(task_id)
+        if not due_ids:
+            return
+
+        db = SessionLocal()
+        try:
+            with cycle_timer("timer"), tracer.start_as_current_span("fire_due_tasks"):
+                # Otra réplica pudo haberlas tomado ya; SKIP LOCKED y el filtro
+                # por status garantizan que cada tarea se reclame una sola vez.
+                tasks = claim_due_tasks(db, settings.WORKER_ID, len(due_ids), task_ids=due_ids)
+                if tasks:
+                    logger.info("Worker %s: Se reclamaron %s tareas para procesar.", settings.WORKER_ID, len(tasks))
+                    self.dispatch(tasks)
+                if len(tasks) < len(due_ids):
+                    self._requeue_unclaimed(db, due_ids, {task.id for task in tasks})
+        finally:
+            db.close()
+
+    def _requeue_unclaimed(self, db, due_ids, claimed_ids):
+        """
+        Vuelve a encolar las tareas que no se reclamaron pero siguen
+        esperando: con el reloj de la BBDD algo atrasado todavía no vencían, o
+        estaban bloqueadas por otra transacción. Las que ya tomó otra réplica
+        no están pending/retrying y se descartan.
+        """
+        unclaimed = [task_id for task_id in due_ids if task_id not in claimed_ids]
+        retry_at = datetime.now(timezone.utc) + CLAIM_RETRY_DELAY
+        waiting = get_upcoming_tasks(db, settings.SCHEDULER_LOOKAHEAD_SECONDS, len(unclaimed), task_ids=unclaimed)
+        for task_id, due_at in waiting:
+            if due_at.tzinfo is None:
+                due_at = due_at.replace(tzinfo=timezone.utc)
+            self._push(task_id, max(due_at, retry_at))
+
+    def _wait_for_notifications(self, timeout: float):
+        conn = self._listen_conn.driver_connection
+        if not select.select([conn], [], [], timeout)[0]:
+            return
+        conn.poll()
+        while conn.notifies:
+            notification = conn.notifies.pop(0)
+            try:
+                data = json.loads(notification.payload)
+                if data.get("refresh"):
+                    # Alta masiva: se recarga la ventana desde la BBDD
+                    self._refresh_requested = True
+                    continue
+                self._push(int(data["id"]), datetime.fromisoformat(data["scheduled_at"]))
+            except (ValueError, KeyError) as e:
+                logger.warning("Worker (timer): notificación inválida '%s': %s", notification.payload, e)
@@ -0,0 +1,36 @@
+"""
+Compara dos resultados de run.py (por ejemplo, de dos versiones):
+
+    python benchmarks/compare.py results/dispatch-antes.json results/dispatch-despues.json
+"""
+import json
+import sys
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def main(before_path: str, after_path: str):
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    if before["scenario"] != after["scenario"]:
+        print(f"Aviso: escenarios distintos ({before['scenario']} / {after['scenario']})")
+    print(f"{before['environment'].get('git_commit')} -> {after['environment'].get('git_commit')}")
+    before_values = dict(_flatten(before["results"]))
+    for key, new in _flatten(after["results"]):
+        old = before_values.get(key)
+        if old is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else ""
+        print(f"{key:<50} {old:>14} {new:>14} {change:>9}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import delete, func, select
+
+import crud
+import models
+import schemas
+from core.config import settings
+from database import SessionLocal
+from stats import latency_summary
+
+# Rendimiento del worker con proveedores simulados (stubs.py).
+#
+# Inserta N tareas repartidas entre los tipos indicados, con scheduled_at
+# entre ahora y spread_seconds, y ejecuta en este proceso el bucle del worker
+# (el de hilos o el asyncio) hasta que todas terminan. Cada tarea registra su
+# retraso de envío (inicio del envío - scheduled_at) y el momento en que se
+# completa.
+#
+# El worker reclama cualquier tarea vencida de la base de datos: se debe
+# usar una base de datos de pruebas sin otras tareas pendientes.
+
+# extra_data mínimo para que execute_task pueda construir cada envío
+_EVENT = {
+    "start_time": "2030-01-01T10:00:00", "end_time": "2030-01-01T11:00:00",
+    "timezone": "UTC", "send_email_notification": False,
+}
+EXTRA_DATA = {
+    schemas.TaskType.email: {"subject": "Prueba de carga"},
+    schemas.TaskType.calendar_event: {**_EVENT, "summary": "Prueba de carga"},
+    schemas.TaskType.outlook_event: {**_EVENT, "subject": "Prueba de carga"},
+}
+
+SEED_BATCH_SIZE = 5000
+
+
+class _Recorder:
+
+    def __init__(self):
+        self.lags = defaultdict(list)
+        self.completed = defaultdict(list)
+
+    def started(self, task):
+        scheduled_at = task.scheduled_at
+        if scheduled_at.tzinfo is None:
+            scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+        self.lags[task.task_type.value].append((datetime.now(timezone.utc) - scheduled_at).total_seconds())
+
+    def finished(self, task):
+        self.completed[task.task_type.value].append(time.perf_counter())
+
+
+def _key_prefix(run_id: str) -> str:
+    return f"bench:{run_id}:"
+
+
+def other_due_tasks(run_id: str, until: datetime) -> int:
+    db = SessionLocal()
+    try:
+        return db.scalar(
+            select(func.count()).select_from(models.Task).where(
+                models.Task.status.in_([schemas.TaskStatus.pending, schemas.TaskStatus.retrying]),
+                models.Task.scheduled_at <= until,
+                models.Task.idempotency_key.is_(None) | models.Task.idempotency_key.notlike(_key_prefix(run_id) + "%"),
+            )
+        )
+    finally:
+        db.close()
+
+
+def seed(run_id: str, total: int, task_types: List[schemas.TaskType], spread_seconds: float):
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        for first in range(0, total, SEED_BATCH_SIZE):
+            tasks = [
+                schemas.TaskCreate(
+                    target=f"+1555{number:07d}",
+                    message="Recordatorio de prueba de carga",
+                    task_type=task_types[number % len(task_types)],
+                    scheduled_at=now + timedelta(seconds=spread_seconds * number / total),
+                    extra_data=EXTRA_DATA.get(task_types[number % len(task_types)]),
+                    max_attempts=1,
+                    idempotency_key=f"{_key_prefix(run_id)}{number}",
+                )
+                for number in range(first, min(first + SEED_BATCH_SIZE, total))
+            ]
+            crud.create_tasks_bulk(db, tasks)
+    finally:
+        db.close()
+
+
+def _outcomes(run_id: str):
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(models.Task.status, func.count())
+            .where(models.Task.idempotency_key.like(_key_prefix(run_id) + "%"))
+            .group_by(models.Task.status)
+        ).all()
+        return {status.value: count for status, count in rows}
+    finally:
+        db.close()
+
+
+def cleanup(run_id: str):
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.Task).where(models.Task.idempotency_key.like(_key_prefix(run_id) + "%")))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _finished(outcomes: dict) -> bool:
+    return not any(outcomes.get(status.value) for status in
+                   (schemas.TaskStatus.pending, schemas.TaskStatus.retrying, schemas.TaskStatus.processing))
+
+
+def _run_threaded(recorder: _Recorder, poll_interval: float, deadline: float, run_id: str):
+    from worker import scheduler
+    execute_task = scheduler.execute_task
+
+    def recorded(task):
+        recorder.started(task)
+        execute_task(task)
+        recorder.finished(task)
+
+    scheduler.execute_task = recorded
+    cycles = []
+    while time.perf_counter() < deadline:
+        began = time.perf_counter()
+        scheduler.process_pending_tasks()
+        cycles.append(time.perf_counter() - began)
+        if _finished(_outcomes(run_id)):
+            break
+        time.sleep(poll_interval)
+    return cycles
+
+
+def _run_async(recorder: _Recorder, poll_interval: float, deadline: float, run_id: str):
+    from worker import async_scheduler
+    from database import async_engine
+    from services import twilio_service
+    from services.async_http import aclose_async_client
+    execute_task = async_scheduler.execute_task
+
+    async def recorded(task):
+        recorder.started(task)
+        await execute_task(task)
+        recorder.finished(task)
+
+    async_scheduler.execute_task = recorded
+
+    async def loop():
+        cycles = []
+        try:
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                await async_scheduler.process_pending_tasks()
+                cycles.append(time.perf_counter() - began)
+                if _finished(await asyncio.to_thread(_outcomes, run_id)):
+                    break
+                await asyncio.sleep(poll_interval)
+        finally:
+            await aclose_async_client()
+            await twilio_service.aclose_async_client()
+            await async_engine.dispose()
+        return cycles
+
+    return asyncio.run(loop())
+
+
+def run(run_id: str, total: int, task_types: List[schemas.TaskType], spread_seconds: float,
+        worker: str, poll_interval: float, timeout: float) -> dict:
+    seed(run_id, total, task_types, spread_seconds)
+    recorder = _Recorder()
+    began = time.perf_counter()
+    runner = _run_async if worker == "asyncio" else _run_threaded
+    cycles = runner(recorder, poll_interval, began + timeout, run_id)
+    elapsed = time.perf_counter() - began
+
+    per_type = {}
+    for task_type in task_types:
+        completed = recorder.completed[task_type.value]
+        per_type[task_type.value] = {
+            "completed": len(completed),
+            "tasks_per_second": round(len(completed) / (max(completed) - began), 2) if completed else 0.0,
+            "dispatch_lag": latency_summary(recorder.lags[task_type.value]),
+        }
+    completed = sum(len(times) for times in recorder.completed.values())
+    return {
+        "tasks": total,
+        "worker": worker,
+        "channel_concurrency": settings.WORKER_CHANNEL_CONCURRENCY,
+        "batch_size": settings.WORKER_BATCH_SIZE,
+        "elapsed_seconds": round(elapsed, 3),
+        "completed": completed,
+        "tasks_per_second": round(completed / elapsed, 2),
+        "outcomes": _outcomes(run_id),
+        "dispatch_lag": latency_summary([lag for lags in recorder.lags.values() for lag in lags]),
+        "cycle": latency_summary(cycles),
+        "per_task_type": per_type,
+    }
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from stats import latency_summary
+
+# Carga sobre los endpoints de alta de la API: POST /tasks/ (una tarea por
+# petición), /tasks/bulk y /tasks/stream (batch_size tareas por petición).
+#
+# La carga es de ritmo fijo (open loop): la petición i se lanza en
+# t0 + i / rate aunque las anteriores no hayan terminado, hasta concurrency
+# en vuelo. Si la API no da abasto, las peticiones salen tarde y
+# start_delay lo refleja; la latencia medida es la de cada petición.
+#
+# Las tareas se programan a un día vista (el worker no las toca) y llevan la
+# idempotency_key bench:<run_id>:<n> para borrarlas al terminar.
+
+ENDPOINTS = {"tasks": "/tasks/", "bulk": "/tasks/bulk", "stream": "/tasks/stream"}
+
+
+def _task(run_id: str, number: int, scheduled_at: str) -> dict:
+    return {
+        "target": f"+1555{number % 10_000_000:07d}",
+        "message": "Recordatorio de prueba de carga",
+        "task_type": "sms",
+        "scheduled_at": scheduled_at,
+        "idempotency_key": f"bench:{run_id}:{number}",
+    }
+
+
+def _request(endpoint: str, run_id: str, index: int, batch_size: int, scheduled_at: str) -> dict:
+    if endpoint == "tasks":
+        return {"json": _task(run_id, index, scheduled_at)}
+    tasks = [_task(run_id, index * batch_size + offset, scheduled_at) for offset in range(batch_size)]
+    if endpoint == "bulk":
+        return {"json": tasks}
+    return {
+        "content": "".join(json.dumps(task) + "\n" for task in tasks).encode(),
+        "headers": {"Content-Type": "application/x-ndjson"},
+    }
+
+
+async def run(base_url: str, endpoint: str, rate: float, duration: float, concurrency: int,
+              batch_size: int, run_id: str, timeout: float = 60.0) -> dict:
+    total = max(1, int(rate * duration))
+    per_request = 1 if endpoint == "tasks" else batch_size
+    scheduled_at = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    latencies, start_delays = [], []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+
+        async def send(index: int):
+            due = start + index / rate
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            async with semaphore:
+                start_delays.append(max(0.0, loop.time() - due))
+                kwargs = _request(endpoint, run_id, index, batch_size, scheduled_at)
+                began = time.perf_counter()
+                try:
+                    response = await client.post(ENDPOINTS[endpoint], **kwargs)
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                    return
+                latencies.append(time.perf_counter() - began)
+
+        start = loop.time()
+        began = time.perf_counter()
+        await asyncio.gather(*(send(index) for index in range(total)))
+        elapsed = time.perf_counter() - began
+
+    succeeded = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": total,
+        "tasks_per_request": per_request,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(succeeded / elapsed, 2),
+        "tasks_per_second": round(succeeded * per_request / elapsed, 2),
+        "latency": latency_summary(latencies),
+        "start_delay": latency_summary(start_delays),
+        "status_codes": dict(statuses),
+    }
@@ -0,0 +1,131 @@
+"""
+Pruebas de carga y benchmarks de la API y el worker.
+
+    python benchmarks/run.py ingest --endpoint tasks --rate 200 --duration 30
+    python benchmarks/run.py ingest --endpoint bulk --rate 5 --batch-size 1000
+    python benchmarks/run.py dispatch --tasks 20000 --provider-latency-ms 50
+    python benchmarks/run.py dispatch --tasks 20000 --simulator
+
+ingest necesita la API en marcha (--base-url); dispatch ejecuta el worker en
+este proceso contra la base de datos de DATABASE_URL, con los proveedores
+simulados en el proceso o, con --simulator, con los clientes reales contra
+benchmarks/simulator.py. Cada ejecución guarda su resultado en
+benchmarks/results/ (o en --output); compare.py compara dos resultados.
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Los módulos de la aplicación se importan como desde app/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import stats  # noqa: E402
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="Fichero JSON del resultado (por defecto, benchmarks/results/)")
+    parser.add_argument("--run-id", default=uuid.uuid4().hex[:12])
+    parser.add_argument("--keep", action="store_true", help="No borrar las tareas creadas")
+    commands = parser.add_subparsers(dest="scenario", required=True)
+
+    ingest = commands.add_parser("ingest", help="Carga de ritmo fijo sobre los endpoints de alta")
+    ingest.add_argument("--base-url", default="http://localhost:8008")
+    ingest.add_argument("--endpoint", choices=["tasks", "bulk", "stream"], default="tasks")
+    ingest.add_argument("--rate", type=float, default=100, help="Peticiones por segundo")
+    ingest.add_argument("--duration", type=float, default=30, help="Segundos")
+    ingest.add_argument("--concurrency", type=int, default=50, help="Peticiones en vuelo como máximo")
+    ingest.add_argument("--batch-size", type=int, default=1000, help="Tareas por petición (bulk y stream)")
+
+    dispatch = commands.add_parser("dispatch", help="Worker con proveedores simulados")
+    dispatch.add_argument("--tasks", type=int, default=10000)
+    dispatch.add_argument("--task-types", default="sms,whatsapp,call,email",
+                          help="Tipos separados por comas; las tareas se reparten entre ellos")
+    dispatch.add_argument("--spread-seconds", type=float, default=0,
+                          help="Reparte scheduled_at entre ahora y ahora + N s (0: todas vencidas)")
+    dispatch.add_argument("--worker", choices=["threads", "asyncio"], default="threads")
+    dispatch.add_argument("--provider-latency-ms", type=float, default=50)
+    dispatch.add_argument("--provider-error-rate", type=float, default=0.0)
+    dispatch.add_argument("--simulator", action="store_true",
+                          help="Usar los clientes reales de los proveedores contra benchmarks/simulator.py "
+                               "(las URLs base deben apuntar a él) en lugar de simularlos en el proceso")
+    dispatch.add_argument("--rate-limits", action="store_true",
+                          help="Aplicar RATE_LIMITS (por defecto se quitan para medir el worker, no los límites)")
+    dispatch.add_argument("--poll-interval", type=float, default=0.1, help="Segundos entre ciclos del worker")
+    dispatch.add_argument("--timeout", type=float, default=600)
+    dispatch.add_argument("--force", action="store_true",
+                          help="Ejecutar aunque haya otras tareas vencidas en la base de datos")
+    return parser.parse_args()
+
+
+def _ingest(args) -> dict:
+    import ingest
+    try:
+        return asyncio.run(ingest.run(
+            args.base_url, args.endpoint, args.rate, args.duration, args.concurrency, args.batch_size, args.run_id
+        ))
+    finally:
+        if not args.keep:
+            import dispatch
+            dispatch.cleanup(args.run_id)
+
+
+def _production_provider_urls(settings):
+    """URLs base que siguen con el valor por defecto (los proveedores reales)."""
+    names = ["TWILIO_API_BASE_URL", "MICROSOFT_LOGIN_URL", "MICROSOFT_GRAPH_URL"]
+    production = [name for name in names if getattr(settings, name) == type(settings).model_fields[name].default]
+    if not settings.GOOGLE_CALENDAR_API_URL:
+        production.append("GOOGLE_CALENDAR_API_URL")
+    return production
+
+
+def _dispatch(args) -> dict:
+    import dispatch
+    import stubs
+    from core.config import settings
+    from schemas import TaskType
+
+    task_types = [TaskType(name.strip()) for name in args.task_types.split(",")]
+    until = datetime.now(timezone.utc) + timedelta(seconds=args.spread_seconds)
+    others = dispatch.other_due_tasks(args.run_id, until)
+    if others and not args.force:
+        sys.exit(f"Hay {others} tareas vencidas ajenas al benchmark; usa una base de datos de pruebas o --force")
+    if not args.rate_limits:
+        settings.RATE_LIMITS = {}
+    if args.simulator:
+        production = _production_provider_urls(settings)
+        if production:
+            sys.exit(f"{', '.join(production)} apunta(n) a los proveedores reales; configura el simulador")
+    else:
+        stubs.install(args.provider_latency_ms / 1000, args.provider_error_rate)
+    try:
+        return dispatch.run(
+            args.run_id, args.tasks, task_types, args.spread_seconds, args.worker, args.poll_interval, args.timeout
+        )
+    finally:
+        if not args.keep:
+            dispatch.cleanup(args.run_id)
+
+
+def main():
+    args = _parse_args()
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "keep", "scenario", "run_id")}
+    started_at = datetime.now(timezone.utc).isoformat()
+    results = _ingest(args) if args.scenario == "ingest" else _dispatch(args)
+    result = {
+        "scenario": args.scenario if args.scenario == "dispatch" else f"ingest-{args.endpoint}",
+        "run_id": args.run_id,
+        "started_at": started_at,
+        "environment": stats.environment(),
+        "params": params,
+        "results": results,
+    }
+    path = stats.save(result, args.output)
+    print(f"Resultado guardado en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+"""
+Simulador local de los proveedores externos (Twilio, Evolution API,
+Microsoft Graph y Google Calendar) con latencia y fallos configurables.
+
+    python benchmarks/simulator.py --port 8090 --config benchmarks/simulator.example.json
+
+La aplicación se apunta a él con las URLs base de core/config.py:
+
+    TWILIO_API_BASE_URL=http://localhost:8090
+    EVOLUTION_API_URL=http://localhost:8090
+    MICROSOFT_GRAPH_URL=http://localhost:8090/v1.0
+    MICROSOFT_LOGIN_URL=https://localhost:8443      (MSAL solo admite https: --tls-port)
+    GOOGLE_CALENDAR_API_URL=http://localhost:8090/calendar/v3/
+    GOOGLE_TOKEN_URL=http://localhost:8090/google/token
+
+El comportamiento de cada ruta (twilio_messages, graph_send_mail, ...) se
+define en un JSON con un perfil "default" y cambios parciales por ruta en
+"routes"; ver simulator.example.json. Se puede cambiar en caliente con
+PUT /_simulator/config, y GET /_simulator/stats cuenta las respuestas por
+ruta y resultado.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Literal, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+
+ROUTES = [
+    "twilio_messages",
+    "twilio_calls",
+    "evolution_send_text",
+    "graph_token",
+    "graph_send_mail",
+    "graph_events",
+    "graph_get_schedule",
+    "graph_batch",
+    "google_token",
+    "google_events",
+]
+
+# Eventos que se conservan por proveedor (los más antiguos se olvidan)
+MAX_STORED_EVENTS = 100000
+
+
+class Latency(BaseModel):
+    # fixed: ms; uniform: entre min_ms y max_ms; exponential: media ms;
+    # lognormal: mediana ms y dispersión sigma (cola larga)
+    distribution: Literal["fixed", "uniform", "exponential", "lognormal"] = "fixed"
+    ms: float = 0
+    min_ms: float = 0
+    max_ms: Optional[float] = None
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        """Latencia en segundos."""
+        if self.distribution == "uniform":
+            return rng.uniform(self.min_ms, self.max_ms if self.max_ms is not None else self.ms) / 1000
+        if self.distribution == "exponential":
+            value = rng.expovariate(1 / self.ms) if self.ms else 0
+        elif self.distribution == "lognormal":
+            value = self.ms * math.exp(rng.gauss(0, self.sigma))
+        else:
+            value = self.ms
+        if self.max_ms is not None:
+            value = min(value, self.max_ms)
+        return max(value, self.min_ms) / 1000
+
+
+class RateLimit(BaseModel):
+    # Durante los primeros burst_seconds de cada periodo de every_seconds
+    # todas las peticiones reciben 429 con Retry-After
+    every_seconds: float = Field(gt=0)
+    burst_seconds: float = Field(ge=0)
+    retry_after_seconds: float = 1
+
+
+class Profile(BaseModel):
+    latency: Latency = Latency()
+    # Respuestas de error (status elegido al azar de error_statuses)
+    error_rate: float = Field(0, ge=0, le=1)
+    error_statuses: List[int] = [503]
+    # Ráfagas periódicas de 429 y 429 sueltos fuera de ellas
+    rate_limit: Optional[RateLimit] = None
+    rate_limit_rate: float = Field(0, ge=0, le=1)
+    retry_after_seconds: float = 1
+    # Slow-loris: las cabeceras llegan enseguida y el cuerpo byte a byte a lo
+    # largo de slow_seconds
+    slow_rate: float = Field(0, ge=0, le=1)
+    slow_seconds: float = 30
+
+
+class SimulatorConfig(BaseModel):
+    default: Profile = Profile()
+    routes: Dict[str, dict] = {}
+
+    def profiles(self) -> Dict[str, Profile]:
+        unknown = set(self.routes) - set(ROUTES)
+        if unknown:
+            raise ValueError(f"Rutas desconocidas: {', '.join(sorted(unknown))}")
+        base = self.default.model_dump()
+        return {route: Profile(**{**base, **self.routes.get(route, {})}) for route in ROUTES}
+
+
+class _State:
+
+    def __init__(self, config: SimulatorConfig, seed: Optional[int]):
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.stats = Counter()
+        self.graph_events = OrderedDict()
+        self.google_events = OrderedDict()
+        self.configure(config)
+
+    def configure(self, config: SimulatorConfig):
+        self.profiles = config.profiles()
+        self.config = config
+
+
+state = _State(SimulatorConfig(), None)
+app = FastAPI(title="Simulador de proveedores")
+
+
+def _error_body(route: str, status: int, message: str) -> dict:
+    """Cuerpo de error con el formato de cada proveedor."""
+    if route.startswith("twilio"):
+        return {"code": {404: 20404, 429: 20429}.get(status, 20500), "message": message, "status": status}
+    if route.startswith("graph"):
+        code = {404: "ErrorItemNotFound", 429: "TooManyRequests"}.get(status, "ServiceNotAvailable")
+        return {"error": {"code": code, "message": message}}
+    if route.startswith("google"):
+        reason = {404: "NOT_FOUND", 429: "RESOURCE_EXHAUSTED"}.get(status, "UNAVAILABLE")
+        return {"error": {"code": status, "message": message, "status": reason}}
+    return {"status": status, "error": message}
+
+
+def _fault(route: str, profile: Profile):
+    """(status, cabeceras) del fallo inyectado en esta petición, o None."""
+    limit = profile.rate_limit
+    if limit is not None and (time.monotonic() - state.started) % limit.every_seconds < limit.burst_seconds:
+        return 429, {"Retry-After": str(math.ceil(limit.retry_after_seconds))}
+    if profile.rate_limit_rate and state.rng.random() < profile.rate_limit_rate:
+        return 429, {"Retry-After": str(math.ceil(profile.retry_after_seconds))}
+    if profile.error_rate and state.rng.random() < profile.error_rate:
+        return state.rng.choice(profile.error_statuses), {}
+    return None
+
+
+async def _trickle(body: bytes, seconds: float):
+    interval = seconds / len(body)
+    for byte in body:
+        await asyncio.sleep(interval)
+        yield bytes([byte])
+
+
+async def simulate(route: str, status: int, payload=None, headers: Optional[dict] = None) -> Response:
+    """Aplica el perfil de la ruta (latencia y fallos) a la respuesta."""
+    profile = state.profiles[route]
+    await asyncio.sleep(profile.latency.sample(state.rng))
+    fault = _fault(route, profile)
+    if fault is not None:
+        status, headers = fault
+        payload = _error_body(route, status, "Fallo simulado")
+        state.stats[route, "rate_limited" if status == 429 else "error"] += 1
+    body = json.dumps(payload).encode() if payload is not None else b""
+
+    if profile.slow_rate and state.rng.random() < profile.slow_rate:
+        state.stats[route, "slow"] += 1
+        # Los cuerpos vacíos se rellenan con espacios (JSON válido) para
+        # que también tarden en llegar
+        body = body or b" " * 64
+        return StreamingResponse(
+            _trickle(body, profile.slow_seconds), status_code=status, media_type="application/json",
+            headers={**(headers or {}), "Content-Length": str(len(body))}
+        )
+    if fault is None:
+        state.stats[route, "ok"] += 1
+    return Response(body, status_code=status, media_type="application/json" if body else None, headers=headers)
+
+
+def _store(events: OrderedDict, event: dict) -> dict:
+    events[event["id"]] = event
+    if len(events) > MAX_STORED_EVENTS:
+        events.popitem(last=False)
+    return event
+
+
+def _not_found(route: str, event_id: str):
+    return _error_body(route, 404, f"No existe el evento {event_id}")
+
+
+# --------------------------------
+# Twilio
+# --------------------------------
+
+async def _twilio_form(request: Request) -> dict:
+    # Twilio envía application/x-www-form-urlencoded
+    return {key: values[0] for key, values in parse_qs((await request.body()).decode()).items()}
+
+
+@app.post("/2010-04-01/Accounts/{account_sid}/Messages.json")
+async def twilio_messages(account_sid: str, request: Request):
+    form = await _twilio_form(request)
+    return await simulate("twilio_messages", 201, {
+        "sid": f"SM{uuid.uuid4().hex}", "account_sid": account_sid, "to": form.get("To"),
+        "from": form.get("From"), "body": form.get("Body"), "status": "queued", "num_segments": "1",
+    })
+
+
+@app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+async def twilio_calls(account_sid: str, request: Request):
+    form = await _twilio_form(request)
+    return await simulate("twilio_calls", 201, {
+        "sid": f"CA{uuid.uuid4().hex}", "account_sid": account_sid, "to": form.get("To"),
+        "from": form.get("From"), "status": "queued",
+    })
+
+
+# --------------------------------
+# Evolution API
+# --------------------------------
+
+@app.post("/message/sendText/{instance}")
+async def evolution_send_text(instance: str, request: Request):
+    payload = await request.json()
+    return await simulate("evolution_send_text", 201, {
+        "key": {"remoteJid": f"{payload.get('number')}@s.whatsapp.net", "fromMe": True, "id": uuid.uuid4().hex},
+        "status": "PENDING",
+    })
+
+
+# --------------------------------
+# Microsoft identity platform y Graph
+# --------------------------------
+
+@app.get("/{tenant}/v2.0/.well-known/openid-configuration")
+async def graph_openid_configuration(tenant: str, request: Request):
+    base = f"{request.base_url}{tenant}"
+    return {
+        "issuer": f"{base}/v2.0",
+        "authorization_endpoint": f"{base}/oauth2/v2.0/authorize",
+        "token_endpoint": f"{base}/oauth2/v2.0/token",
+        "device_authorization_endpoint": f"{base}/oauth2/v2.0/devicecode",
+    }
+
+
+@app.post("/{tenant}/oauth2/v2.0/token")
+async def graph_token(tenant: str):
+    return await simulate("graph_token", 200, {
+        "token_type": "Bearer", "expires_in": 3599, "ext_expires_in": 3599, "access_token": f"sim-{uuid.uuid4().hex}",
+    })
+
+
+@app.post("/v1.0/users/{user}/sendMail")
+async def graph_send_mail(user: str):
+    return await simulate("graph_send_mail", 202)
+
+
+def _graph_event(user: str, payload: dict) -> dict:
+    event_id = uuid.uuid4().hex
+    return {**payload, "id": event_id, "webLink": f"https://outlook.office365.com/owa/?itemid={event_id}",
+            "organizer": {"emailAddress": {"address": user}}}
+
+
+@app.post("/v1.0/users/{user}/events")
+async def graph_create_event(user: str, request: Request):
+    event = _store(state.graph_events, _graph_event(user, await request.json()))
+    return await simulate("graph_events", 201, event)
+
+
+@app.get("/v1.0/users/{user}/events")
+async def graph_list_events(user: str):
+    return await simulate("graph_events", 200, {"value": list(state.graph_events.values())[-100:]})
+
+
+@app.get("/v1.0/users/{user}/events/{event_id}")
+async def graph_get_event(user: str, event_id: str):
+    event = state.graph_events.get(event_id)
+    if event is None:
+        return await simulate("graph_events", 404, _not_found("graph_events", event_id))
+    return await simulate("graph_events", 200, event)
+
+
+@app.patch("/v1.0/users/{user}/events/{event_id}")
+async def graph_update_event(user: str, event_id: str, request: Request):
+    event = state.graph_events.get(event_id)
+    if event is None:
+        return await simulate("graph_events", 404, _not_found("graph_events", event_id))
+    event.update(await request.json())
+    return await simulate("graph_events", 200, event)
+
+
+@app.delete("/v1.0/users/{user}/events/{event_id}")
+async def graph_delete_event(user: str, event_id: str):
+    if state.graph_events.pop(event_id, None) is None:
+        return await simulate("graph_events", 404, _not_found("graph_events", event_id))
+    return await simulate("graph_events", 204)
+
+
+@app.post("/v1.0/users/{user}/events/{event_id}/{action}")
+async def graph_event_action(user: str, event_id: str, action: Literal["send", "cancel", "accept", "decline"]):
+    return await simulate("graph_events", 202)
+
+
+@app.post("/v1.0/users/{user}/calendar/getSchedule")
+async def graph_get_schedule(user: str, request: Request):
+    payload = await request.json()
+    return await simulate("graph_get_schedule", 200, {"value": [
+        {"scheduleId": schedule, "availabilityView": "0" * 8, "scheduleItems": [],
+         "workingHours": {"startTime": "08:00:00.0000000", "endTime": "17:00:00.0000000"}}
+        for schedule in payload.get("schedules", [])
+    ]})
+
+
+def _batch_response(request: dict) -> dict:
+    """Respuesta de una petición de un $batch; los fallos se deciden una a una."""
+    method = request.get("method", "GET").upper()
+    fault = _fault("graph_batch", state.profiles["graph_batch"])
+    if fault is not None:
+        status, headers = fault
+        return {"id": request.get("id"), "status": status, "headers": headers,
+                "body": _error_body("graph_batch", status, "Fallo simulado")}
+    # /users/{user}/events[/{id}[/{acción}]]
+    parts = urlsplit(request.get("url", "")).path.strip("/").split("/")
+    if parts[:1] != ["users"] or len(parts) < 3 or parts[2] != "events":
+        return {"id": request.get("id"), "status": 200 if method == "GET" else 202, "body": {}}
+    if len(parts) == 3:
+        if method == "POST":
+            return {"id": request.get("id"), "status": 201,
+                    "body": _store(state.graph_events, _graph_event(parts[1], request.get("body") or {}))}
+        return {"id": request.get("id"), "status": 200, "body": {"value": list(state.graph_events.values())[-100:]}}
+    event = state.graph_events.get(parts[3])
+    if event is None:
+        return {"id": request.get("id"), "status": 404, "body": _not_found("graph_batch", parts[3])}
+    if len(parts) > 4:
+        return {"id": request.get("id"), "status": 202}
+    if method == "DELETE":
+        del state.graph_events[parts[3]]
+        return {"id": request.get("id"), "status": 204}
+    if method == "PATCH":
+        event.update(request.get("body") or {})
+    return {"id": request.get("id"), "status": 200, "body": event}
+
+
+@app.post("/v1.0/$batch")
+async def graph_batch(request: Request):
+    payload = await request.json()
+    requests = payload.get("requests", [])
+    if len(requests) > 20:
+        return await simulate("graph_batch", 400, {"error": {
+            "code": "BadRequest", "message": "Un $batch admite como máximo 20 peticiones"
+        }})
+    return await simulate("graph_batch", 200, {"responses": [_batch_response(item) for item in requests]})
+
+
+# --------------------------------
+# Google Calendar
+# --------------------------------
+
+@app.post("/google/token")
+async def google_token():
+    return await simulate("google_token", 200, {
+        "access_token": f"sim-{uuid.uuid4().hex}", "expires_in": 3599, "token_type": "Bearer",
+    })
+
+
+def _google_event(calendar_id: str, payload: dict) -> dict:
+    event_id = uuid.uuid4().hex
+    return {**payload, "kind": "calendar#event", "id": event_id, "status": "confirmed",
+            "htmlLink": f"https://www.google.com/calendar/event?eid={event_id}",
+            "organizer": {"email": calendar_id, "self": True}}
+
+
+@app.post("/calendar/v3/calendars/{calendar_id}/events")
+async def google_insert_event(calendar_id: str, request: Request):
+    event = _store(state.google_events, _google_event(calendar_id, await request.json()))
+    return await simulate("google_events", 200, event)
+
+
+@app.get("/calendar/v3/calendars/{calendar_id}/events")
+async def google_list_events(calendar_id: str):
+    return await simulate("google_events", 200, {
+        "kind": "calendar#events", "items": list(state.google_events.values())[-100:],
+    })
+
+
+@app.get("/calendar/v3/calendars/{calendar_id}/events/{event_id}")
+async def google_get_event(calendar_id: str, event_id: str):
+    event = state.google_events.get(event_id)
+    if event is None:
+        return await simulate("google_events", 404, _not_found("google_events", event_id))
+    return await simulate("google_events", 200, event)
+
+
+@app.api_route("/calendar/v3/calendars/{calendar_id}/events/{event_id}", methods=["PUT", "PATCH"])
+async def google_update_event(calendar_id: str, event_id: str, request: Request):
+    event = state.google_events.get(event_id)
+    if event is None:
+        return await simulate("google_events", 404, _not_found("google_events", event_id))
+    payload = await request.json()
+    if request.method == "PUT":
+        event = {key: event[key] for key in ("kind", "id", "htmlLink", "organizer")} | payload
+        state.google_events[event_id] = event
+    else:
+        event.update(payload)
+    return await simulate("google_events", 200, event)
+
+
+@app.delete("/calendar/v3/calendars/{calendar_id}/events/{event_id}")
+async def google_delete_event(calendar_id: str, event_id: str):
+    if state.google_events.pop(event_id, None) is None:
+        return await simulate("google_events", 404, _not_found("google_events", event_id))
+    return await simulate("google_events", 204)
+
+
+# --------------------------------
+# Administración del simulador
+# --------------------------------
+
+@app.get("/_simulator/config")
+async def get_config():
+    return state.config.model_dump()
+
+
+@app.put("/_simulator/config")
+async def put_config(config: SimulatorConfig):
+    try:
+        state.configure(config)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return state.config.model_dump()
+
+
+@app.get("/_simulator/stats")
+async def get_stats():
+    stats: Dict[str, Dict[str, int]] = {}
+    for (route, outcome), count in sorted(state.stats.items()):
+        stats.setdefault(route, {})[outcome] = count
+    return stats
+
+
+@app.post("/_simulator/reset")
+async def reset():
+    """Pone a cero las estadísticas, los eventos guardados y el reloj de las ráfagas de 429."""
+    state.stats.clear()
+    state.graph_events.clear()
+    state.google_events.clear()
+    state.started = time.monotonic()
+    return {"status": "ok"}
+
+
+# --------------------------------
+# Arranque
+# --------------------------------
+
+def write_google_credentials(path: str, token_url: str):
+    """Fichero de cuenta de servicio de Google con una clave RSA nueva, para GOOGLE_CREDENTIALS_JSON."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    Path(path).write_text(json.dumps({
+        "type": "service_account",
+        "project_id": "simulator",
+        "private_key_id": uuid.uuid4().hex,
+        "private_key": pem,
+        "client_email": "simulator@simulator.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": token_url,
+    }, indent=2))
+
+
+def tls_certificate(directory: str, hostnames: List[str]):
+    """Certificado autofirmado para hostnames (se genera la primera vez); devuelve (cert, key)."""
+    import datetime
+    import ipaddress
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    cert_path, key_path = Path(directory) / "cert.pem", Path(directory) / "key.pem"
+    if cert_path.exists() and key_path.exists():
+        return str(cert_path), str(key_path)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostnames[0])])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName(
+            [x509.DNSName(hostname) for hostname in hostnames] + [x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]
+        ), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    return str(cert_path), str(key_path)
+
+
+def load_config(path: Optional[str]) -> SimulatorConfig:
+    if path is None:
+        return SimulatorConfig()
+    config = SimulatorConfig(**json.loads(Path(path).read_text()))
+    config.profiles()
+    return config
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--config", help="JSON con los perfiles de latencia y fallos")
+    parser.add_argument("--seed", type=int, help="Semilla de los sorteos (ejecuciones reproducibles)")
+    parser.add_argument("--tls-port", type=int, default=0,
+                        help="Puerto https adicional (el login de Microsoft con MSAL lo necesita)")
+    parser.add_argument("--tls-dir", default=str(Path(__file__).resolve().parent / "results" / "simulator-tls"),
+                        help="Directorio del certificado autofirmado (se reutiliza si ya existe)")
+    parser.add_argument("--tls-hostnames", default="localhost",
+                        help="Nombres del certificado, separados por comas (p. ej. el del servicio en docker-compose)")
+    parser.add_argument("--write-google-credentials", metavar="PATH",
+                        help="Escribe un JSON de cuenta de servicio falso para GOOGLE_CREDENTIALS_JSON")
+    return parser.parse_args()
+
+
+async def _serve(servers):
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main():
+    args = _parse_args()
+    try:
+        state.configure(load_config(args.config))
+    except (ValueError, ValidationError) as e:
+        sys.exit(f"Configuración inválida: {e}")
+    state.rng.seed(args.seed)
+
+    public_host = "localhost" if args.host in ("0.0.0.0", "::") else args.host
+    if args.write_google_credentials:
+        write_google_credentials(args.write_google_credentials, f"http://{public_host}:{args.port}/google/token")
+        print(f"Credenciales de Google escritas en {args.write_google_credentials}")
+
+    configs = [uvicorn.Config(app, host=args.host, port=args.port, log_level="warning")]
+    if args.tls_port:
+        cert, key = tls_certificate(args.tls_dir, args.tls_hostnames.split(","))
+        configs.append(uvicorn.Config(app, host=args.host, port=args.tls_port, log_level="warning",
+                                      ssl_certfile=cert, ssl_keyfile=key))
+        print(f"https en el puerto {args.tls_port}; confía en el certificado con REQUESTS_CA_BUNDLE={cert}")
+    print(f"Simulador de proveedores en http://{public_host}:{args.port}")
+    asyncio.run(_serve([uvicorn.Server(config) for config in configs]))
+
+
+if __name__ == "__main__":
+    main()
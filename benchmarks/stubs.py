@@ -0,0 +1,60 @@
+import asyncio
+import random
+import time
+
+from services import email_service, google_calendar_service, outlook_calendar_service, twilio_service
+from services.providers import (
+    EVOLUTION_API, GOOGLE_CALENDAR, MICROSOFT_GRAPH, TWILIO_SMS, TWILIO_VOICE,
+    provider_call, provider_call_async
+)
+
+# Proveedores simulados para medir el worker sin salir de la máquina.
+#
+# Sustituyen las funciones de services/* que llama worker.scheduler (y sus
+# versiones asíncronas) por otras que pasan por provider_call como las
+# reales, así el rate limit, los circuit breakers y las métricas funcionan
+# igual, pero en lugar de la petición HTTP esperan la latencia configurada y
+# fallan con la probabilidad error_rate (como un error de conexión).
+
+# (módulo, función síncrona, función asíncrona o None, proveedor)
+STUBBED_FUNCTIONS = [
+    (twilio_service, "send_sms", "send_sms_async", TWILIO_SMS),
+    (twilio_service, "make_call", "make_call_async", TWILIO_VOICE),
+    (twilio_service, "send_whatsapp", "send_whatsapp_async", EVOLUTION_API),
+    (email_service, "send_email", "send_email_async", MICROSOFT_GRAPH),
+    (google_calendar_service, "create_event", None, GOOGLE_CALENDAR),
+    (outlook_calendar_service, "create_outlook_event", "create_outlook_event_async", MICROSOFT_GRAPH),
+]
+
+# Lo que devuelven los proveedores de calendario (el worker lo usa en los correos)
+_RESULT = {"id": "benchmark", "htmlLink": "", "webLink": ""}
+
+
+def _maybe_fail(provider: str, error_rate: float):
+    if error_rate and random.random() < error_rate:
+        raise ConnectionError(f"Error simulado de {provider}")
+
+
+def install(latency_seconds: float, error_rate: float = 0.0):
+    """Sustituye las llamadas a los proveedores por simulaciones."""
+
+    def sync_stub(provider):
+        def stub(*args, **kwargs):
+            with provider_call(provider):
+                time.sleep(latency_seconds)
+                _maybe_fail(provider, error_rate)
+            return _RESULT
+        return stub
+
+    def async_stub(provider):
+        async def stub(*args, **kwargs):
+            async with provider_call_async(provider):
+                await asyncio.sleep(latency_seconds)
+                _maybe_fail(provider, error_rate)
+            return _RESULT
+        return stub
+
+    for module, sync_name, async_name, provider in STUBBED_FUNCTIONS:
+        setattr(module, sync_name, sync_stub(provider))
+        if async_name is not None:
+            setattr(module, async_name, async_stub(provider))